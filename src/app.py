@@ -1,16 +1,70 @@
+"""
+Desktop chat app. Only argument parsing happens before flet and the UI are imported, and
+llama-cpp-python is loaded with the first model, so ``--help`` and ``--profile-imports``
+return at once.
+"""
+
 import argparse
+import multiprocessing
 import os
+import sys
+import threading
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import flet as ft
-
-from config import APP_TITLE, ENV_MODEL
+from config import (
+    APP_TITLE,
+    DEFAULT_EMBED_MODEL,
+    DEFAULT_HISTORY,
+    DEFAULT_METRICS_LOG,
+    DEFAULT_PRELOAD,
+    DEFAULT_RAG_DIR,
+    DEFAULT_RESPONSE_CACHE,
+    ENV_MODEL,
+)
 from core.llm_adapter import LlamaRunner
-from paths import ensure_app_dirs
-from ui.chat import ChatView
+from core.metrics import MetricsLog, MetricsRecorder
+from paths import METRICS_LOG_PATH, ensure_app_dirs
+from storage.history import HistoryStore
+from storage.response_cache import ResponseCache
+from storage.sessions import SessionStore
+from storage.tuning import TuningStore
+
+if TYPE_CHECKING:
+    import flet as ft
+
+    from core.rag import DocumentIndex
+
+
+def open_rag(notify) -> "DocumentIndex | None":
+    """The index of ``LOCALAI_RAG_DIR``, brought up to date on a background thread."""
+    if not DEFAULT_RAG_DIR:
+        return None
+    if not DEFAULT_EMBED_MODEL:
+        notify("LOCALAI_RAG_DIR needs an embedding model in LOCALAI_EMBED_MODEL.")
+        return None
+    from core.rag import DocumentIndex, LlamaEmbedder
+
+    rag = DocumentIndex(DEFAULT_RAG_DIR, LlamaEmbedder(DEFAULT_EMBED_MODEL))
+
+    def refresh() -> None:
+        try:
+            stats = rag.refresh()
+        except Exception as e:
+            notify(f"Indexing {rag.folder} failed ({e.__class__.__name__}): {e}")
+        else:
+            if stats.added or stats.updated or stats.removed:
+                notify(f"Indexed {rag.folder}: {stats.summary()}")
+
+    threading.Thread(target=refresh, name="localai-rag-index", daemon=True).start()
+    return rag
+
+
+def main(page: "ft.Page", model_path: Path | None, preload: bool = DEFAULT_PRELOAD) -> None:
+    import flet as ft
 
+    from ui.chat import ChatView
 
-def main(page: ft.Page, model_path: Path | None) -> None:
     ensure_app_dirs()
     page.title = APP_TITLE
     page.window_width = 900
@@ -23,8 +77,27 @@ def main(page: ft.Page, model_path: Path | None) -> None:
         page.snack_bar.open = True
         page.update()
 
-    llm = LlamaRunner()
-    chat = ChatView(page, llm, notify, model_path)
+    llm = LlamaRunner(
+        cache=ResponseCache() if DEFAULT_RESPONSE_CACHE else None,
+        metrics=MetricsRecorder(MetricsLog(METRICS_LOG_PATH) if DEFAULT_METRICS_LOG else None),
+        tuning=TuningStore(),
+        rag=open_rag(notify),
+    )
+    history = HistoryStore() if DEFAULT_HISTORY else None
+    chat = ChatView(page, llm, notify, model_path, sessions=SessionStore(), history=history)
+
+    # snapshot the KV cache on exit so reopening the chat skips the prefill
+    def on_window_event(e: ft.WindowEvent) -> None:
+        if e.data == "close":
+            try:
+                chat.save_session()
+            finally:
+                if history is not None:
+                    history.close()  # commits the last queued messages
+                page.window.destroy()
+
+    page.window.prevent_close = True
+    page.window.on_event = on_window_event
 
     page.add(
         ft.Column(
@@ -35,19 +108,44 @@ def main(page: ft.Page, model_path: Path | None) -> None:
         )
     )
 
+    # start the GGUF load while the user is still typing
+    if preload:
+        chat.preload()
+
 
 if __name__ == "__main__":
+    # the inference worker (LOCALAI_INFERENCE=process) re-runs a frozen app's executable
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--model",
         help="Path to GGUF model file",
         default=os.environ.get(ENV_MODEL),
     )
+    parser.add_argument(
+        "--preload",
+        action=argparse.BooleanOptionalAction,
+        default=DEFAULT_PRELOAD,
+        help="Load the model in the background as soon as the window opens",
+    )
+    parser.add_argument(
+        "--profile-imports",
+        action="store_true",
+        help="Print a per-module breakdown of the app's startup imports and exit",
+    )
     args = parser.parse_args()
+    if args.profile_imports:
+        from bench.imports import report
+
+        # what opening the window and loading the first model import, each from cold
+        print("\n\n".join(report(m) for m in ("app", "ui.chat", "llama_cpp")))
+        sys.exit(0)
     model = Path(args.model).expanduser() if args.model else None
 
+    import flet as ft
+
     def _main(page: ft.Page) -> None:
-        main(page, model)
+        main(page, model, args.preload)
 
     # assets_dir ensures your bundled model (src/assets/...) is available when packaged
     ft.app(target=_main, assets_dir="src/assets")
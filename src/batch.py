@@ -0,0 +1,218 @@
+"""
+Headless batch inference: run every prompt of a JSONL file through ``LlamaRunner``.
+
+Each input line is an object with ``prompt`` and optionally ``id``, ``system``,
+``temperature``, ``max_tokens`` and ``seed``. Results are appended to a JSONL file under
+``OUTPUTS_DIR`` as they complete, so a re-run after a crash skips everything already
+done. Deliberately does not import flet.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from config import (
+    DEFAULT_CTX_SIZE,
+    DEFAULT_DRAFT_MODEL,
+    DEFAULT_DRAFT_TOKENS,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_METRICS_LOG,
+    DEFAULT_RESPONSE_CACHE,
+    DEFAULT_SPECULATIVE,
+    DEFAULT_TEMPERATURE,
+    ENV_MODEL,
+)
+from core.llm_adapter import LlamaRunner
+from core.metrics import MetricsLog, MetricsRecorder
+from core.speculative import MODES, SpeculativeConfig
+from paths import LLM_MODELS_DIR, METRICS_LOG_PATH, OUTPUTS_DIR, ensure_app_dirs
+from storage.model_index import find_model
+from storage.response_cache import ResponseCache
+from storage.tuning import TuningStore
+
+
+@dataclass
+class BatchStats:
+    prompts: int = 0
+    skipped: int = 0
+    errors: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+
+    @property
+    def prompts_per_s(self) -> float:
+        return self.prompts / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.prompts} prompts ({self.skipped} already done, {self.errors} errors) "
+            f"in {self.seconds:.1f}s: {self.prompts_per_s:.2f} prompts/s, "
+            f"{self.tokens_per_s:.1f} tokens/s"
+        )
+
+
+def default_output_path(input_path: Path) -> Path:
+    return OUTPUTS_DIR / f"{input_path.stem}.results.jsonl"
+
+
+def read_prompts(path: Path) -> Iterator[tuple[str, dict]]:
+    """Yield ``(record id, record)``; the id defaults to the 1-based line number."""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            yield str(rec.get("id", lineno)), rec
+
+
+def completed_ids(path: Path) -> set[str]:
+    """
+    Ids already written to ``path``. A torn last line (crash mid-write) is truncated
+    away so the resumed run appends cleanly.
+    """
+    done: set[str] = set()
+    if not path.exists():
+        return done
+    good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                break
+            good += len(line)
+    if good != path.stat().st_size:
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    return done
+
+
+def run_batch(
+    runner: LlamaRunner,
+    input_path: Path,
+    output_path: Path,
+    system_prompt: str = "",
+    temperature: float = DEFAULT_TEMPERATURE,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    seed: int | None = None,
+    log=None,
+) -> BatchStats:
+    stats = BatchStats()
+    done = completed_ids(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out:
+        for rec_id, rec in read_prompts(input_path):
+            if rec_id in done:
+                stats.skipped += 1
+                continue
+            n_tokens = 0
+
+            def count(_delta: str) -> None:
+                nonlocal n_tokens
+                n_tokens += 1  # llama.cpp streams one token per chunk
+
+            t0 = time.perf_counter()
+            result = {"id": rec_id}
+            try:
+                result["output"] = runner.chat(
+                    rec.get("system", system_prompt),
+                    rec["prompt"],
+                    temperature=rec.get("temperature", temperature),
+                    max_tokens=rec.get("max_tokens", max_tokens),
+                    on_delta=count,
+                    seed=rec.get("seed", seed),
+                )
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                stats.errors += 1
+            result["tokens"] = n_tokens
+            result["seconds"] = round(time.perf_counter() - t0, 4)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            stats.prompts += 1
+            stats.tokens += n_tokens
+            stats.seconds = time.perf_counter() - started
+            if log is not None:
+                log(f"[{rec_id}] {n_tokens} tokens in {result['seconds']:.2f}s")
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts headlessly.")
+    parser.add_argument("input", type=Path, help="JSONL file with one {'prompt': ...} per line")
+    parser.add_argument("--model", default=os.environ.get(ENV_MODEL), help="GGUF model path")
+    parser.add_argument("--output", type=Path, help="Results JSONL (default: OUTPUTS_DIR)")
+    parser.add_argument("--system", default="", help="Default system prompt")
+    parser.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE)
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--ctx", type=int, default=DEFAULT_CTX_SIZE)
+    parser.add_argument("--seed", type=int, help="Sampling seed (makes replies cacheable)")
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=DEFAULT_RESPONSE_CACHE,
+        help="Replay replies to prompts that were already answered",
+    )
+    parser.add_argument("--speculative", choices=MODES, default=DEFAULT_SPECULATIVE)
+    parser.add_argument("--draft-model", default=DEFAULT_DRAFT_MODEL, help="Draft GGUF path")
+    parser.add_argument("--draft-tokens", type=int, default=DEFAULT_DRAFT_TOKENS)
+    parser.add_argument("--stats-json", action="store_true", help="Print stats as JSON")
+    args = parser.parse_args(argv)
+    try:
+        speculative = SpeculativeConfig(args.speculative, args.draft_model, args.draft_tokens)
+    except ValueError as e:
+        parser.error(str(e))
+
+    ensure_app_dirs()
+    model = find_model(args.model)
+    if model is None:
+        print(f"No GGUF models found in: {LLM_MODELS_DIR}", file=sys.stderr)
+        return 2
+    runner = LlamaRunner(
+        cache=ResponseCache() if args.cache else None,
+        metrics=MetricsRecorder(MetricsLog(METRICS_LOG_PATH) if DEFAULT_METRICS_LOG else None),
+        tuning=TuningStore(),
+    )
+    runner.load(str(model), n_ctx=args.ctx, speculative=speculative)
+
+    output = args.output or default_output_path(args.input)
+    stats = run_batch(
+        runner,
+        args.input,
+        output,
+        system_prompt=args.system,
+        temperature=args.temperature,
+        max_tokens=args.max_tokens,
+        seed=args.seed,
+        log=lambda msg: print(msg, file=sys.stderr),
+    )
+    print(f"Results: {output}", file=sys.stderr)
+    if runner.cache is not None:
+        print(f"Response cache: {runner.cache.stats()}", file=sys.stderr)
+    if runner.speculative_stats() is not None:
+        print(f"Speculative decoding: {runner.speculative_stats()}", file=sys.stderr)
+    if args.stats_json:
+        stats_dict = asdict(stats)
+        stats_dict.update(prompts_per_s=stats.prompts_per_s, tokens_per_s=stats.tokens_per_s)
+        print(json.dumps(stats_dict))
+    else:
+        print(stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Benchmark ``LlamaRunner``: load time, time to first token, inter-token latency
+percentiles, decode tokens/s, cancel latency and peak RSS, written as JSON.
+
+    PYTHONPATH=src python -m bench --model /path/to/model.gguf
+    PYTHONPATH=src python -m bench --fake --decode-ms 20
+    PYTHONPATH=src python -m bench --calibrate --model /path/to/model.gguf
+    PYTHONPATH=src python -m bench --imports
+
+Without ``--model`` (or ``LOCALAI_MODEL``) the best model under ``LLM_MODELS_DIR`` is
+used; with ``--fake``, or when there is none, a fake model with the given latencies.
+``--calibrate`` instead searches thread counts and batch sizes for the model on this
+machine and saves the fastest for later loads. ``--imports`` reports how long a cold
+import of each entry point takes, module by module.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from bench.fake import FakeLatency, FakeRunner
+from bench.imports import STARTUP_MODULES, report
+from bench.measure import DEFAULT_PROMPTS, environment, fresh_runner, run_bench
+from config import DEFAULT_CTX_SIZE, ENV_MODEL
+from core.llm_adapter import LlamaRunner
+from paths import OUTPUTS_DIR, ensure_app_dirs
+from storage.model_index import find_model
+from storage.tuning import TuningStore
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=os.environ.get(ENV_MODEL), help="GGUF model path")
+    parser.add_argument("--fake", action="store_true", help="Use the fake model")
+    parser.add_argument("--ctx", type=int, default=DEFAULT_CTX_SIZE)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each prompt")
+    parser.add_argument("--prompts", type=Path, help="Text file with one prompt per line")
+    parser.add_argument("--load-ms", type=float, default=200, help="Fake model load time")
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="Fake ms per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=20, help="Fake ms per new token")
+    parser.add_argument("--output", type=Path, help="JSON file (default: OUTPUTS_DIR)")
+    parser.add_argument(
+        "--calibrate", action="store_true", help="Tune threads and batch size for the model"
+    )
+    parser.add_argument(
+        "--imports", action="store_true", help="Profile cold import time of each entry point"
+    )
+    args = parser.parse_args(argv)
+    if args.imports:
+        print("\n\n".join(report(m) for m in STARTUP_MODULES))
+        return 0
+
+    prompts = DEFAULT_PROMPTS
+    if args.prompts:
+        lines = args.prompts.read_text(encoding="utf-8").splitlines()
+        prompts = tuple(line for line in lines if line.strip())
+        if not prompts:
+            parser.error(f"no prompts in {args.prompts}")
+
+    ensure_app_dirs()
+    model = None if args.fake else find_model(args.model)
+    if model is not None and not model.exists():
+        print(f"Model not found: {model}", file=sys.stderr)
+        return 2
+    if args.calibrate:
+        if model is None or not LlamaRunner().is_available():
+            parser.error("--calibrate needs a GGUF model and llama-cpp-python")
+        result = LlamaRunner(tuning=TuningStore()).calibrate(
+            str(model), log=lambda msg: print(msg, file=sys.stderr)
+        )
+        print(json.dumps(asdict(result)))
+        return 0
+    if model is None or not LlamaRunner().is_available():
+        latency = FakeLatency(args.load_ms / 1000, args.prefill_ms / 1000, args.decode_ms / 1000)
+        print(f"Using the fake model ({latency})", file=sys.stderr)
+        with tempfile.NamedTemporaryFile(suffix=".gguf") as f:
+            result = run_bench(
+                fresh_runner(FakeRunner, latency=latency),
+                f.name,
+                args.ctx,
+                prompts,
+                args.repeat,
+                args.max_tokens,
+            )
+        result["model"] = "fake"
+        result["fake_latency"] = vars(latency)
+    else:
+        runner = fresh_runner(tuning=TuningStore())
+        result = run_bench(runner, model, args.ctx, prompts, args.repeat, args.max_tokens)
+    result["environment"] = environment()
+
+    output = args.output or OUTPUTS_DIR / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"Results: {output}", file=sys.stderr)
+    extra = {"load_s": result["load_s"], "cancel_ms": result["cancel_ms"]}
+    print(json.dumps(result["summary"] | extra))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
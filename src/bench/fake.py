@@ -0,0 +1,105 @@
+import functools
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from core.llm_adapter import LlamaRunner
+
+
+@dataclass(frozen=True)
+class FakeLatency:
+    """Simulated costs, in seconds, of a model that is not really there."""
+
+    load_s: float = 0.2
+    prefill_s_per_token: float = 0.0005
+    decode_s_per_token: float = 0.02
+
+
+DEFAULT_LATENCY = FakeLatency()
+
+
+class FakeLlama:
+    """
+    Stand-in for ``llama_cpp.Llama`` that sleeps like a model: ``load_s`` on
+    construction, ``prefill_s_per_token`` for every prompt token not already in its
+    (simulated) KV cache, then ``decode_s_per_token`` per streamed token. Tokens are
+    bytes, and the reply cycles through ``text`` one word per token. ``eval`` and
+    ``n_tokens`` behave like ``Llama``'s, so the runner's chunked prefill (and its cancel
+    checks) run against it too.
+    """
+
+    text = "The quick brown fox jumps over the lazy dog."
+    n_batch = 512
+
+    def __init__(self, *, model_path, n_ctx, latency: FakeLatency = DEFAULT_LATENCY, **kw) -> None:
+        self.model_path = model_path
+        self._n_ctx = int(n_ctx)
+        self.latency = latency
+        self.evaluated: list[int] = []
+        time.sleep(latency.load_s)
+
+    def n_ctx(self) -> int:
+        return self._n_ctx
+
+    @property
+    def input_ids(self) -> list[int]:
+        return self.evaluated
+
+    @property
+    def n_tokens(self) -> int:
+        return len(self.evaluated)
+
+    @n_tokens.setter
+    def n_tokens(self, n: int) -> None:
+        del self.evaluated[n:]
+
+    def eval(self, tokens: list[int]) -> None:
+        time.sleep(len(tokens) * self.latency.prefill_s_per_token)
+        self.evaluated += list(tokens)
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> list[int]:
+        return ([1] if add_bos else []) + list(text)
+
+    def _words(self) -> Iterator[str]:
+        words = self.text.split(" ")
+        i = 0
+        while True:
+            yield (" " if i else "") + words[i % len(words)]
+            i += 1
+
+    def create_completion(self, *, prompt, stream, max_tokens, **kw):
+        tokens = prompt if isinstance(prompt, list) else self.tokenize(prompt.encode("utf-8"))
+        common = 0
+        for a, b in zip(tokens, self.evaluated, strict=False):
+            if a != b:
+                break
+            common += 1
+        time.sleep((len(tokens) - common) * self.latency.prefill_s_per_token)
+        self.evaluated = list(tokens)
+        chunks = self._stream(max_tokens, kw.get("stopping_criteria"))
+        if stream:
+            return chunks
+        return {"choices": [{"text": "".join(c["choices"][0]["text"] for c in chunks)}]}
+
+    def _stream(self, max_tokens: int, stopping_criteria=None) -> Iterator[dict]:
+        for _, word in zip(range(max_tokens), self._words(), strict=False):
+            time.sleep(self.latency.decode_s_per_token)
+            self.evaluated += list(word.encode("utf-8"))
+            if stopping_criteria is not None and stopping_criteria(self.evaluated, None):
+                return
+            yield {"choices": [{"text": word, "finish_reason": None}]}
+
+
+class FakeRunner(LlamaRunner):
+    """``LlamaRunner`` backed by ``FakeLlama``; any existing path works as the model."""
+
+    def __init__(self, latency: FakeLatency = DEFAULT_LATENCY, **kw) -> None:
+        super().__init__(**kw)
+        self.latency = latency
+
+    def is_available(self) -> bool:
+        return True
+
+    def _llama_factory(self, p: Path, n_ctx: int, spec, params, memory) -> Callable[[], FakeLlama]:
+        return functools.partial(FakeLlama, model_path=str(p), n_ctx=n_ctx, latency=self.latency)
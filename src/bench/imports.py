@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+# what a cold start of each entry point imports before doing any work
+STARTUP_MODULES = ("app", "batch", "server", "ui.chat", "core.llm_adapter")
+# native or large packages that must only be imported when they are actually used
+HEAVY_MODULES = ("llama_cpp", "flet")
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_s: float
+    cumulative_s: float
+    depth: int  # 0 for the imported module itself, 1 for its imports, ...
+
+
+def import_times(module: str, python: str = sys.executable) -> list[ImportTime]:
+    """
+    Import ``module`` in a fresh interpreter under ``python -X importtime`` and return
+    one entry per module it loaded, in load order. Raises ``ImportError`` if it fails.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(SRC_DIR), env.get("PYTHONPATH")) if p)
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if proc.returncode != 0:
+        last = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+        raise ImportError(f"import {module} failed: {last}")
+    times = []
+    for line in proc.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append(ImportTime(name.strip(), int(own) / 1e6, int(cumulative) / 1e6, depth))
+    return times
+
+
+def cold_import_s(times: list[ImportTime], module: str) -> float:
+    """Cumulative time of ``module`` itself (site and interpreter startup excluded)."""
+    return next(t.cumulative_s for t in reversed(times) if t.module == module)
+
+
+def report(module: str, top: int = 15, python: str = sys.executable) -> str:
+    """A per-module breakdown of importing ``module``, slowest first by own time."""
+    try:
+        times = import_times(module, python)
+    except ImportError as e:
+        return str(e)
+    total = cold_import_s(times, module)
+    lines = [f"import {module}: {total * 1000:.1f} ms"]
+    heavy = sorted({t.module.split(".")[0] for t in times} & set(HEAVY_MODULES))
+    if heavy:
+        lines.append(f"  heavy modules loaded: {', '.join(heavy)}")
+    for t in sorted(times, key=lambda t: t.self_s, reverse=True)[:top]:
+        lines.append(
+            f"  {t.self_s * 1000:8.1f} ms self {t.cumulative_s * 1000:8.1f} ms  {t.module}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,206 @@
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from core.llm_adapter import LlamaRunner
+from core.model_pool import ModelPool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# a summarisation-style prompt (long input, short reply) and a chat-style one
+DEFAULT_PROMPTS = (
+    "Summarize in one sentence: " + "The meeting covered budgets, hiring and the roadmap. " * 20,
+    "Write a short poem about the sea.",
+)
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Linear-interpolated ``q``-th percentile (0-100); None for no values."""
+    if not values:
+        return None
+    s = sorted(values)
+    k = (len(s) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def peak_rss_bytes() -> int | None:
+    """Peak resident set size of this process so far (None where unsupported)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux reports KiB
+
+
+@dataclass
+class RequestTiming:
+    prompt_chars: int
+    tokens: int = 0
+    ttft_s: float | None = None
+    total_s: float = 0.0
+    itl_s: list[float] = field(default_factory=list)
+
+    @property
+    def decode_tokens_per_s(self) -> float | None:
+        # tokens after the first, over the time spent producing them
+        decode_s = sum(self.itl_s)
+        return (self.tokens - 1) / decode_s if self.tokens > 1 and decode_s > 0 else None
+
+
+def time_request(
+    runner: LlamaRunner, prompt: str, max_tokens: int, temperature: float, seed: int
+) -> RequestTiming:
+    """Run one chat completion, timing each streamed token (a delta is one token)."""
+    timing = RequestTiming(prompt_chars=len(prompt))
+    started = last = time.perf_counter()
+
+    def on_delta(_delta: str) -> None:
+        nonlocal last
+        now = time.perf_counter()
+        if timing.ttft_s is None:
+            timing.ttft_s = now - started
+        else:
+            timing.itl_s.append(now - last)
+        last = now
+        timing.tokens += 1
+
+    runner.chat("", prompt, temperature, max_tokens, on_delta=on_delta, seed=seed)
+    timing.total_s = time.perf_counter() - started
+    return timing
+
+
+def time_cancel(
+    runner: LlamaRunner, prompt: str, max_tokens: int, after_first_token: bool, delay_s: float
+) -> float:
+    """
+    Seconds from setting cancel until the generation thread has stopped. The cancel
+    comes ``delay_s`` after the start (so during the prefill of a long ``prompt``), or
+    ``delay_s`` after the first token with ``after_first_token``.
+    """
+    q, cancel, thread = runner.stream_chat("", prompt, 0.0, max_tokens)
+    if after_first_token:
+        q.get()
+    time.sleep(delay_s)
+    started = time.perf_counter()
+    cancel.set()
+    thread.join()
+    return time.perf_counter() - started
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def summarize(timings: list[RequestTiming]) -> dict:
+    ttft = [t.ttft_s for t in timings if t.ttft_s is not None]
+    itl = [x for t in timings for x in t.itl_s]
+    tokens = sum(max(t.tokens - 1, 0) for t in timings)
+    decode_s = sum(itl)
+    return {
+        "requests": len(timings),
+        "tokens": sum(t.tokens for t in timings),
+        "ttft_ms": {f"p{q}": _ms(percentile(ttft, q)) for q in (50, 95)},
+        "itl_ms": {f"p{q}": _ms(percentile(itl, q)) for q in (50, 90, 99)},
+        "decode_tokens_per_s": tokens / decode_s if decode_s > 0 else None,
+    }
+
+
+def environment() -> dict:
+    """Where a result came from, so runs can be compared across commits and machines."""
+    commit = None
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+        commit = out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_bench(
+    runner: LlamaRunner,
+    model_path: str | Path,
+    n_ctx: int,
+    prompts: list[str] | tuple[str, ...] = DEFAULT_PROMPTS,
+    repeat: int = 3,
+    max_tokens: int = 64,
+    temperature: float = 0.0,
+    seed: int = 0,
+    warmup: bool = True,
+) -> dict:
+    """
+    Load ``model_path`` into ``runner`` (timed) and run every prompt ``repeat`` times.
+    The runner should use an empty pool and no response cache, or the load and the
+    replies are not really measured. A warmup request, not counted, runs first. Each
+    request gets a unique prefix so llama.cpp cannot reuse the previous one's KV cache
+    and every TTFT includes a full prefill. Then ``repeat`` requests each are cancelled
+    during prefill and during decoding, timing how long the cancel takes to land.
+    """
+    started = time.perf_counter()
+    runner.load(str(model_path), n_ctx=n_ctx)
+    load_s = time.perf_counter() - started
+    if warmup:
+        time_request(runner, prompts[0], 1, temperature, seed)
+    timings = [
+        time_request(runner, f"({i}) {p}", max_tokens, temperature, seed)
+        for i in range(repeat)
+        for p in prompts
+    ]
+    # cancel 20 ms into the prefill of the longest prompt, and 20 ms into decoding
+    longest = max(prompts, key=len)
+    cancel_s = {
+        phase: [
+            time_cancel(runner, f"(cancel {phase} {i}) {longest}", max_tokens, decode, 0.02)
+            for i in range(repeat)
+        ]
+        for phase, decode in (("prefill", False), ("decode", True))
+    }
+    return {
+        "model": str(model_path),
+        "n_ctx": n_ctx,
+        "max_tokens": max_tokens,
+        "load_s": round(load_s, 4),
+        "tuning": runner.tuning_params.llama_kwargs() if runner.tuning_params else None,
+        "summary": summarize(timings),
+        "cancel_ms": {
+            phase: {"p50": _ms(percentile(v, 50)), "max": _ms(max(v, default=None))}
+            for phase, v in cancel_s.items()
+        },
+        "peak_rss_bytes": peak_rss_bytes(),
+        "requests": [
+            {
+                "prompt_chars": t.prompt_chars,
+                "tokens": t.tokens,
+                "ttft_ms": _ms(t.ttft_s),
+                "total_s": round(t.total_s, 4),
+                "decode_tokens_per_s": t.decode_tokens_per_s,
+            }
+            for t in timings
+        ],
+    }
+
+
+def fresh_runner(runner_cls: type[LlamaRunner] = LlamaRunner, **kw) -> LlamaRunner:
+    """A runner that keeps nothing from earlier loads, so load time is real."""
+    return runner_cls(pool=ModelPool(budget_bytes=0), **kw)
@@ -10,6 +10,59 @@ DEFAULT_APP_DIR = Path.home() / "LocalAI"
 DEFAULT_TEMPERATURE = float(os.getenv("LOCALAI_TEMPERATURE", "0.7"))
 DEFAULT_MAX_TOKENS = int(os.getenv("LOCALAI_MAX_TOKENS", "512"))
 DEFAULT_CTX_SIZE = int(os.getenv("LOCALAI_CTX_SIZE", "4096"))
+# 0 = automatic (calibrated per model and CPU, else derived from the CPU topology)
+DEFAULT_THREADS = int(os.getenv("LOCALAI_THREADS", "0"))
+DEFAULT_THREADS_BATCH = int(os.getenv("LOCALAI_THREADS_BATCH", "0"))
+DEFAULT_BATCH_SIZE = int(os.getenv("LOCALAI_BATCH_SIZE", "0"))
+DEFAULT_POOL_BUDGET_MB = int(os.getenv("LOCALAI_POOL_BUDGET_MB", "0"))
+DEFAULT_SESSION_BUDGET_MB = int(os.getenv("LOCALAI_SESSION_BUDGET_MB", "2048"))
+DEFAULT_QUEUE_SIZE = int(os.getenv("LOCALAI_QUEUE_SIZE", "8"))
+DEFAULT_SEND_POLICY = os.getenv("LOCALAI_SEND_POLICY", "queue")  # "queue" or "cancel"
+DEFAULT_UI_FPS = float(os.getenv("LOCALAI_UI_FPS", "30"))
+DEFAULT_TRANSCRIPT_WINDOW = int(os.getenv("LOCALAI_TRANSCRIPT_WINDOW", "60"))
+DEFAULT_PRELOAD = os.getenv("LOCALAI_PRELOAD", "1").lower() not in ("0", "false", "no")
+# every chat message goes to a SQLite database; writes are committed in batches this far apart
+DEFAULT_HISTORY = os.getenv("LOCALAI_HISTORY", "1").lower() not in ("0", "false", "no")
+DEFAULT_HISTORY_FLUSH_MS = float(os.getenv("LOCALAI_HISTORY_FLUSH_MS", "200"))
+DEFAULT_SESSION_IDLE_SECS = float(os.getenv("LOCALAI_SESSION_IDLE_SECS", "60"))
+DEFAULT_SERVER_HOST = os.getenv("LOCALAI_SERVER_HOST", "127.0.0.1")
+DEFAULT_SERVER_PORT = int(os.getenv("LOCALAI_SERVER_PORT", "8080"))
+DEFAULT_SERVER_QUEUE_SIZE = int(os.getenv("LOCALAI_SERVER_QUEUE_SIZE", "64"))
+DEFAULT_SERVER_PARALLEL = int(os.getenv("LOCALAI_SERVER_PARALLEL", "1"))
+DEFAULT_RESPONSE_CACHE = os.getenv("LOCALAI_RESPONSE_CACHE", "0").lower() in ("1", "true", "yes")
+DEFAULT_RESPONSE_CACHE_ENTRIES = int(os.getenv("LOCALAI_RESPONSE_CACHE_ENTRIES", "256"))
+DEFAULT_RESPONSE_CACHE_MB = int(os.getenv("LOCALAI_RESPONSE_CACHE_MB", "256"))
+DEFAULT_CONTEXT_POLICY = os.getenv("LOCALAI_CONTEXT_POLICY", "pin_system")
+DEFAULT_CONTEXT_TRIM = float(os.getenv("LOCALAI_CONTEXT_TRIM", "0.25"))
+# speculative decoding: "off", "lookup" (prompt n-grams) or "draft" (small GGUF)
+DEFAULT_SPECULATIVE = os.getenv("LOCALAI_SPECULATIVE", "off")
+DEFAULT_DRAFT_MODEL = os.getenv("LOCALAI_DRAFT_MODEL") or None
+DEFAULT_DRAFT_TOKENS = int(os.getenv("LOCALAI_DRAFT_TOKENS", "2"))
+DEFAULT_METRICS_LOG = os.getenv("LOCALAI_METRICS_LOG", "1").lower() not in ("0", "false", "no")
+DEFAULT_METRICS_LOG_MB = float(os.getenv("LOCALAI_METRICS_LOG_MB", "4"))
+# memory: KV cache types are "f16", "q8_0" or "q4_0" (quantized V needs flash attention)
+DEFAULT_USE_MMAP = os.getenv("LOCALAI_USE_MMAP", "1").lower() not in ("0", "false", "no")
+DEFAULT_USE_MLOCK = os.getenv("LOCALAI_USE_MLOCK", "0").lower() in ("1", "true", "yes")
+DEFAULT_KV_TYPE_K = os.getenv("LOCALAI_KV_TYPE_K", "f16")
+DEFAULT_KV_TYPE_V = os.getenv("LOCALAI_KV_TYPE_V", "f16")
+DEFAULT_FLASH_ATTN = os.getenv("LOCALAI_FLASH_ATTN", "0").lower() in ("1", "true", "yes")
+# quantize the KV cache, then shrink ctx, when a model would not fit in available RAM
+DEFAULT_FIT_MEMORY = os.getenv("LOCALAI_FIT_MEMORY", "1").lower() not in ("0", "false", "no")
+DEFAULT_MEMORY_HEADROOM_MB = int(os.getenv("LOCALAI_MEMORY_HEADROOM_MB", "512"))
+# "thread" runs llama.cpp in this process; "process" in a worker that restarts on crashes
+DEFAULT_INFERENCE = os.getenv("LOCALAI_INFERENCE", "thread")
+# retrieval: ground chat replies in the text files of a folder, embedded with a GGUF model
+DEFAULT_RAG_DIR = os.getenv("LOCALAI_RAG_DIR") or None
+DEFAULT_EMBED_MODEL = os.getenv("LOCALAI_EMBED_MODEL") or None
+DEFAULT_RAG_TOP_K = int(os.getenv("LOCALAI_RAG_TOP_K", "4"))
+DEFAULT_RAG_MIN_SCORE = float(os.getenv("LOCALAI_RAG_MIN_SCORE", "0.2"))
+DEFAULT_RAG_CHUNK_CHARS = int(os.getenv("LOCALAI_RAG_CHUNK_CHARS", "1200"))
+DEFAULT_RAG_CHUNK_OVERLAP = int(os.getenv("LOCALAI_RAG_CHUNK_OVERLAP", "200"))
+DEFAULT_RAG_EMBED_BATCH = int(os.getenv("LOCALAI_RAG_EMBED_BATCH", "64"))
+# embeddings kept per loaded embedding model (``LlamaRunner.embed``)
+DEFAULT_EMBED_CACHE_ENTRIES = int(os.getenv("LOCALAI_EMBED_CACHE_ENTRIES", "8192"))
+# replies sampled above this temperature are only cached when a seed pins them down
+DEFAULT_RESPONSE_CACHE_MAX_TEMP = float(os.getenv("LOCALAI_RESPONSE_CACHE_MAX_TEMP", "0.3"))
 
 
 @dataclass(frozen=True)
@@ -17,3 +70,12 @@ class LLMDefaults:
     temperature: float = DEFAULT_TEMPERATURE
     max_tokens: int = DEFAULT_MAX_TOKENS
     ctx_size: int = DEFAULT_CTX_SIZE
+    speculative: str = DEFAULT_SPECULATIVE
+    draft_model: str | None = DEFAULT_DRAFT_MODEL
+    draft_tokens: int = DEFAULT_DRAFT_TOKENS
+    use_mmap: bool = DEFAULT_USE_MMAP
+    use_mlock: bool = DEFAULT_USE_MLOCK
+    kv_type_k: str = DEFAULT_KV_TYPE_K
+    kv_type_v: str = DEFAULT_KV_TYPE_V
+    flash_attn: bool = DEFAULT_FLASH_ATTN
+    fit_memory: bool = DEFAULT_FIT_MEMORY
@@ -0,0 +1,418 @@
+import codecs
+import threading
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Protocol
+
+import numpy as np
+
+from config import DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE
+from core.streaming import TokenStream
+
+DoneFn = Callable[[str, BaseException | None], None]
+
+
+@dataclass(frozen=True)
+class SamplingParams:
+    temperature: float = DEFAULT_TEMPERATURE
+    top_p: float = 0.9
+    top_k: int = 40
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    stop: tuple[str, ...] = ()
+    seed: int | None = None
+
+
+@dataclass
+class BatchEntry:
+    """Tokens of one sequence in a decode call, starting at KV position ``pos``."""
+
+    seq_id: int
+    tokens: list[int]
+    pos: int
+    logits: bool  # want logits for the last token
+
+
+class BatchBackend(Protocol):
+    n_seq_max: int  # sequences that can share the KV cache
+    n_batch: int  # max tokens per decode call
+    n_ctx: int  # max positions per sequence
+
+    def tokenize(self, text: str) -> list[int]: ...
+
+    def token_bytes(self, token: int) -> bytes: ...
+
+    def is_eog(self, token: int) -> bool: ...
+
+    def decode(self, entries: list[BatchEntry]) -> dict[int, np.ndarray]:
+        """Evaluate all entries in one call; logits per seq_id for entries that want them."""
+        ...
+
+    def clear_seq(self, seq_id: int) -> None: ...
+
+
+def sample_token(logits: np.ndarray, params: SamplingParams, rng: np.random.Generator) -> int:
+    if params.temperature <= 0:
+        return int(np.argmax(logits))
+    k = min(params.top_k, logits.shape[0]) if params.top_k > 0 else logits.shape[0]
+    cand = np.argpartition(-logits, k - 1)[:k] if k < logits.shape[0] else np.arange(k)
+    z = logits[cand].astype(np.float64) / params.temperature
+    order = np.argsort(-z)
+    cand, z = cand[order], z[order]
+    p = np.exp(z - z[0])
+    p /= p.sum()
+    if params.top_p < 1.0:
+        cut = int(np.searchsorted(np.cumsum(p), params.top_p)) + 1
+        cand, p = cand[:cut], p[:cut] / p[:cut].sum()
+    return int(rng.choice(cand, p=p))
+
+
+class BatchRequest:
+    """Handle for one submitted sequence; ``cancel()`` drops it at the next decode step."""
+
+    def __init__(
+        self,
+        prompt: str | list[int],
+        params: SamplingParams,
+        emit: Callable[[str], None],
+        on_done: DoneFn | None,
+        cancel: threading.Event | None,
+    ) -> None:
+        self.prompt = prompt
+        self.params = params
+        self.emit = emit
+        self.on_done = on_done
+        self.cancel_event = cancel or threading.Event()
+        self.finish_reason: str | None = None
+        self.generated = 0
+        # engine-side state
+        self.seq_id = -1
+        self.n_past = 0
+        self.pending: list[int] = []  # prompt tokens not yet evaluated
+        self.next_token: int | None = None  # sampled, not yet evaluated
+        self.held = ""  # text that might be the start of a stop string
+        self.rng = np.random.default_rng(params.seed)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    @property
+    def done(self) -> bool:
+        return self.finish_reason is not None
+
+
+@dataclass
+class BatchStats:
+    steps: int = 0
+    tokens_in: int = 0  # tokens evaluated (prompt + fed-back samples)
+    tokens_out: int = 0  # tokens sampled
+    max_active: int = 0
+    occupancy: list[int] = field(default_factory=list, repr=False)
+
+
+class BatchEngine:
+    """
+    Continuous batching: all active sequences advance together in one decode call per step.
+
+    Each step first feeds every generating sequence its last sampled token, then fills the
+    rest of ``n_batch`` with prompt chunks of newly admitted sequences, so a long prompt
+    joining the batch does not stall the streams already running. Sequences are admitted
+    into free KV slots as soon as one opens and leave as soon as they hit a stop token,
+    stop string, ``max_tokens`` or are cancelled. Sampling is per sequence (temperature,
+    top-k/top-p, seed). The loop runs on one worker thread; ``submit`` is thread-safe.
+    """
+
+    def __init__(self, backend: BatchBackend, threaded: bool = True) -> None:
+        self.backend = backend
+        # False: no worker thread, the caller drives ``step()`` (tests, benchmarks)
+        self.threaded = threaded
+        self.stats = BatchStats()
+        self._cond = threading.Condition()
+        self._waiting: deque[BatchRequest] = deque()
+        self._active: dict[int, BatchRequest] = {}
+        self._free = list(range(backend.n_seq_max - 1, -1, -1))
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    # ---- API ----
+    @property
+    def slots(self) -> int:
+        return self.backend.n_seq_max
+
+    def submit(
+        self,
+        prompt: str | list[int],
+        params: SamplingParams,
+        emit: Callable[[str], None],
+        on_done: DoneFn | None = None,
+        cancel: threading.Event | None = None,
+    ) -> BatchRequest:
+        req = BatchRequest(prompt, params, emit, on_done, cancel)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchEngine is closed")
+            self._waiting.append(req)
+            if self.threaded and self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return req
+
+    def astream(self, prompt: str | list[int], params: SamplingParams) -> TokenStream:
+        """Submit from the event loop and iterate the reply like ``LlamaRunner.astream_*``."""
+        stream = TokenStream()
+
+        def done(reason: str, error: BaseException | None) -> None:
+            stream.finish_reason = reason
+            stream.close(error)
+
+        self.submit(prompt, params, stream.put, done, stream.cancel_event)
+        return stream
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            for req in self._waiting:
+                req.cancel()
+            for req in list(self._active.values()):
+                req.cancel()
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        close = getattr(self.backend, "close", None)
+        if close is not None:
+            close()
+
+    # ---- decode loop ----
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and not self._waiting and not self._active:
+                    self._cond.wait()
+                if self._closed and not self._waiting and not self._active:
+                    return
+            self.step()
+
+    def step(self) -> bool:
+        """Run one decode step; returns False if there was nothing to evaluate."""
+        self._admit()
+        for req in [r for r in self._active.values() if r.cancel_event.is_set()]:
+            self._finish(req, "cancelled")
+
+        entries: list[BatchEntry] = []
+        budget = self.backend.n_batch
+        for req in self._active.values():
+            if req.next_token is not None:
+                entries.append(BatchEntry(req.seq_id, [req.next_token], req.n_past, True))
+                budget -= 1
+        for req in self._active.values():
+            if budget <= 0:
+                break
+            if req.pending:
+                chunk = req.pending[:budget]
+                last = len(chunk) == len(req.pending)
+                entries.append(BatchEntry(req.seq_id, chunk, req.n_past, last))
+                budget -= len(chunk)
+        if not entries:
+            return False
+
+        try:
+            logits = self.backend.decode(entries)
+        except Exception as e:
+            for req in list(self._active.values()):
+                self._finish(req, "error", e)
+            return True
+
+        self.stats.steps += 1
+        self.stats.max_active = max(self.stats.max_active, len(self._active))
+        self.stats.occupancy.append(len(entries))
+        for entry in entries:
+            req = self._active[entry.seq_id]
+            req.n_past += len(entry.tokens)
+            self.stats.tokens_in += len(entry.tokens)
+            # a sequence is either prefilling its prompt or feeding back its last sample
+            if req.pending:
+                del req.pending[: len(entry.tokens)]
+            else:
+                req.next_token = None
+            if entry.logits:
+                self._on_logits(req, logits[entry.seq_id])
+        return True
+
+    def _admit(self) -> None:
+        with self._cond:
+            while self._waiting and self._free:
+                req = self._waiting.popleft()
+                if req.cancel_event.is_set():
+                    self._done(req, "cancelled")
+                    continue
+                try:
+                    prompt = req.prompt
+                    tokens = self.backend.tokenize(prompt) if isinstance(prompt, str) else prompt
+                    if not tokens or len(tokens) >= self.backend.n_ctx:
+                        raise ValueError(
+                            f"prompt is {len(tokens)} tokens; context is {self.backend.n_ctx}"
+                        )
+                except Exception as e:
+                    self._done(req, "error", e)
+                    continue
+                req.seq_id = self._free.pop()
+                req.pending = list(tokens)
+                self._active[req.seq_id] = req
+
+    def _on_logits(self, req: BatchRequest, logits: np.ndarray) -> None:
+        token = sample_token(logits, req.params, req.rng)
+        req.generated += 1
+        self.stats.tokens_out += 1
+        if self.backend.is_eog(token):
+            self._finish(req, "stop")
+            return
+        req.next_token = token
+        text = req.decoder.decode(self.backend.token_bytes(token))
+        if text and self._emit(req, text):
+            self._finish(req, "stop", flush=False)
+        elif req.generated >= req.params.max_tokens or req.n_past + 1 >= self.backend.n_ctx:
+            self._finish(req, "length")
+
+    def _emit(self, req: BatchRequest, text: str) -> bool:
+        """Emit ``text`` minus any stop string; True if a stop string was hit."""
+        buf = req.held + text
+        stops = req.params.stop
+        hits = [i for i in (buf.find(s) for s in stops) if i >= 0]
+        if hits:
+            req.held = ""
+            if min(hits):
+                req.emit(buf[: min(hits)])
+            return True
+        keep = 0
+        for s in stops:
+            for n in range(min(len(s) - 1, len(buf)), keep, -1):
+                if buf.endswith(s[:n]):
+                    keep = n
+                    break
+        req.held = buf[len(buf) - keep :] if keep else ""
+        out = buf[: len(buf) - keep]
+        if out:
+            req.emit(out)
+        return False
+
+    def _finish(
+        self,
+        req: BatchRequest,
+        reason: str,
+        error: BaseException | None = None,
+        flush: bool = True,
+    ) -> None:
+        if flush and reason != "error":
+            tail = req.held + req.decoder.decode(b"", final=True)
+            if tail and reason != "cancelled":
+                req.emit(tail)
+        req.held = ""
+        # ``_active`` only changes under ``_cond``: ``close()`` iterates it from another thread
+        with self._cond:
+            del self._active[req.seq_id]
+        try:
+            self.backend.clear_seq(req.seq_id)
+        finally:
+            with self._cond:
+                self._free.append(req.seq_id)
+            self._done(req, reason, error)
+
+    def _done(self, req: BatchRequest, reason: str, error: BaseException | None = None) -> None:
+        req.finish_reason = reason
+        if req.on_done is not None:
+            req.on_done(reason, error)
+
+
+class LlamaBatchBackend:
+    """
+    ``BatchBackend`` on llama.cpp's low-level API, sharing the weights of a loaded ``Llama``.
+
+    The high-level ``Llama`` object owns a single-sequence context, so this creates a
+    second context with ``n_seq_max`` sequences over the same model and drives
+    ``llama_decode`` with a multi-sequence ``llama_batch``.
+    """
+
+    def __init__(self, llm, n_seq_max: int, n_ctx: int, n_batch: int = 512) -> None:
+        import llama_cpp
+
+        self._lib = llama_cpp
+        self.llm = llm
+        self.n_seq_max = int(n_seq_max)
+        self.n_batch = int(n_batch)
+        self.n_ctx = int(n_ctx)
+        self.n_vocab = int(llm.n_vocab())
+        self._model = llm._model.model
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = self.n_ctx * self.n_seq_max
+        params.n_batch = self.n_batch
+        params.n_ubatch = self.n_batch
+        params.n_seq_max = self.n_seq_max
+        params.n_threads = llm.context_params.n_threads
+        params.n_threads_batch = llm.context_params.n_threads_batch
+        # the KV cache types ``core.memory`` planned for (quantized V needs flash attention)
+        params.type_k = llm.context_params.type_k
+        params.type_v = llm.context_params.type_v
+        params.flash_attn = llm.context_params.flash_attn
+        new_ctx = getattr(llama_cpp, "llama_init_from_model", None) or (
+            llama_cpp.llama_new_context_with_model
+        )
+        self._ctx = new_ctx(self._model, params)
+        if not self._ctx:
+            raise RuntimeError("failed to create a batched llama context")
+        self._batch = llama_cpp.llama_batch_init(self.n_batch, 0, self.n_seq_max)
+        self._eos = llm.token_eos()
+
+    def tokenize(self, text: str) -> list[int]:
+        return list(self.llm.tokenize(text.encode("utf-8"), add_bos=True, special=True))
+
+    def token_bytes(self, token: int) -> bytes:
+        return self.llm.detokenize([token])
+
+    def is_eog(self, token: int) -> bool:
+        lib = self._lib
+        if hasattr(lib, "llama_vocab_is_eog"):
+            return bool(lib.llama_vocab_is_eog(lib.llama_model_get_vocab(self._model), token))
+        if hasattr(lib, "llama_token_is_eog"):
+            return bool(lib.llama_token_is_eog(self._model, token))
+        return token == self._eos
+
+    def decode(self, entries: list[BatchEntry]) -> dict[int, np.ndarray]:
+        b = self._batch
+        rows: list[tuple[int, int]] = []
+        n = 0
+        for e in entries:
+            for i, tok in enumerate(e.tokens):
+                b.token[n] = tok
+                b.pos[n] = e.pos + i
+                b.n_seq_id[n] = 1
+                b.seq_id[n][0] = e.seq_id
+                want = e.logits and i == len(e.tokens) - 1
+                b.logits[n] = want
+                if want:
+                    rows.append((n, e.seq_id))
+                n += 1
+        b.n_tokens = n
+        rc = self._lib.llama_decode(self._ctx, b)
+        if rc != 0:
+            raise RuntimeError(f"llama_decode failed ({rc})")
+        out = {}
+        for row, seq_id in rows:
+            ptr = self._lib.llama_get_logits_ith(self._ctx, row)
+            out[seq_id] = np.ctypeslib.as_array(ptr, shape=(self.n_vocab,)).copy()
+        return out
+
+    def clear_seq(self, seq_id: int) -> None:
+        lib = self._lib
+        if hasattr(lib, "llama_kv_cache_seq_rm"):
+            lib.llama_kv_cache_seq_rm(self._ctx, seq_id, -1, -1)
+        else:
+            lib.llama_memory_seq_rm(lib.llama_get_memory(self._ctx), seq_id, -1, -1)
+
+    def close(self) -> None:
+        if self._ctx:
+            self._lib.llama_batch_free(self._batch)
+            self._lib.llama_free(self._ctx)
+            self._ctx = None
@@ -0,0 +1,81 @@
+"""
+Cancelling a generation inside llama.cpp's work rather than between streamed chunks.
+
+A long prompt is prefilled here in chunks, with cancel checked between them and, where
+llama-cpp-python exposes it, an abort callback that llama.cpp polls between graph nodes,
+so even one large batch stops within milliseconds. During decoding a stopping criterion
+ends the stream right after the token being sampled.
+"""
+
+import contextlib
+import threading
+from collections.abc import Iterator, Sequence
+
+# tokens per prefill eval when llama.cpp cannot be interrupted mid-batch
+PREFILL_CHUNK = 64
+
+
+def stopping_criteria(cancel: threading.Event):
+    """A ``StoppingCriteriaList`` that ends generation once ``cancel`` is set, or None."""
+    try:
+        from llama_cpp import StoppingCriteriaList
+    except ImportError:
+        return None
+    return StoppingCriteriaList([lambda _input_ids, _logits: cancel.is_set()])
+
+
+@contextlib.contextmanager
+def abort_on(llm, cancel: threading.Event) -> Iterator[bool]:
+    """
+    While active, llama.cpp aborts the running decode (``eval`` raises) as soon as
+    ``cancel`` is set. Yields False, doing nothing, where the context or
+    ``llama_set_abort_callback`` is not available. The callback takes the GIL for every
+    graph node, so it is meant for prefill batches, not for every decoded token.
+    """
+    ctx = getattr(getattr(llm, "_ctx", None), "ctx", None)
+    try:
+        import llama_cpp
+
+        set_callback = llama_cpp.llama_set_abort_callback
+        callback_type = llama_cpp.ggml_abort_callback
+    except (ImportError, AttributeError):
+        set_callback = callback_type = None
+    if ctx is None or set_callback is None:
+        yield False
+        return
+    # referenced until it is unset below, so ctypes does not free it while llama.cpp can call it
+    callback = callback_type(lambda _data: cancel.is_set())
+    set_callback(ctx, callback, None)
+    try:
+        yield True
+    finally:
+        set_callback(ctx, callback_type(), None)
+
+
+def can_prefill(llm) -> bool:
+    return all(hasattr(llm, name) for name in ("eval", "n_tokens", "input_ids"))
+
+
+def prefill(llm, tokens: Sequence[int], cancel: threading.Event, chunk: int) -> bool:
+    """
+    Evaluate all but the last of ``tokens`` in ``chunk``-token evals, skipping the prefix
+    already in the KV cache and checking ``cancel`` before each. ``create_completion``
+    then finds everything but the last token cached. Returns False if cancelled.
+    """
+    n_past = 0
+    for a, b in zip(list(llm.input_ids[: llm.n_tokens]), tokens[:-1], strict=False):
+        if a != b:
+            break
+        n_past += 1
+    llm.n_tokens = n_past
+    todo = list(tokens[n_past:-1])
+    for i in range(0, len(todo), max(1, chunk)):
+        if cancel.is_set():
+            return False
+        try:
+            llm.eval(todo[i : i + chunk])
+        except RuntimeError:
+            if cancel.is_set():  # aborted through the callback
+                return False
+            raise
+    return not cancel.is_set()
@@ -0,0 +1,90 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from config import DEFAULT_CONTEXT_POLICY, DEFAULT_CONTEXT_TRIM
+from core.conversation import Conversation, Message
+
+POLICIES = ("drop_oldest", "pin_system", "pin_summary")
+
+TokensFn = Callable[[Message], list[int]]
+
+
+class ContextOverflowError(ValueError):
+    pass
+
+
+@dataclass
+class ContextWindow:
+    """
+    Decides which turns of a conversation go into the prompt so it fits ``n_ctx`` with
+    room for the reply.
+
+    ``policy`` says what may be dropped when history overflows:
+
+    - ``"drop_oldest"``: oldest turns first, and the system prompt as a last resort;
+    - ``"pin_system"``: oldest turns, never the system prompt;
+    - ``"pin_summary"``: like ``pin_system``, and messages added with ``pinned=True``
+      (e.g. summaries of older turns) are kept too.
+
+    Dropped turns stay in ``conversation.messages``; the window only moves
+    ``conversation.window_start``. It moves in chunks of ``trim_fraction`` of the budget,
+    and always to the start of a user turn, so the rendered prompt keeps the same token
+    prefix from one turn to the next and llama.cpp can keep reusing its KV cache until
+    the next trim.
+    """
+
+    policy: str = DEFAULT_CONTEXT_POLICY
+    trim_fraction: float = DEFAULT_CONTEXT_TRIM
+
+    def __post_init__(self) -> None:
+        if self.policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+
+    def _pinned(self, msg: Message) -> bool:
+        return self.policy == "pin_summary" and msg.pinned
+
+    def select(
+        self,
+        conversation: Conversation,
+        budget: int,
+        n_bos: int,
+        n_system: int,
+        n_suffix: int,
+        tokens_of: TokensFn,
+    ) -> tuple[bool, list[Message]]:
+        """
+        Pick what to render within ``budget`` tokens: returns whether to keep the system
+        turn and the messages, in order. ``n_bos``/``n_system``/``n_suffix`` are the token
+        counts of the BOS, the system turn and the assistant header; ``tokens_of`` gives
+        (memoized) tokens per message. Raises ``ContextOverflowError`` if even the
+        latest turn alone does not fit.
+        """
+        if budget <= 0:
+            raise ContextOverflowError(f"no room for the prompt (budget {budget} tokens)")
+        msgs = conversation.messages
+        last = len(msgs) - 1
+        start = max(0, min(conversation.window_start, last))
+        total = n_bos + n_system + n_suffix
+        total += sum(len(tokens_of(m)) for m in msgs[:start] if self._pinned(m))
+        total += sum(len(tokens_of(m)) for m in msgs[start:])
+
+        if total > budget:
+            # free a whole chunk at once so the next few turns append to a stable prefix
+            target = budget - int(budget * self.trim_fraction)
+            while start < last and (total > target or msgs[start].role != "user"):
+                if not self._pinned(msgs[start]):
+                    total -= len(tokens_of(msgs[start]))
+                start += 1
+
+        keep_system = True
+        if total > budget and self.policy == "drop_oldest" and n_system:
+            keep_system = False
+            total -= n_system
+        if total > budget:
+            raise ContextOverflowError(
+                f"prompt needs {total} tokens but only {budget} fit in the context "
+                f"after reserving room for the reply"
+            )
+        conversation.window_start = start
+        kept = [m for m in msgs[:start] if self._pinned(m)] + msgs[start:]
+        return keep_system, kept
@@ -0,0 +1,45 @@
+import uuid
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Message:
+    role: str
+    content: str
+    # kept in the prompt when older turns are trimmed (``pin_summary`` policy)
+    pinned: bool = False
+    # retrieved document excerpts rendered ahead of a user turn (see ``LlamaRunner.rag``)
+    context: str = ""
+    # ChatML tokens for this turn; filled in lazily by ``LlamaRunner`` and reused every turn
+    tokens: list[int] | None = field(default=None, repr=False, compare=False)
+    # the model whose tokenizer produced ``tokens``; another model re-renders them
+    tokenizer: str = field(default="", repr=False, compare=False)
+
+
+@dataclass
+class Conversation:
+    """
+    Multi-turn chat state.
+
+    The runner renders each message to ChatML tokens once and keeps them on the message,
+    so the prompt for turn N is the prompt for turn N-1 plus the new turn. llama.cpp keeps
+    the KV cache for the longest matching token prefix, so only the new tokens are prefilled.
+    """
+
+    system_prompt: str = ""
+    messages: list[Message] = field(default_factory=list)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # BOS (if the model wants one) + system turn, memoized like message tokens
+    prefix_tokens: list[int] | None = field(default=None, repr=False, compare=False)
+    prefix_tokenizer: str = field(default="", repr=False, compare=False)
+    # first message still in the prompt; moved forward by ``ContextWindow`` on overflow
+    window_start: int = 0
+
+    def add(self, role: str, content: str, pinned: bool = False, context: str = "") -> Message:
+        msg = Message(role, content, pinned=pinned, context=context)
+        self.messages.append(msg)
+        return msg
+
+    def clear(self) -> None:
+        self.messages.clear()
+        self.window_start = 0
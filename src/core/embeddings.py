@@ -0,0 +1,188 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Protocol
+
+import numpy as np
+
+from config import DEFAULT_EMBED_CACHE_ENTRIES
+
+# sequences per llama.cpp batch (llama.cpp's LLAMA_MAX_SEQ)
+MAX_SEQ = 64
+
+
+class EmbeddingBackend(Protocol):
+    n_batch: int  # tokens per decode
+    n_seq_max: int  # sequences per decode
+    dim: int
+
+    def tokenize(self, text: str) -> list[int]: ...
+
+    def decode(self, seqs: list[list[int]]) -> np.ndarray:
+        """One pooled embedding per token sequence, as a ``[len(seqs), dim]`` array."""
+        ...
+
+    def close(self) -> None: ...
+
+
+def pack(lengths: Sequence[int], n_batch: int, n_seq_max: int = MAX_SEQ) -> list[list[int]]:
+    """
+    Group sequence indices into batches of at most ``n_batch`` tokens and ``n_seq_max``
+    sequences. Longest first, each into the first batch with room, so batches come out
+    nearly full (every length must be at most ``n_batch``).
+    """
+    batches: list[list[int]] = []
+    room: list[int] = []
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        n = lengths[i]
+        for b, free in enumerate(room):
+            if n <= free and len(batches[b]) < n_seq_max:
+                batches[b].append(i)
+                room[b] -= n
+                break
+        else:
+            batches.append([i])
+            room.append(n_batch - n)
+    return batches
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingCache:
+    """LRU of embeddings (as computed, not normalized) keyed by a hash of the text."""
+
+    def __init__(self, max_entries: int = DEFAULT_EMBED_CACHE_ENTRIES) -> None:
+        self.max_entries = int(max_entries)
+        self._entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, text: str) -> np.ndarray | None:
+        k = self.key(text)
+        with self._lock:
+            v = self._entries.get(k)
+            if v is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(k)
+            self.hits += 1
+            return v
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        v = np.array(vector, dtype=np.float32)
+        v.flags.writeable = False
+        with self._lock:
+            self._entries[self.key(text)] = v
+            self._entries.move_to_end(self.key(text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LlamaEmbeddingBackend:
+    """
+    ``EmbeddingBackend`` on llama.cpp's low-level API, over the weights of a ``Llama``
+    loaded with ``embedding=True``.
+
+    ``Llama``'s own context holds a single sequence, so like ``LlamaBatchBackend`` this
+    creates a second context with ``n_seq_max`` sequences and decodes many texts per
+    ``llama_decode``. Models without a pooling layer get their token embeddings averaged.
+    """
+
+    def __init__(self, llm, n_batch: int, n_seq_max: int = MAX_SEQ) -> None:
+        import llama_cpp
+
+        self._lib = llama_cpp
+        self.llm = llm
+        self.n_batch = int(n_batch)
+        self.n_seq_max = int(n_seq_max)
+        self.dim = int(llm.n_embd())
+        self._model = llm._model.model
+
+        params = llama_cpp.llama_context_default_params()
+        # a sequence gets the whole context, since each batch starts from an empty one
+        params.n_ctx = self.n_batch
+        params.n_batch = self.n_batch
+        params.n_ubatch = self.n_batch  # non-causal models need a sequence in one ubatch
+        params.n_seq_max = self.n_seq_max
+        params.embeddings = True
+        params.pooling_type = llm.context_params.pooling_type
+        if hasattr(params, "kv_unified"):
+            params.kv_unified = True
+        params.n_threads = llm.context_params.n_threads
+        params.n_threads_batch = llm.context_params.n_threads_batch
+        new_ctx = getattr(llama_cpp, "llama_init_from_model", None) or (
+            llama_cpp.llama_new_context_with_model
+        )
+        self._ctx = new_ctx(self._model, params)
+        if not self._ctx:
+            raise RuntimeError("failed to create an embedding llama context")
+        self._batch = llama_cpp.llama_batch_init(self.n_batch, 0, self.n_seq_max)
+        self.pooled = llama_cpp.llama_pooling_type(self._ctx) != llama_cpp.LLAMA_POOLING_TYPE_NONE
+
+    def tokenize(self, text: str) -> list[int]:
+        return list(self.llm.tokenize(text.encode("utf-8"), add_bos=True, special=True))
+
+    def _clear(self) -> None:
+        lib = self._lib
+        if hasattr(lib, "llama_memory_clear"):
+            mem = lib.llama_get_memory(self._ctx)
+            if mem:
+                lib.llama_memory_clear(mem, True)
+        else:
+            lib.llama_kv_self_clear(self._ctx)
+
+    def decode(self, seqs: list[list[int]]) -> np.ndarray:
+        b = self._batch
+        n = 0
+        for s, tokens in enumerate(seqs):
+            for i, tok in enumerate(tokens):
+                b.token[n] = tok
+                b.pos[n] = i
+                b.n_seq_id[n] = 1
+                b.seq_id[n][0] = s
+                b.logits[n] = not self.pooled or i == len(tokens) - 1
+                n += 1
+        b.n_tokens = n
+        self._clear()
+        rc = self._lib.llama_decode(self._ctx, b)
+        if rc != 0:
+            raise RuntimeError(f"llama_decode failed ({rc})")
+        out = np.empty((len(seqs), self.dim), dtype=np.float32)
+        if self.pooled:
+            for s in range(len(seqs)):
+                ptr = self._lib.llama_get_embeddings_seq(self._ctx, s)
+                out[s] = np.ctypeslib.as_array(ptr, shape=(self.dim,))
+        else:
+            ptr = self._lib.llama_get_embeddings(self._ctx)
+            rows = np.ctypeslib.as_array(ptr, shape=(n, self.dim))
+            pos = 0
+            for s, tokens in enumerate(seqs):
+                out[s] = rows[pos : pos + len(tokens)].mean(axis=0)
+                pos += len(tokens)
+        return out
+
+    def close(self) -> None:
+        if self._ctx:
+            self._lib.llama_batch_free(self._batch)
+            self._lib.llama_free(self._ctx)
+            self._ctx = None
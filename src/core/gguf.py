@@ -0,0 +1,254 @@
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF metadata value types
+_SCALAR_FORMATS = {
+    0: "<B",  # uint8
+    1: "<b",  # int8
+    2: "<H",  # uint16
+    3: "<h",  # int16
+    4: "<I",  # uint32
+    5: "<i",  # int32
+    6: "<f",  # float32
+    7: "<?",  # bool
+    10: "<Q",  # uint64
+    11: "<q",  # int64
+    12: "<d",  # float64
+}
+_STRING = 8
+_ARRAY = 9
+
+# ggml tensor type -> (elements per block, bytes per block)
+GGML_TYPE_SIZES = {
+    0: (1, 4),  # F32
+    1: (1, 2),  # F16
+    2: (32, 18),  # Q4_0
+    3: (32, 20),  # Q4_1
+    6: (32, 22),  # Q5_0
+    7: (32, 24),  # Q5_1
+    8: (32, 34),  # Q8_0
+    9: (32, 36),  # Q8_1
+    10: (256, 84),  # Q2_K
+    11: (256, 110),  # Q3_K
+    12: (256, 144),  # Q4_K
+    13: (256, 176),  # Q5_K
+    14: (256, 210),  # Q6_K
+    15: (256, 292),  # Q8_K
+    16: (256, 66),  # IQ2_XXS
+    17: (256, 74),  # IQ2_XS
+    18: (256, 98),  # IQ3_XXS
+    19: (256, 50),  # IQ1_S
+    20: (32, 18),  # IQ4_NL
+    21: (256, 110),  # IQ3_S
+    22: (256, 82),  # IQ2_S
+    23: (256, 136),  # IQ4_XS
+    24: (1, 1),  # I8
+    25: (1, 2),  # I16
+    26: (1, 4),  # I32
+    27: (1, 8),  # I64
+    28: (1, 8),  # F64
+    29: (256, 56),  # IQ1_M
+    30: (1, 2),  # BF16
+    34: (256, 54),  # TQ1_0
+    35: (256, 66),  # TQ2_0
+}
+
+# llama.cpp ``general.file_type`` values
+FILE_TYPES = {
+    0: "F32",
+    1: "F16",
+    2: "Q4_0",
+    3: "Q4_1",
+    7: "Q8_0",
+    8: "Q5_0",
+    9: "Q5_1",
+    10: "Q2_K",
+    11: "Q3_K_S",
+    12: "Q3_K_M",
+    13: "Q3_K_L",
+    14: "Q4_K_S",
+    15: "Q4_K_M",
+    16: "Q5_K_S",
+    17: "Q5_K_M",
+    18: "Q6_K",
+    19: "IQ2_XXS",
+    20: "IQ2_XS",
+    21: "Q2_K_S",
+    22: "IQ3_XS",
+    23: "IQ3_XXS",
+    24: "IQ1_S",
+    25: "IQ4_NL",
+    26: "IQ3_S",
+    27: "IQ3_M",
+    28: "IQ2_S",
+    29: "IQ2_M",
+    30: "IQ4_XS",
+    31: "IQ1_M",
+    32: "BF16",
+    36: "TQ1_0",
+    37: "TQ2_0",
+}
+
+
+class GGUFError(ValueError):
+    pass
+
+
+@dataclass
+class GGUFInfo:
+    """What we need from a GGUF header to pick a model and budget memory for it."""
+
+    path: str
+    size: int
+    mtime_ns: int
+    architecture: str | None = None
+    name: str | None = None
+    quantization: str | None = None
+    context_length: int | None = None
+    chat_template: str | None = None
+    parameter_count: int | None = None
+    block_count: int | None = None
+    embedding_length: int | None = None
+    head_count: int | None = None
+    head_count_kv: int | None = None
+    key_length: int | None = None
+    value_length: int | None = None
+    vocab_size: int | None = None
+    tensor_count: int = 0
+    # sum of tensor data sizes from the tensor table (None if a tensor type is unknown)
+    tensor_bytes: int | None = None
+    metadata: dict = field(default_factory=dict, repr=False)
+
+    def weights_bytes(self) -> int:
+        return self.tensor_bytes if self.tensor_bytes is not None else self.size
+
+    def kv_cache_bytes(self, n_ctx: int, bytes_k: float = 2.0, bytes_v: float = 2.0) -> int:
+        """K+V cache size for ``n_ctx`` tokens (default f16). 0 if the header lacks the shape."""
+        if not (self.block_count and self.embedding_length and self.head_count):
+            return 0
+        head_dim = self.embedding_length // self.head_count
+        n_kv = self.head_count_kv or self.head_count
+        k = (self.key_length or head_dim) * n_kv
+        v = (self.value_length or head_dim) * n_kv
+        return int(self.block_count * n_ctx * (k * bytes_k + v * bytes_v))
+
+
+class _Reader:
+    def __init__(self, f) -> None:
+        self.f = f
+        self.last_array_len = 0
+
+    def unpack(self, fmt: str):
+        size = struct.calcsize(fmt)
+        data = self.f.read(size)
+        if len(data) != size:
+            raise GGUFError("unexpected end of file")
+        return struct.unpack(fmt, data)[0]
+
+    def string(self, keep: bool = True) -> str | None:
+        n = self.unpack("<Q")
+        if not keep:
+            self.f.seek(n, 1)
+            return None
+        data = self.f.read(n)
+        if len(data) != n:
+            raise GGUFError("unexpected end of file")
+        return data.decode("utf-8", errors="replace")
+
+    def value(self, vtype: int, keep: bool = True):
+        if vtype in _SCALAR_FORMATS:
+            return self.unpack(_SCALAR_FORMATS[vtype])
+        if vtype == _STRING:
+            return self.string(keep)
+        if vtype == _ARRAY:
+            itype = self.unpack("<I")
+            count = self.last_array_len = self.unpack("<Q")
+            if itype in _SCALAR_FORMATS:
+                # fixed-size items (e.g. token scores): skip without decoding
+                self.f.seek(count * struct.calcsize(_SCALAR_FORMATS[itype]), 1)
+            else:
+                # vocab arrays hold 100k+ strings; walk the lengths but never decode them
+                for _ in range(count):
+                    self.value(itype, keep=False)
+            return None
+        raise GGUFError(f"unknown metadata type {vtype}")
+
+
+def read_gguf(path: str | Path) -> GGUFInfo:
+    """Parse the GGUF header and tensor table of ``path`` (tensor data is never read)."""
+    p = Path(path)
+    st = p.stat()
+    with open(p, "rb", buffering=1 << 20) as f:
+        r = _Reader(f)
+        if f.read(4) != GGUF_MAGIC:
+            raise GGUFError(f"not a GGUF file: {p}")
+        version = r.unpack("<I")
+        if version < 2:
+            raise GGUFError(f"unsupported GGUF version {version}")
+        n_tensors = r.unpack("<Q")
+        n_kv = r.unpack("<Q")
+
+        meta = {}
+        n_vocab = None
+        for _ in range(n_kv):
+            key = r.string()
+            vtype = r.unpack("<I")
+            meta[key] = r.value(vtype)
+            if key == "tokenizer.ggml.tokens":
+                n_vocab = r.last_array_len
+
+        tensor_bytes: int | None = 0
+        n_params = 0
+        for _ in range(n_tensors):
+            r.string(keep=False)
+            n_dims = r.unpack("<I")
+            n_elems = 1
+            for _ in range(n_dims):
+                n_elems *= r.unpack("<Q")
+            ttype = r.unpack("<I")
+            r.unpack("<Q")  # data offset
+            n_params += n_elems
+            if tensor_bytes is not None and ttype in GGML_TYPE_SIZES:
+                block, nbytes = GGML_TYPE_SIZES[ttype]
+                tensor_bytes += n_elems // block * nbytes
+            else:
+                tensor_bytes = None
+
+    arch = meta.get("general.architecture")
+
+    def arch_key(name: str):
+        return meta.get(f"{arch}.{name}") if arch else None
+
+    return GGUFInfo(
+        path=str(p),
+        size=st.st_size,
+        mtime_ns=st.st_mtime_ns,
+        architecture=arch,
+        name=meta.get("general.name"),
+        quantization=FILE_TYPES.get(meta.get("general.file_type")),
+        context_length=arch_key("context_length"),
+        chat_template=meta.get("tokenizer.chat_template"),
+        parameter_count=meta.get("general.parameter_count") or n_params or None,
+        block_count=arch_key("block_count"),
+        embedding_length=arch_key("embedding_length"),
+        head_count=arch_key("attention.head_count"),
+        head_count_kv=arch_key("attention.head_count_kv"),
+        key_length=arch_key("attention.key_length"),
+        value_length=arch_key("attention.value_length"),
+        vocab_size=arch_key("vocab_size") or n_vocab,
+        tensor_count=n_tensors,
+        tensor_bytes=tensor_bytes,
+        metadata={k: v for k, v in meta.items() if v is not None and k.startswith("general.")},
+    )
+
+
+def estimate_model_bytes(path: str | Path, n_ctx: int) -> int:
+    """RAM needed to hold ``path`` with an ``n_ctx`` f16 KV cache; file size if unparsable."""
+    try:
+        info = read_gguf(path)
+    except (OSError, GGUFError):
+        return Path(path).stat().st_size
+    return info.weights_bytes() + info.kv_cache_bytes(n_ctx)
@@ -1,33 +1,163 @@
-import os
+import contextlib
+import functools
+import importlib.util
 import queue
 import sys
 import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-try:
+from config import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CTX_SIZE,
+    DEFAULT_INFERENCE,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_RAG_TOP_K,
+    DEFAULT_RESPONSE_CACHE_MAX_TEMP,
+    DEFAULT_TEMPERATURE,
+    DEFAULT_THREADS,
+    DEFAULT_THREADS_BATCH,
+    LLMDefaults,
+)
+from core.cancellation import PREFILL_CHUNK, abort_on, can_prefill, prefill, stopping_criteria
+from core.context import ContextWindow
+from core.conversation import Conversation, Message
+from core.memory import MemoryPlan, MemorySettings, plan_memory
+from core.metrics import MetricsRecorder, RequestMetrics
+from core.model_pool import ModelPool
+from core.streaming import TokenStream
+from core.tuning import (
+    Calibration,
+    CPUInfo,
+    TuningParams,
+    calibrate,
+    llama_measure,
+    model_fingerprint,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
     from llama_cpp import Llama
-except Exception:
-    Llama = None  # handled by UI
 
-from config import DEFAULT_CTX_SIZE, DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE
+    from core.batching import BatchEngine
+    from core.embeddings import EmbeddingBackend, EmbeddingCache
+    from core.rag import DocumentIndex
+    from core.speculative import SpeculativeConfig
+    from core.worker import RemoteLlama
+    from storage.response_cache import ResponseCache
+    from storage.tuning import TuningStore
 
 
 class LlamaRunner:
-    def __init__(self) -> None:
-        self._llm: Llama | None = None
+    TOP_P = 0.9
+
+    def __init__(
+        self,
+        pool: ModelPool | None = None,
+        cache: "ResponseCache | None" = None,
+        metrics: MetricsRecorder | None = None,
+        tuning: "TuningStore | None" = None,
+        inference: str = DEFAULT_INFERENCE,
+        rag: "DocumentIndex | None" = None,
+    ) -> None:
+        if inference not in ("thread", "process"):
+            raise ValueError("inference must be 'thread' or 'process'")
+        self._llm: Llama | RemoteLlama | None = None
         self.model_path: str | None = None
+        self.n_ctx: int | None = None
+        # identifies the loaded model's tokenizer; memoized conversation tokens carry it
+        self.tokenizer_id = ""
+        # a cancelled generation may still be finishing a chunk when the next one starts
+        self._gen_lock = threading.Lock()
+        # loaded models stay here (LRU, RAM budget) so switching back is instant
+        self.pool = pool if pool is not None else ModelPool()
+        self._engine: BatchEngine | None = None
+        # ``load(..., embedding=True)``: the model is for ``embed()``, not generation
+        self.embedding = False
+        self._embedder: EmbeddingBackend | None = None
+        # embeddings by text hash for the loaded model; created by the first ``embed()``
+        self.embed_cache: EmbeddingCache | None = None
+        # optional replay of finished single-turn replies (see storage.response_cache)
+        self.cache = cache
+        self.cache_max_temperature = DEFAULT_RESPONSE_CACHE_MAX_TEMP
+        # what to drop from long conversations so prompt + reply fit n_ctx
+        self.context = ContextWindow()
+        # per-request timings; ``self.metrics.last`` is the latest finished request
+        self.metrics = metrics if metrics is not None else MetricsRecorder()
+        # calibrated threads/batch size per (model, CPU); see ``calibrate()``
+        self.tuning = tuning
+        self.tuning_params: TuningParams | None = None
+        # KV cache types and the ctx actually loaded; see ``core.memory``
+        self.memory_plan: MemoryPlan | None = None
+        # "process": llama.cpp runs in a worker subprocess (see ``core.worker``)
+        self.inference = inference
+        self._loading: RemoteLlama | None = None
+        # set by ``abort_load()``; checked while prefetching and before the worker starts
+        self._abort = threading.Event()
+        self._load_active = False
+        # chat and conversation turns get the ``rag_top_k`` closest document chunks
+        self.rag = rag
+        self.rag_top_k = DEFAULT_RAG_TOP_K
 
     def is_available(self) -> bool:
-        return Llama is not None
+        """
+        Whether llama-cpp-python is installed. Only looks for the package, so the native
+        library is not loaded until the first ``load()``. True does not mean that library
+        loads: a broken build fails there with "llama-cpp-python unavailable: ...".
+        """
+        if sys.modules.get("llama_cpp") is not None:
+            return True
+        try:
+            return importlib.util.find_spec("llama_cpp") is not None
+        except (ImportError, ValueError):
+            return False
 
     def is_loaded(self) -> bool:
         return self._llm is not None
 
     def unload(self) -> None:
+        self._close_engine()
+        self._close_embedder()
+        if self.embed_cache is not None:
+            self.embed_cache.clear()
         self._llm = None
         self.model_path = None
+        self.n_ctx = None
+        self.tokenizer_id = ""
+        self.memory_plan = None
+        # frees the model unless the pool budget has room to keep it around
+        self.pool.trim()
 
-    def load(self, model_path: str, n_ctx: int = DEFAULT_CTX_SIZE) -> None:
+    def load(
+        self,
+        model_path: str,
+        n_ctx: int = DEFAULT_CTX_SIZE,
+        progress: Callable[[float], None] | None = None,
+        speculative: "SpeculativeConfig | None" = None,
+        memory: MemorySettings | None = None,
+        embedding: bool = False,
+        parallel: int = 1,
+    ) -> None:
+        """
+        Load a GGUF model, or reuse it from ``self.pool``. With ``progress``, a model that
+        is not pooled is first read through once (warming the page cache that llama.cpp
+        then mmaps) and the fraction read is reported, ending with 1.0 once it is ready.
+        ``speculative`` (default: from ``LLMDefaults``/``LOCALAI_SPECULATIVE``) sets up
+        prompt-lookup or draft-model decoding; see ``speculative_stats()``. Thread counts
+        and batch size come from ``self.tuning`` when this model was calibrated on this
+        CPU, else from ``TuningParams.defaults()``. ``memory`` (default: from
+        ``LLMDefaults``) sets mmap/mlock and the KV cache types; when the estimated peak
+        exceeds available RAM the KV cache is quantized and then ``n_ctx`` reduced (see
+        ``self.memory_plan`` and ``self.n_ctx``), and ``InsufficientMemoryError`` is
+        raised if the model cannot fit at all. Pooled models count as free memory and are
+        evicted first if the plan needs their room. The estimate counts speculative
+        decoding and, with ``parallel`` > 1, the context ``batch_engine(parallel)`` will
+        add. With ``inference="process"`` the model is loaded in a worker subprocess, and
+        ``abort_load()`` can interrupt it. With ``embedding=True`` the model is loaded for
+        ``embed()`` (no speculative decoding).
+        """
         if not self.is_available():
             raise RuntimeError("llama-cpp-python not installed")
 
@@ -37,13 +167,258 @@ class LlamaRunner:
 
         # free old
         self.unload()
+        self.embedding = bool(embedding)
+        self._abort.clear()
+        self._load_active = True
+        try:
+            self._load(p, n_ctx, progress, speculative, memory, parallel)
+        finally:
+            self._load_active = False
+
+    def _load(
+        self,
+        p: Path,
+        n_ctx: int,
+        progress: Callable[[float], None] | None,
+        speculative: "SpeculativeConfig | None",
+        memory: MemorySettings | None,
+        parallel: int,
+    ) -> None:
+        from core.speculative import SpeculativeConfig  # numpy comes with llama-cpp-python
+
+        defaults = LLMDefaults()
+        if self.embedding:
+            spec = SpeculativeConfig(mode="off")
+        else:
+            spec = speculative or SpeculativeConfig.from_defaults(defaults)
+        params = self._tuned_params(p)
+        # pooled models (this one included, if pooled) can be evicted to make room
+        reclaimable = self.pool.resident_bytes()
+        plan = plan_memory(
+            p,
+            n_ctx,
+            memory or MemorySettings.from_defaults(defaults),
+            params.n_batch,
+            speculative=spec,
+            n_seq=parallel,
+            reclaimable=reclaimable,
+        )
+        n_ctx = plan.n_ctx
+        mode = "process" if self.inference == "process" else ""
+        kind = "embedding" if self.embedding else ""
+        variant = "|".join(v for v in (spec.variant(), plan.settings.variant(), mode, kind) if v)
+        if self.pool.key(str(p), n_ctx, variant) not in self.pool:
+            if plan.estimate is not None and plan.available is not None:
+                free = plan.available - reclaimable - plan.settings.headroom_bytes
+                if plan.estimate.total > free:
+                    self.pool.release(plan.estimate.total - free)
+            if progress is not None:
+                self._prefetch(p, progress, self._abort if self.inference == "process" else None)
+
+        factory = self._llama_factory(p, n_ctx, spec, params, plan.settings)
+        loader = factory if self.inference == "thread" else lambda: self._start_worker(factory)
+        self._llm = self.pool.acquire(str(p), int(n_ctx), loader, variant)
+        self.tuning_params = params
+        self.memory_plan = plan
+        self.model_path = str(p)
+        self.n_ctx = int(n_ctx)
+        st = p.stat()
+        self.tokenizer_id = f"{p.resolve()}:{st.st_size}:{st.st_mtime_ns}"
+        if progress is not None:
+            progress(1.0)
+
+    def _start_worker(self, factory: Callable[[], "Llama"]) -> "RemoteLlama":
+        from core.worker import RemoteLlama
 
+        worker = self._loading = RemoteLlama(factory, start=False)
+        if self._abort.is_set():  # aborted before the worker existed
+            worker.kill()
+        try:
+            worker.start()
+        finally:
+            self._loading = None
+        return worker
+
+    def abort_load(self) -> bool:
+        """
+        Abort a model load in progress: stop reading the file, or kill the worker
+        process that is loading it (``load`` then raises ``WorkerError``). Returns False
+        if there is nothing to abort; thread-mode loads run inside llama.cpp and cannot
+        be interrupted.
+        """
+        if self.inference != "process" or not self._load_active:
+            return False
+        self._abort.set()
+        worker = self._loading  # read after setting the flag: see ``_start_worker``
+        if worker is not None:
+            worker.kill()
+        return True
+
+    def batch_engine(self, n_seq: int, n_batch: int = 512) -> "BatchEngine":
+        """
+        Continuous-batching engine over the loaded model's weights with ``n_seq``
+        sequences decoding together (see ``core.batching``); kept until unload.
+        """
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        if self.inference == "process":
+            raise RuntimeError("batched decoding needs LOCALAI_INFERENCE=thread")
+        if self._engine is None or self._engine.slots != n_seq:
+            from core.batching import BatchEngine, LlamaBatchBackend
+
+            self._close_engine()
+            backend = LlamaBatchBackend(self._llm, n_seq, self.n_ctx, n_batch)
+            self._engine = BatchEngine(backend)
+        return self._engine
+
+    def _close_engine(self) -> None:
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+
+    def _close_embedder(self) -> None:
+        if self._embedder is not None:
+            self._embedder.close()
+            self._embedder = None
+
+    def _embedding_backend(self) -> "EmbeddingBackend":
+        from core.embeddings import LlamaEmbeddingBackend
+
+        n_batch = self.tuning_params.n_batch if self.tuning_params else 512
+        return LlamaEmbeddingBackend(self._llm, n_batch)
+
+    def n_embd(self) -> int:
+        """Embedding size of the loaded model."""
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        return int(self._llm.n_embd())
+
+    def embed(self, texts: Sequence[str], normalize: bool = False) -> "np.ndarray":
+        """
+        Embeddings of ``texts`` as a contiguous ``[len(texts), n_embd]`` float32 array,
+        with unit-length rows if ``normalize``. Needs a model loaded with
+        ``embedding=True``. Texts not in ``self.embed_cache`` are tokenized (and cut
+        to ``n_batch`` tokens), then packed many to a batch, up to ``n_batch`` tokens and
+        64 sequences, so one ``llama_decode`` embeds them all.
+        """
+        import numpy as np
+
+        from core.embeddings import EmbeddingCache, normalize as unit_rows, pack
+
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        if not self.embedding:
+            raise RuntimeError("load the model with embedding=True to embed")
+        if self.inference == "process":
+            raise RuntimeError("embeddings need LOCALAI_INFERENCE=thread")
+        if self.embed_cache is None:
+            self.embed_cache = EmbeddingCache()
+        texts = list(texts)
+        out = np.empty((len(texts), self.n_embd()), dtype=np.float32)
+        missing: dict[str, list[int]] = {}  # text -> rows of ``out``, once per distinct text
+        for i, text in enumerate(texts):
+            cached = self.embed_cache.get(text)
+            if cached is None:
+                missing.setdefault(text, []).append(i)
+            else:
+                out[i] = cached
+        if missing:
+            with self._gen_lock:
+                if self._embedder is None:
+                    self._embedder = self._embedding_backend()
+                backend = self._embedder
+                todo = list(missing)
+                tokens = [backend.tokenize(t)[: backend.n_batch] for t in todo]
+                for group in pack([len(t) for t in tokens], backend.n_batch, backend.n_seq_max):
+                    group = [j for j in group if tokens[j]]
+                    vectors = backend.decode([tokens[j] for j in group]) if group else []
+                    for j, v in zip(group, vectors, strict=True):
+                        self.embed_cache.put(todo[j], v)
+                        out[missing[todo[j]]] = v
+                for j, t in enumerate(tokens):
+                    if not t:  # nothing to embed (no BOS, empty text)
+                        out[missing[todo[j]]] = 0.0
+        return unit_rows(out) if normalize else out
+
+    def speculative_stats(self) -> dict | None:
+        """Draft tokens proposed/accepted/rejected so far, or None without speculation."""
+        if self.inference == "process" and self._llm is not None:
+            return self._llm.speculative_stats()
+        draft = getattr(self._llm, "draft_model", None)
+        return draft.stats() if draft is not None else None
+
+    def _tuned_params(self, p: Path) -> TuningParams:
+        cpu = CPUInfo.detect()
+        overridden = DEFAULT_THREADS or DEFAULT_THREADS_BATCH or DEFAULT_BATCH_SIZE
+        if self.tuning is not None and not overridden:
+            tuned = self.tuning.get(model_fingerprint(p), cpu.signature())
+            if tuned is not None:
+                return tuned
+        return TuningParams.defaults(cpu)
+
+    def calibrate(self, model_path: str, log: Callable[[str], None] | None = None) -> Calibration:
+        """
+        Benchmark thread counts and batch sizes for ``model_path`` on this machine and
+        store the fastest in ``self.tuning``; later loads of the model pick them up.
+        Loads the model once per candidate, so it takes a while.
+        """
+        if not self.is_available():
+            raise RuntimeError("llama-cpp-python not installed")
+        p = Path(model_path)
+        if not p.exists():
+            raise FileNotFoundError(f"Model not found: {p.resolve()}")
+        cpu = CPUInfo.detect()
+        result = calibrate(llama_measure(p), cpu, log=log)
+        if self.tuning is not None:
+            self.tuning.put(model_fingerprint(p), cpu.signature(), result)
+        return result
+
+    def _llama_factory(
+        self,
+        p: Path,
+        n_ctx: int,
+        spec: "SpeculativeConfig | None",
+        params: TuningParams,
+        memory: MemorySettings,
+    ) -> Callable[[], "Llama"]:
+        """Builds the model; picklable, so a worker process can call it as well."""
+        return functools.partial(
+            LlamaRunner._create_llama, p, n_ctx, spec, params, memory, self.embedding
+        )
+
+    @staticmethod
+    def _create_llama(
+        p: Path,
+        n_ctx: int,
+        spec: "SpeculativeConfig | None" = None,
+        params: TuningParams | None = None,
+        memory: MemorySettings | None = None,
+        embedding: bool = False,
+    ) -> "Llama":
+        try:
+            from llama_cpp import Llama
+        except (ImportError, OSError) as e:
+            # the package is installed (see ``is_available``) but its native library is not
+            raise RuntimeError(f"llama-cpp-python unavailable: {e}") from e
+
+        from core.speculative import GGUFDraftModel, make_draft_model
+
+        params = params or TuningParams.defaults()
+        memory = memory or MemorySettings()
         base_kwargs = dict(
             model_path=str(p),
             n_ctx=int(n_ctx),
-            n_threads=os.cpu_count() or 4,
             verbose=False,
+            **params.llama_kwargs(),
+            **memory.llama_kwargs(),
         )
+        if embedding:
+            base_kwargs.update(embedding=True, n_ubatch=params.n_batch)
+        if spec is not None and spec.enabled:
+            # llama-cpp-python verifies the drafted tokens in one eval per step, and then
+            # keeps every token's logits, so ``scores`` must have a row per context token
+            base_kwargs["draft_model"] = make_draft_model(spec, n_ctx, base_kwargs["n_threads"])
+            base_kwargs["logits_all"] = True
 
         # In frozen apps (PyInstaller), Metal can fail due to shader/resource lookup.
         # To get you a working build now, force CPU in frozen mode.
@@ -58,64 +433,367 @@ class LlamaRunner:
         last_err: Exception | None = None
         for a in attempts:
             try:
-                self._llm = Llama(**base_kwargs, **a)
-                last_err = None
-                break
+                llm = Llama(**base_kwargs, **a)
             except Exception as e:
                 last_err = e
-                self._llm = None
+                continue
+            inner = getattr(base_kwargs.get("draft_model"), "inner", None)
+            if isinstance(inner, GGUFDraftModel):
+                inner.check_vocab(llm)
+            return llm
 
+        # Surface full detail; UI will show class + message
+        raise RuntimeError(f"Llama init failed ({type(last_err).__name__}): {last_err}")
+
+    @staticmethod
+    def _prefetch(
+        p: Path,
+        progress: Callable[[float], None],
+        abort: threading.Event | None = None,
+        chunk: int = 16 << 20,
+    ) -> None:
+        total = p.stat().st_size or 1
+        done = 0
+        buf = bytearray(chunk)
+        with open(p, "rb", buffering=0) as f:
+            while n := f.readinto(buf):
+                if abort is not None and abort.is_set():
+                    from core.worker import WorkerError
+
+                    raise WorkerError("model load aborted")
+                done += n
+                # keep the last percent for Llama init
+                progress(min(done / total, 0.99))
+
+    # ---- KV-cache snapshots (see storage.sessions) ----
+    def save_state(self) -> tuple[list[int], bytes, int]:
+        """Evaluated tokens, raw llama context state (KV cache) and sampler seed."""
         if self._llm is None:
-            # Surface full detail; UI will show class + message
-            raise RuntimeError(f"Llama init failed ({type(last_err).__name__}): {last_err}")
+            raise RuntimeError("Model not loaded")
+        with self._gen_lock:
+            if self.inference == "process":
+                return self._llm.snapshot()
+            return snapshot_state(self._llm)
 
-        self.model_path = str(p)
+    def load_state(self, tokens: list[int], state, seed: int = 0) -> None:
+        """
+        Restore a context saved by ``save_state``. ``state`` may be any buffer (e.g. an
+        mmap view); it is copied straight into llama.cpp. Logits are not persisted: the
+        next completion re-evaluates at least the last prompt token anyway.
+        """
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        with self._gen_lock:
+            if self.inference == "process":
+                self._llm.restore(tokens, state, seed)
+            else:
+                restore_state(self._llm, tokens, state, seed)
 
     # ---- ChatML via create_completion (works across llama-cpp versions) ----
+    ASSISTANT_HEADER = "<|im_start|>assistant\n"
+    STOPS = ("<|im_end|>", "<|endoftext|>")
+
+    @staticmethod
+    def _chatml_turn(role: str, content: str) -> str:
+        return f"<|im_start|>{role}\n{content}\n<|im_end|>\n"
+
     @staticmethod
-    def _chatml_prompt(system_prompt: str, user_prompt: str) -> str:
+    def _user_content(user_prompt: str, context: str = "") -> str:
+        user_prompt = user_prompt.strip()
+        return f"{context}\n\n{user_prompt}" if context else user_prompt
+
+    @staticmethod
+    def _chatml_prompt(system_prompt: str, user_prompt: str, context: str = "") -> str:
         parts = []
         sys_p = system_prompt.strip()
         if sys_p:
-            parts.append(f"<|im_start|>system\n{sys_p}\n<|im_end|>\n")
-        parts.append(f"<|im_start|>user\n{user_prompt.strip()}\n<|im_end|>\n")
-        parts.append("<|im_start|>assistant\n")
+            parts.append(LlamaRunner._chatml_turn("system", sys_p))
+        parts.append(
+            LlamaRunner._chatml_turn("user", LlamaRunner._user_content(user_prompt, context))
+        )
+        parts.append(LlamaRunner.ASSISTANT_HEADER)
         return "".join(parts)
 
-    def stream_chat(
+    def _tokenize(self, text: str, add_bos: bool = False) -> list[int]:
+        return list(self._llm.tokenize(text.encode("utf-8"), add_bos=add_bos, special=True))
+
+    def _message_tokens(self, msg: Message) -> list[int]:
+        if msg.tokens is None or msg.tokenizer != self.tokenizer_id:
+            if msg.role == "assistant":
+                content = msg.content
+            else:
+                content = self._user_content(msg.content, msg.context)
+            msg.tokens = self._tokenize(self._chatml_turn(msg.role, content))
+            msg.tokenizer = self.tokenizer_id
+        return msg.tokens
+
+    def conversation_tokens(self, conversation: Conversation, max_tokens: int = 0) -> list[int]:
+        """
+        Token prompt for the next assistant reply in ``conversation``, trimmed by
+        ``self.context`` so that it plus ``max_tokens`` fits the context size.
+        """
+        bos = self._tokenize("", add_bos=True)
+        if conversation.prefix_tokens is None or conversation.prefix_tokenizer != self.tokenizer_id:
+            prefix = list(bos)
+            sys_p = conversation.system_prompt.strip()
+            if sys_p:
+                prefix += self._tokenize(self._chatml_turn("system", sys_p))
+            conversation.prefix_tokens = prefix
+            conversation.prefix_tokenizer = self.tokenizer_id
+        header = self._tokenize(self.ASSISTANT_HEADER)
+        keep_system, messages = self.context.select(
+            conversation,
+            budget=(self.n_ctx or DEFAULT_CTX_SIZE) - int(max_tokens),
+            n_bos=len(bos),
+            n_system=len(conversation.prefix_tokens) - len(bos),
+            n_suffix=len(header),
+            tokens_of=self._message_tokens,
+        )
+        tokens = list(conversation.prefix_tokens if keep_system else bos)
+        for msg in messages:
+            tokens += self._message_tokens(msg)
+        tokens += header
+        return tokens
+
+    def _retrieve(self, query: str) -> str:
+        """Excerpts from ``self.rag`` to put ahead of ``query``, or "" without retrieval."""
+        if self.rag is None or self.rag_top_k <= 0:
+            return ""
+        from core.rag import format_context
+
+        return format_context(self.rag.search(query, self.rag_top_k))
+
+    def _iter_completion(
+        self,
+        prompt: str | list[int],
+        cancel: threading.Event,
+        temperature: float,
+        max_tokens: int,
+        seed: int | None = None,
+        metrics: RequestMetrics | None = None,
+    ) -> Iterator[str]:
+        if cancel.is_set():  # canceled while waiting for the previous generation
+            return
+        extra = {} if seed is None else {"seed": int(seed)}
+        llm = self._llm
+        # in-process, cancel reaches into llama.cpp (see ``core.cancellation``); a
+        # worker process only checks it between chunks
+        if self.inference == "thread":
+            criteria = stopping_criteria(cancel)
+            if criteria is not None:
+                extra["stopping_criteria"] = criteria
+            if can_prefill(llm):
+                if isinstance(prompt, str):
+                    prompt = self._tokenize(prompt, add_bos=True)
+                started = time.perf_counter()
+                with abort_on(llm, cancel) as abortable:
+                    size = llm.n_batch if abortable else PREFILL_CHUNK
+                    done = prefill(llm, prompt, cancel, size)
+                if metrics is not None:
+                    metrics.prefilled(time.perf_counter() - started)
+                if not done:
+                    return
+        for chunk in llm.create_completion(
+            prompt=prompt,
+            stream=True,
+            max_tokens=int(max_tokens),
+            temperature=float(temperature),
+            top_p=self.TOP_P,
+            stop=list(self.STOPS),
+            **extra,
+        ):
+            if cancel.is_set():
+                break
+            try:
+                choice = chunk["choices"][0]
+                delta = choice.get("text", "")
+                if metrics is not None and choice.get("finish_reason"):
+                    metrics.stop_reason = choice["finish_reason"]
+            except Exception:
+                delta = ""
+            if delta:
+                yield delta
+
+    # ---- producers (run on a worker thread; one generation at a time per model) ----
+    def _cache_key(
+        self, prompt: str | list[int], temperature: float, max_tokens: int, seed: int | None
+    ) -> str | None:
+        if self.cache is None or (seed is None and temperature > self.cache_max_temperature):
+            return None
+        params = {
+            "temperature": float(temperature),
+            "top_p": self.TOP_P,
+            "max_tokens": int(max_tokens),
+            "stop": list(self.STOPS),
+            "seed": seed,
+        }
+        return self.cache.key(self.model_path, self.n_ctx, prompt, params)
+
+    def _cached_completion(
+        self,
+        prompt: str | list[int],
+        cancel: threading.Event,
+        temperature: float,
+        max_tokens: int,
+        seed: int | None,
+        emit: Callable[[str], None],
+        locked: bool = False,
+        metrics: RequestMetrics | None = None,
+        engine: "BatchEngine | None" = None,
+    ) -> None:
+        """
+        Replay a cached reply if there is one, else generate (and cache it if finished),
+        on ``engine`` if given. Timings go into ``metrics`` (a fresh one by default) and on
+        to ``self.metrics``.
+        """
+        m = metrics if metrics is not None else RequestMetrics()
+        reason = "error"
+        try:
+            # tokenized once: counted here, then prefilled as is
+            tokens = prompt if isinstance(prompt, list) else self._tokenize(prompt, add_bos=True)
+            m.prompt_tokens = len(tokens)
+            key = self._cache_key(prompt, temperature, max_tokens, seed)
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                m.generation_started()
+                # replayed delta by delta, exactly as it was streamed the first time
+                for delta in cached:
+                    if cancel.is_set():
+                        break
+                    m.token()
+                    emit(delta)
+                reason = "cancelled" if cancel.is_set() else "cached"
+                return
+            deltas: list[str] = []
+
+            def collect(delta: str) -> None:
+                m.token()
+                deltas.append(delta)
+                emit(delta)
+
+            if engine is not None:
+                m.generation_started()
+                self._engine_completion(
+                    engine, tokens, cancel, temperature, max_tokens, seed, collect, m
+                )
+            else:
+                # ``locked``: the caller already holds ``_gen_lock``
+                with contextlib.nullcontext() if locked else self._gen_lock:
+                    m.generation_started()
+                    for delta in self._iter_completion(
+                        tokens, cancel, temperature, max_tokens, seed, m
+                    ):
+                        collect(delta)
+            reason = "cancelled" if cancel.is_set() else (m.stop_reason or "stop")
+            if key is not None and not cancel.is_set():
+                self.cache.put(key, deltas)
+        finally:
+            m.finished(reason)
+            self.metrics.record(m)
+
+    def _engine_completion(
+        self,
+        engine: "BatchEngine",
+        tokens: list[int],
+        cancel: threading.Event,
+        temperature: float,
+        max_tokens: int,
+        seed: int | None,
+        emit: Callable[[str], None],
+        metrics: RequestMetrics,
+    ) -> None:
+        """Decode on ``engine`` alongside other requests; blocks until the reply ends."""
+        from core.batching import SamplingParams
+
+        params = SamplingParams(temperature, max_tokens=max_tokens, stop=self.STOPS, seed=seed)
+        ended = threading.Event()
+        result: list = []
+
+        def on_done(reason: str, error: BaseException | None) -> None:
+            result.extend((reason, error))
+            ended.set()
+
+        engine.submit(tokens, params, emit, on_done, cancel)
+        ended.wait()
+        reason, error = result
+        if error is not None:
+            raise error
+        metrics.stop_reason = reason
+
+    def _chat_reply(
         self,
         system_prompt: str,
         user_prompt: str,
-        temperature: float = DEFAULT_TEMPERATURE,
-        max_tokens: int = DEFAULT_MAX_TOKENS,
-    ) -> tuple["queue.Queue[str | None]", threading.Event, threading.Thread]:
-        if self._llm is None:
-            raise RuntimeError("Model not loaded")
+        cancel: threading.Event,
+        temperature: float,
+        max_tokens: int,
+        emit: Callable[[str], None],
+        seed: int | None = None,
+        metrics: RequestMetrics | None = None,
+    ) -> None:
+        m = metrics if metrics is not None else RequestMetrics("chat")
+        prompt = self._chatml_prompt(system_prompt, user_prompt, self._retrieve(user_prompt))
+        self._cached_completion(prompt, cancel, temperature, max_tokens, seed, emit, metrics=m)
 
+    def _completion_reply(
+        self,
+        prompt: str,
+        cancel: threading.Event,
+        temperature: float,
+        max_tokens: int,
+        emit: Callable[[str], None],
+        seed: int | None = None,
+        metrics: RequestMetrics | None = None,
+    ) -> None:
+        self._cached_completion(
+            prompt, cancel, temperature, max_tokens, seed, emit, metrics=metrics
+        )
+
+    def _conversation_reply(
+        self,
+        conversation: Conversation,
+        user_prompt: str,
+        cancel: threading.Event,
+        temperature: float,
+        max_tokens: int,
+        emit: Callable[[str], None],
+        metrics: RequestMetrics | None = None,
+    ) -> None:
+        m = metrics if metrics is not None else RequestMetrics("conversation")
+        context = self._retrieve(user_prompt)
+        # the turn is recorded under the lock so a still-finishing canceled reply
+        # lands in the history before the next user turn
+        with self._gen_lock:
+            user_msg = conversation.add("user", user_prompt, context=context)
+            reply: list[str] = []
+            failed = True
+            try:
+                prompt = self.conversation_tokens(conversation, max_tokens)
+
+                def collect(delta: str) -> None:
+                    reply.append(delta)
+                    emit(delta)
+
+                self._cached_completion(
+                    prompt, cancel, temperature, max_tokens, None, collect, True, m
+                )
+                failed = False
+            finally:
+                if failed and not reply:
+                    if conversation.messages and conversation.messages[-1] is user_msg:
+                        conversation.messages.pop()
+                else:
+                    conversation.add("assistant", "".join(reply))
+
+    def _start_queue(
+        self, produce: Callable[[threading.Event, Callable[[str], None]], None]
+    ) -> tuple["queue.Queue[str | None]", threading.Event, threading.Thread]:
         q: queue.Queue[str | None] = queue.Queue()
         cancel = threading.Event()
 
         def _worker():
             try:
-                prompt = self._chatml_prompt(system_prompt, user_prompt)
-                stops = ["<|im_end|>", "<|endoftext|>"]
-
-                for chunk in self._llm.create_completion(
-                    prompt=prompt,
-                    stream=True,
-                    max_tokens=int(max_tokens),
-                    temperature=float(temperature),
-                    top_p=0.9,
-                    stop=stops,
-                ):
-                    if cancel.is_set():
-                        break
-                    try:
-                        delta = chunk["choices"][0].get("text", "")
-                    except Exception:
-                        delta = ""
-                    if delta:
-                        q.put(delta)
+                produce(cancel, q.put)
             except Exception as e:
                 q.put(f"\n[Error: {e}]\n")
             finally:
@@ -124,3 +802,199 @@ class LlamaRunner:
         th = threading.Thread(target=_worker, daemon=True)
         th.start()
         return q, cancel, th
+
+    def _start_stream(
+        self,
+        produce: Callable[[threading.Event, Callable[[str], None]], None],
+        metrics: RequestMetrics | None = None,
+    ) -> TokenStream:
+        stream = TokenStream()
+
+        def _worker():
+            try:
+                produce(stream.cancel_event, stream.put)
+            except Exception as e:
+                stream.close(e)
+            else:
+                # llama.cpp's own finish reason; cached and cancelled replies have none
+                if metrics is not None and metrics.stop_reason in ("stop", "length"):
+                    stream.finish_reason = metrics.stop_reason
+                stream.close()
+
+        stream.thread = threading.Thread(target=_worker, daemon=True)
+        stream.thread.start()
+        return stream
+
+    # ---- public streaming API ----
+    def stream_chat(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        seed: int | None = None,
+    ) -> tuple["queue.Queue[str | None]", threading.Event, threading.Thread]:
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        return self._start_queue(
+            lambda cancel, emit: self._chat_reply(
+                system_prompt, user_prompt, cancel, temperature, max_tokens, emit, seed
+            )
+        )
+
+    def stream_conversation(
+        self,
+        conversation: Conversation,
+        user_prompt: str,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+    ) -> tuple["queue.Queue[str | None]", threading.Event, threading.Thread]:
+        """
+        Like ``stream_chat`` but with history: the worker appends the user turn to
+        ``conversation``, streams the reply, then appends the (possibly partial, if
+        canceled) assistant turn.
+
+        The prompt is passed to llama.cpp as tokens built from memoized per-message
+        segments, so it extends the previous turn's evaluated tokens exactly and only the
+        new turn is prefilled. On error the user turn is rolled back.
+        """
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        return self._start_queue(
+            lambda cancel, emit: self._conversation_reply(
+                conversation, user_prompt, cancel, temperature, max_tokens, emit
+            )
+        )
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        on_delta: Callable[[str], None] | None = None,
+        seed: int | None = None,
+    ) -> str:
+        """Blocking single-turn completion on the calling thread; errors are raised."""
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        parts: list[str] = []
+
+        def emit(delta: str) -> None:
+            parts.append(delta)
+            if on_delta is not None:
+                on_delta(delta)
+
+        self._chat_reply(
+            system_prompt, user_prompt, threading.Event(), temperature, max_tokens, emit, seed
+        )
+        return "".join(parts)
+
+    def astream_chat(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        seed: int | None = None,
+        queue_wait: float = 0.0,
+    ) -> TokenStream:
+        """
+        ``stream_chat`` as an async iterator; call from the event loop. Errors are raised.
+        ``queue_wait``: seconds the request already waited in a scheduler, for metrics.
+        """
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        m = RequestMetrics("chat", queue_wait_s=queue_wait)
+        return self._start_stream(
+            lambda cancel, emit: self._chat_reply(
+                system_prompt, user_prompt, cancel, temperature, max_tokens, emit, seed, m
+            ),
+            m,
+        )
+
+    def astream_completion(
+        self,
+        prompt: str,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        seed: int | None = None,
+        queue_wait: float = 0.0,
+    ) -> TokenStream:
+        """Continue a raw text ``prompt`` (no chat template) as an async iterator."""
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        m = RequestMetrics("completion", queue_wait_s=queue_wait)
+        return self._start_stream(
+            lambda cancel, emit: self._completion_reply(
+                prompt, cancel, temperature, max_tokens, emit, seed, m
+            ),
+            m,
+        )
+
+    def astream_batched(
+        self,
+        engine: "BatchEngine",
+        prompt: str | list[int],
+        kind: str = "completion",
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        seed: int | None = None,
+        queue_wait: float = 0.0,
+    ) -> TokenStream:
+        """
+        ``astream_completion`` decoded by ``engine`` (see ``batch_engine()``) together with
+        other requests, with the same response cache and metrics (recorded as ``kind``).
+        """
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        m = RequestMetrics(kind, queue_wait_s=queue_wait)
+        return self._start_stream(
+            lambda cancel, emit: self._cached_completion(
+                prompt, cancel, temperature, max_tokens, seed, emit, metrics=m, engine=engine
+            ),
+            m,
+        )
+
+    def astream_conversation(
+        self,
+        conversation: Conversation,
+        user_prompt: str,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        queue_wait: float = 0.0,
+    ) -> TokenStream:
+        """``stream_conversation`` as an async iterator; call from the event loop."""
+        if self._llm is None:
+            raise RuntimeError("Model not loaded")
+        m = RequestMetrics("conversation", queue_wait_s=queue_wait)
+        return self._start_stream(
+            lambda cancel, emit: self._conversation_reply(
+                conversation, user_prompt, cancel, temperature, max_tokens, emit, m
+            ),
+            m,
+        )
+
+
+def snapshot_state(llm: "Llama") -> tuple[list[int], bytes, int]:
+    st = llm.save_state()
+    tokens = [int(t) for t in st.input_ids[: st.n_tokens]]
+    return tokens, st.llama_state, int(st.seed)
+
+
+def restore_state(llm: "Llama", tokens: list[int], state, seed: int = 0) -> None:
+    from llama_cpp import LlamaState
+
+    n = len(tokens)
+    input_ids = llm.input_ids.copy()
+    input_ids[:n] = tokens
+    llm.load_state(
+        LlamaState(
+            input_ids=input_ids,
+            scores=llm.scores[:n, :],
+            n_tokens=n,
+            llama_state=state,
+            llama_state_size=len(state),
+            seed=seed,
+        )
+    )
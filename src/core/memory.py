@@ -0,0 +1,279 @@
+import contextlib
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from config import (
+    DEFAULT_FIT_MEMORY,
+    DEFAULT_FLASH_ATTN,
+    DEFAULT_KV_TYPE_K,
+    DEFAULT_KV_TYPE_V,
+    DEFAULT_MEMORY_HEADROOM_MB,
+    DEFAULT_USE_MLOCK,
+    DEFAULT_USE_MMAP,
+    LLMDefaults,
+)
+from core.gguf import GGUFError, GGUFInfo, read_gguf
+from core.tuning import CGROUP, own_cgroup
+
+if TYPE_CHECKING:
+    from core.speculative import SpeculativeConfig
+
+MEMINFO = Path("/proc/meminfo")
+# KV cache type -> (ggml type id, bytes per element); most to least precise
+KV_TYPES = {
+    "f16": (1, 2.0),
+    "q8_0": (8, 34 / 32),
+    "q4_0": (2, 18 / 32),
+}
+MIN_CTX = 512
+
+
+class InsufficientMemoryError(MemoryError):
+    pass
+
+
+@dataclass(frozen=True)
+class MemorySettings:
+    """
+    How ``LlamaRunner.load`` builds a model's memory: mmap the weights (pages stay
+    file-backed, so the kernel can drop them instead of swapping), optionally mlock
+    them, and the KV cache element types. llama.cpp only supports a quantized V cache
+    with flash attention.
+    """
+
+    use_mmap: bool = DEFAULT_USE_MMAP
+    use_mlock: bool = DEFAULT_USE_MLOCK
+    type_k: str = DEFAULT_KV_TYPE_K
+    type_v: str = DEFAULT_KV_TYPE_V
+    flash_attn: bool = DEFAULT_FLASH_ATTN
+    fit: bool = DEFAULT_FIT_MEMORY
+    headroom_bytes: int = DEFAULT_MEMORY_HEADROOM_MB * 1024 * 1024
+
+    def __post_init__(self) -> None:
+        for t in (self.type_k, self.type_v):
+            if t not in KV_TYPES:
+                raise ValueError(f"KV cache type must be one of {tuple(KV_TYPES)}")
+
+    @classmethod
+    def from_defaults(cls, defaults: LLMDefaults) -> "MemorySettings":
+        return cls(
+            use_mmap=defaults.use_mmap,
+            use_mlock=defaults.use_mlock,
+            type_k=defaults.kv_type_k,
+            type_v=defaults.kv_type_v,
+            flash_attn=defaults.flash_attn,
+            fit=defaults.fit_memory,
+        )
+
+    @property
+    def uses_flash_attn(self) -> bool:
+        return self.flash_attn or self.type_v != "f16"
+
+    def llama_kwargs(self) -> dict:
+        return {
+            "use_mmap": self.use_mmap,
+            "use_mlock": self.use_mlock,
+            "type_k": KV_TYPES[self.type_k][0],
+            "type_v": KV_TYPES[self.type_v][0],
+            "flash_attn": self.uses_flash_attn,
+        }
+
+    def variant(self) -> str:
+        """Distinguishes pooled ``Llama`` instances with different KV cache setups."""
+        if (self.type_k, self.type_v, self.uses_flash_attn) == ("f16", "f16", False):
+            return ""
+        return f"kv:{self.type_k}:{self.type_v}:{int(self.uses_flash_attn)}"
+
+
+def available_memory_bytes(meminfo: Path = MEMINFO, root: Path = CGROUP) -> int | None:
+    """
+    RAM we can allocate without swapping: ``MemAvailable``, capped by what is left of
+    the cgroup memory limit (v2 ``memory.max`` or v1 ``memory.limit_in_bytes``). None
+    where neither is known (not Linux).
+    """
+    available = None
+    try:
+        for line in meminfo.read_text().splitlines():
+            if line.startswith("MemAvailable:"):
+                available = int(line.split()[1]) * 1024
+                break
+    except (OSError, ValueError):
+        pass
+    group = own_cgroup()
+    limits = [
+        (root / group, "memory.max", "memory.current"),
+        (root / "memory", "memory.limit_in_bytes", "memory.usage_in_bytes"),
+    ]
+    for d, limit_file, usage_file in limits:
+        try:
+            limit = (d / limit_file).read_text().strip()
+            usage = int((d / usage_file).read_text())
+        except (OSError, ValueError):
+            continue
+        # v1 reports "no limit" as a huge page-aligned number
+        if limit != "max" and int(limit) < 1 << 60:
+            left = max(0, int(limit) - usage)
+            available = left if available is None else min(available, left)
+        break
+    return available
+
+
+@dataclass(frozen=True)
+class MemoryEstimate:
+    weights: int
+    kv_cache: int
+    compute: int
+    # f32 logits of every context token, kept by llama-cpp-python when speculating
+    logits: int = 0
+    # a GGUF draft model: its own weights, KV cache and compute buffer
+    draft: int = 0
+    # the batch engine's second context: ``n_seq`` sequences of ``n_ctx`` tokens
+    parallel: int = 0
+
+    @property
+    def total(self) -> int:
+        base = self.weights + self.kv_cache + self.compute
+        return base + self.logits + self.draft + self.parallel
+
+
+def _context_bytes(
+    info: GGUFInfo, n_ctx: int, settings: MemorySettings, n_batch: int
+) -> tuple[int, int]:
+    kv = info.kv_cache_bytes(n_ctx, KV_TYPES[settings.type_k][1], KV_TYPES[settings.type_v][1])
+    n_ubatch = min(n_batch, n_ctx)
+    embd = info.embedding_length or 0
+    compute = n_ubatch * (embd * 4 * 4 + (info.vocab_size or 0) * 4)
+    if not settings.uses_flash_attn:
+        compute += n_ubatch * n_ctx * (info.head_count or 0) * 4
+    return kv, compute
+
+
+def estimate_peak_bytes(
+    info: GGUFInfo,
+    n_ctx: int,
+    settings: MemorySettings,
+    n_batch: int = 512,
+    speculative: "SpeculativeConfig | None" = None,
+    n_seq: int = 1,
+    draft: GGUFInfo | None = None,
+) -> MemoryEstimate:
+    """
+    Peak RAM of a loaded model: the weights from the tensor table, the KV cache for
+    ``n_ctx`` at the configured types, and a compute buffer for one ``n_batch`` eval.
+    Without flash attention that buffer holds the full f32 attention scores of the
+    batch against the context, which is what makes long contexts expensive.
+
+    With ``speculative`` on, add the ``n_ctx`` × vocab logits llama-cpp-python keeps,
+    plus the ``draft`` model (built with default f16 KV at the same ``n_ctx``). With
+    ``n_seq`` > 1, add the batch engine's context of ``n_ctx * n_seq`` tokens.
+    """
+    kv, compute = _context_bytes(info, n_ctx, settings, n_batch)
+    logits = draft_bytes = parallel = 0
+    if speculative is not None and speculative.enabled:
+        logits = n_ctx * (info.vocab_size or 0) * 4
+        if speculative.mode == "draft" and draft is not None:
+            draft_bytes = estimate_peak_bytes(draft, n_ctx, MemorySettings()).total
+    if n_seq > 1:
+        parallel = sum(_context_bytes(info, n_ctx * n_seq, settings, n_batch))
+    return MemoryEstimate(info.weights_bytes(), kv, compute, logits, draft_bytes, parallel)
+
+
+@dataclass(frozen=True)
+class MemoryPlan:
+    settings: MemorySettings
+    n_ctx: int
+    estimate: MemoryEstimate | None = None
+    available: int | None = None
+    # what was given up to fit, e.g. "KV cache q8_0/q8_0" or "ctx 8192 -> 4096"
+    changes: tuple[str, ...] = ()
+
+
+def fit_memory(
+    info: GGUFInfo,
+    n_ctx: int,
+    settings: MemorySettings,
+    available: int | None,
+    n_batch: int = 512,
+    speculative: "SpeculativeConfig | None" = None,
+    n_seq: int = 1,
+    draft: GGUFInfo | None = None,
+) -> MemoryPlan:
+    """
+    Keep ``n_ctx`` and ``settings`` if the estimate fits ``available`` minus the
+    headroom; otherwise step down until it does: q8_0 K and V (close to lossless),
+    then q4_0 V, then halve the context down to ``MIN_CTX``. Raises
+    ``InsufficientMemoryError`` when even that does not fit, rather than letting the
+    kernel kill us halfway through the load.
+    """
+
+    def estimate() -> MemoryEstimate:
+        return estimate_peak_bytes(info, n_ctx, settings, n_batch, speculative, n_seq, draft)
+
+    est = estimate()
+    if not settings.fit or available is None:
+        return MemoryPlan(settings, n_ctx, est, available)
+    budget = available - settings.headroom_bytes
+    changes: list[str] = []
+    order = list(KV_TYPES)
+
+    def step(new: MemorySettings) -> None:
+        nonlocal settings, est
+        if new != settings:
+            settings = new
+            est = estimate()
+            changes.append(f"KV cache {settings.type_k}/{settings.type_v}")
+
+    if est.total > budget:
+        step(
+            replace(
+                settings,
+                type_k=max(settings.type_k, "q8_0", key=order.index),
+                type_v=max(settings.type_v, "q8_0", key=order.index),
+                flash_attn=True,
+            )
+        )
+    if est.total > budget:
+        step(replace(settings, type_v="q4_0"))
+    requested = n_ctx
+    while est.total > budget and n_ctx > MIN_CTX:
+        n_ctx = max(MIN_CTX, n_ctx // 2)
+        est = estimate()
+    if n_ctx != requested:
+        changes.append(f"ctx {requested} -> {n_ctx}")
+    if est.total > budget:
+        raise InsufficientMemoryError(
+            f"{Path(info.path).name} needs about {est.total / 2**30:.1f} GiB even with a "
+            f"{n_ctx}-token context; {max(budget, 0) / 2**30:.1f} GiB available"
+        )
+    return MemoryPlan(settings, n_ctx, est, available, tuple(changes))
+
+
+def plan_memory(
+    path: str | Path,
+    n_ctx: int,
+    settings: MemorySettings | None = None,
+    n_batch: int = 512,
+    available: int | None = None,
+    speculative: "SpeculativeConfig | None" = None,
+    n_seq: int = 1,
+    reclaimable: int = 0,
+) -> MemoryPlan:
+    """
+    ``fit_memory`` for a model file; unparsable files are loaded as requested.
+    ``reclaimable`` bytes (e.g. pooled models that can be evicted) count as available.
+    """
+    settings = settings or MemorySettings()
+    try:
+        info = read_gguf(path)
+    except (OSError, GGUFError):
+        return MemoryPlan(settings, int(n_ctx))
+    draft = None
+    if speculative is not None and speculative.mode == "draft":
+        with contextlib.suppress(OSError, GGUFError):
+            draft = read_gguf(Path(speculative.draft_model).expanduser())
+    if available is None:
+        available = available_memory_bytes()
+    if available is not None:
+        available += reclaimable
+    return fit_memory(info, int(n_ctx), settings, available, n_batch, speculative, n_seq, draft)
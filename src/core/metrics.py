@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from config import DEFAULT_METRICS_LOG_MB
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Timings of one generation request, filled in by ``LlamaRunner`` as it runs.
+
+    ``queue_wait_s`` covers the scheduler queue (passed in by the caller) plus waiting
+    for the model lock. ``ttft_s`` runs from the start of generation to the first token,
+    i.e. prefill plus one decode step. ``prefill_s`` is measured where the runner
+    prefills explicitly (in-process models); otherwise it is estimated by subtracting
+    the average inter-token time. Tokens are counted as streamed deltas, which llama.cpp
+    emits once per token (a multi-byte character may merge two).
+    """
+
+    kind: str = "completion"
+    started_at: float = field(default_factory=time.time)
+    queue_wait_s: float = 0.0
+    prompt_tokens: int = 0
+    prefill_s: float | None = None
+    ttft_s: float | None = None
+    tokens: int = 0
+    decode_s: float = 0.0
+    total_s: float = 0.0
+    stop_reason: str | None = None
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+    _gen_start: float | None = field(default=None, repr=False)
+    _last: float | None = field(default=None, repr=False)
+
+    @property
+    def tokens_per_s(self) -> float | None:
+        """Decode rate after the first token."""
+        if self.tokens < 2 or self.decode_s <= 0:
+            return None
+        return (self.tokens - 1) / self.decode_s
+
+    # ---- recording (called by the runner on the generating thread) ----
+    def generation_started(self) -> None:
+        now = time.perf_counter()
+        self.queue_wait_s += now - self._t0
+        self._gen_start = now
+
+    def token(self) -> None:
+        now = time.perf_counter()
+        if self._gen_start is None:
+            self._gen_start = now
+        if self.ttft_s is None:
+            self.ttft_s = now - self._gen_start
+        else:
+            self.decode_s += now - self._last
+        self._last = now
+        self.tokens += 1
+
+    def prefilled(self, seconds: float) -> None:
+        self.prefill_s = seconds
+
+    def finished(self, stop_reason: str) -> None:
+        self.stop_reason = stop_reason
+        self.total_s = time.perf_counter() - self._t0
+        if self.prefill_s is None and self.ttft_s is not None:
+            itl = self.decode_s / (self.tokens - 1) if self.tokens > 1 else 0.0
+            self.prefill_s = max(0.0, self.ttft_s - itl)
+
+    # ---- reporting ----
+    def to_dict(self) -> dict:
+        d = {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+        d["tokens_per_s"] = self.tokens_per_s
+        return d
+
+    def summary(self) -> str:
+        """One line for the status bar."""
+        parts = [f"{self.tokens} tokens"]
+        if self.tokens_per_s is not None:
+            parts.append(f"{self.tokens_per_s:.1f} tok/s")
+        if self.ttft_s is not None:
+            parts.append(f"first token {self.ttft_s:.2f}s")
+        if self.prefill_s is not None:
+            parts.append(f"prefill {self.prefill_s:.2f}s ({self.prompt_tokens} prompt tokens)")
+        if self.queue_wait_s >= 0.05:
+            parts.append(f"queued {self.queue_wait_s:.1f}s")
+        if self.stop_reason:
+            parts.append(self.stop_reason)
+        return " · ".join(parts)
+
+
+class MetricsLog:
+    """
+    Appends one JSON line per request to ``path``, rotating it to ``path.1`` …
+    ``path.<backups>`` once it grows past ``max_bytes``, like
+    ``logging.handlers.RotatingFileHandler``.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = int(DEFAULT_METRICS_LOG_MB * 1024 * 1024),
+        backups: int = 3,
+    ) -> None:
+        self.path = Path(path)
+        self.max_bytes = int(max_bytes)
+        self.backups = max(0, int(backups))
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            size = self.path.stat().st_size if self.path.exists() else 0
+            if size and size + len(line) > self.max_bytes:
+                self._rotate()
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _rotate(self) -> None:
+        if self.backups == 0:
+            self.path.unlink(missing_ok=True)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                src.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+
+
+class MetricsRecorder:
+    """
+    Collects finished ``RequestMetrics``: keeps the latest, totals for
+    ``prometheus_text()``, and writes each to ``log`` when one is given.
+    """
+
+    _SUMS = ("queue_wait_s", "prefill_s", "ttft_s", "decode_s", "total_s")
+
+    def __init__(self, log: MetricsLog | None = None) -> None:
+        self.log = log
+        self.last: RequestMetrics | None = None
+        self._lock = threading.Lock()
+        self.requests: dict[str, int] = {}
+        self.prompt_tokens = 0
+        self.tokens = 0
+        self.sums = dict.fromkeys(self._SUMS, 0.0)
+        self.counts = dict.fromkeys(self._SUMS, 0)
+
+    def record(self, m: RequestMetrics) -> None:
+        with self._lock:
+            self.last = m
+            reason = m.stop_reason or "unknown"
+            self.requests[reason] = self.requests.get(reason, 0) + 1
+            self.prompt_tokens += m.prompt_tokens
+            self.tokens += m.tokens
+            for name in self._SUMS:
+                value = getattr(m, name)
+                if value is not None:
+                    self.sums[name] += value
+                    self.counts[name] += 1
+        if self.log is not None:
+            self.log.write(m.to_dict())
+
+    def prometheus_text(self) -> str:
+        """Totals in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP localai_requests_total Generation requests by stop reason.",
+                "# TYPE localai_requests_total counter",
+            ]
+            for reason, n in sorted(self.requests.items()):
+                lines.append(f'localai_requests_total{{stop_reason="{reason}"}} {n}')
+            lines += [
+                "# HELP localai_prompt_tokens_total Prompt tokens of all requests.",
+                "# TYPE localai_prompt_tokens_total counter",
+                f"localai_prompt_tokens_total {self.prompt_tokens}",
+                "# HELP localai_generated_tokens_total Tokens generated.",
+                "# TYPE localai_generated_tokens_total counter",
+                f"localai_generated_tokens_total {self.tokens}",
+            ]
+            for name in self._SUMS:
+                metric = f"localai_{name.removesuffix('_s')}_seconds"
+                lines += [
+                    f"# TYPE {metric} summary",
+                    f"{metric}_sum {self.sums[name]:.6f}",
+                    f"{metric}_count {self.counts[name]}",
+                ]
+            last = self.last.tokens_per_s if self.last is not None else None
+            lines += [
+                "# HELP localai_last_tokens_per_second Decode rate of the latest request.",
+                "# TYPE localai_last_tokens_per_second gauge",
+                f"localai_last_tokens_per_second {last or 0:.3f}",
+            ]
+        return "\n".join(lines) + "\n"
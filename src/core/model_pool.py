@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from config import DEFAULT_POOL_BUDGET_MB
+from core.gguf import estimate_model_bytes
+
+
+@dataclass
+class _Entry:
+    llm: object
+    est_bytes: int
+
+
+class ModelPool:
+    """
+    Loaded ``Llama`` instances keyed by (model file, n_ctx), kept up to a RAM budget.
+
+    Sizes are estimated from the GGUF tensor table plus the KV cache for ``n_ctx``.
+    Loading a model evicts least recently used ones until it fits; the model being
+    acquired is always admitted, even if it alone exceeds the budget, so a budget of 0
+    behaves like a single-model runner. Eviction happens before the load, so RAM holds
+    at most the budget plus the new model; if the load fails, the evicted models stay
+    out and are loaded again when next acquired. An evicted model is freed once nothing
+    else references it.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int = DEFAULT_POOL_BUDGET_MB * 1024 * 1024,
+        estimator: Callable[[str, int], int] = estimate_model_bytes,
+    ) -> None:
+        self.budget_bytes = int(budget_bytes)
+        self._estimate = estimator
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        # keys being loaded: set when done, and the estimate to reserve meanwhile
+        self._loading: dict[tuple, tuple[threading.Event, int]] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model_path: str, n_ctx: int, variant: str = "") -> tuple:
+        p = Path(model_path).resolve()
+        st = p.stat()
+        return (str(p), st.st_size, st.st_mtime_ns, int(n_ctx), variant)
+
+    def __contains__(self, key: tuple) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def acquire(
+        self, model_path: str, n_ctx: int, loader: Callable[[], object], variant: str = ""
+    ) -> object:
+        """
+        Return the pooled model for (``model_path``, ``n_ctx``, ``variant``), calling
+        ``loader`` on a miss. ``variant`` tells apart instances of the same file built
+        with different options (e.g. a speculative draft model). The pool is unlocked
+        while ``loader`` runs; other threads acquiring the same key wait for it.
+        """
+        key = self.key(model_path, n_ctx, variant)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.llm
+                pending, _ = self._loading.get(key, (None, 0))
+                if pending is None:
+                    self.misses += 1
+                    est = self._estimate(model_path, n_ctx)
+                    # make room first, so the new model never shares RAM with evicted ones
+                    self._evict_until(self.budget_bytes - est)
+                    pending = threading.Event()
+                    self._loading[key] = (pending, est)
+                    break
+            pending.wait()  # another thread is loading it; retry if that failed
+        try:
+            llm = loader()
+        except BaseException:
+            with self._lock:
+                del self._loading[key]
+            pending.set()
+            raise
+        with self._lock:
+            del self._loading[key]
+            self._evict_until(self.budget_bytes - est)
+            self._entries[key] = _Entry(llm, est)
+        pending.set()
+        return llm
+
+    def trim(self) -> None:
+        """Evict LRU models until the pool fits the budget (called when a runner unloads)."""
+        with self._lock:
+            self._evict_until(self.budget_bytes)
+
+    def release(self, nbytes: int) -> None:
+        """Evict LRU models until at least ``nbytes`` of estimated RAM is freed."""
+        with self._lock:
+            self._evict_until(self.resident_bytes() - nbytes)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_until(self, limit: int) -> None:
+        limit -= sum(est for _, est in self._loading.values())
+        while self._entries and self.resident_bytes() > limit:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(e.est_bytes for e in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "models": len(self._entries),
+                "resident_bytes": self.resident_bytes(),
+                "budget_bytes": self.budget_bytes,
+            }
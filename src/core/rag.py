@@ -0,0 +1,322 @@
+"""
+Retrieval over a local folder: files are read, split into overlapping chunks and
+embedded in batches into a ``storage.vector_index.VectorIndex``; a question's nearest
+chunks are then formatted into the user turn (see ``LlamaRunner.rag``).
+"""
+
+import hashlib
+import os
+import queue
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+from config import (
+    DEFAULT_RAG_CHUNK_CHARS,
+    DEFAULT_RAG_CHUNK_OVERLAP,
+    DEFAULT_RAG_EMBED_BATCH,
+    DEFAULT_RAG_MIN_SCORE,
+)
+from core.llm_adapter import LlamaRunner
+from paths import RAG_INDEX_DIR
+from storage.vector_index import FileEntry, VectorIndex
+
+TEXT_SUFFIXES = frozenset(
+    {".txt", ".md", ".markdown", ".rst", ".org", ".tex", ".html", ".htm", ".csv", ".json"}
+    | {".yaml", ".yml", ".toml", ".ini", ".log", ".py", ".js", ".ts", ".c", ".h", ".go", ".rs"}
+)
+# files read ahead of the embedder
+READ_AHEAD = 64
+# files indexed between saves of the index metadata
+SAVE_EVERY = 500
+# context of the embedding model's own (unused) sequence; embed() makes its own
+EMBED_N_CTX = 512
+
+CONTEXT_HEADER = "Excerpts from local documents that may help with the question below:"
+
+
+class Embedder(Protocol):
+    """Maps texts to a ``[len(texts), dim]`` float32 matrix of unit-length rows."""
+
+    name: str  # identifies the model; an index built with another one is discarded
+
+    @property
+    def dim(self) -> int: ...
+
+    def __call__(self, texts: list[str]) -> np.ndarray: ...
+
+
+class LlamaEmbedder:
+    """A GGUF embedding model behind ``LlamaRunner.embed``, loaded on first use."""
+
+    def __init__(self, model_path: str | Path, runner: LlamaRunner | None = None) -> None:
+        self.model_path = Path(model_path).expanduser().resolve()
+        st = self.model_path.stat()
+        self.name = f"{self.model_path.name}:{st.st_size}:{st.st_mtime_ns}"
+        self.runner = runner if runner is not None else LlamaRunner(inference="thread")
+        self._lock = threading.Lock()
+
+    def _loaded(self) -> LlamaRunner:
+        with self._lock:
+            if not self.runner.is_loaded():
+                self.runner.load(str(self.model_path), n_ctx=EMBED_N_CTX, embedding=True)
+        return self.runner
+
+    @property
+    def dim(self) -> int:
+        return self._loaded().n_embd()
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        return self._loaded().embed(texts, normalize=True)
+
+
+def chunk_text(
+    text: str, size: int = DEFAULT_RAG_CHUNK_CHARS, overlap: int = DEFAULT_RAG_CHUNK_OVERLAP
+) -> list[str]:
+    """
+    Split ``text`` into chunks of at most ``size`` characters, each starting ``overlap``
+    characters before the previous one ended. Cuts go at the last paragraph break, line
+    break, sentence end or space in the second half of a chunk, when there is one.
+    """
+    text = text.strip()
+    size = max(1, int(size))
+    overlap = min(max(0, int(overlap)), size // 2)
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(sep, start + size // 2, end)
+                if cut >= 0:
+                    end = cut + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        nxt = end - overlap
+        space = text.find(" ", nxt, end) if overlap else -1
+        start = max(space + 1 if space >= 0 else nxt, start + 1)  # overlap from a word start
+    return chunks
+
+
+@dataclass(frozen=True)
+class Passage:
+    path: str  # relative to the indexed folder
+    text: str
+    score: float
+
+
+@dataclass
+class IndexStats:
+    scanned: int = 0
+    added: int = 0
+    updated: int = 0
+    # changed mtime, same contents: not re-embedded
+    touched: int = 0
+    removed: int = 0
+    failed: int = 0
+    chunks: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.scanned} files: {self.added} added, {self.updated} updated, "
+            f"{self.removed} removed, {self.chunks} chunks embedded"
+        )
+
+
+def format_context(passages: list[Passage]) -> str:
+    if not passages:
+        return ""
+    parts = [CONTEXT_HEADER]
+    for i, p in enumerate(passages, 1):
+        parts.append(f"[{i}] {p.path}\n{p.text}")
+    return "\n\n".join(parts)
+
+
+def _read_ahead(items: Iterator, depth: int) -> Iterator:
+    """Run ``items`` on a thread, ``depth`` items ahead of the consumer."""
+    q: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        # gives up once the consumer has stopped, rather than blocking on a full queue
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:  # re-raised on the consumer's thread
+            put((end, e))
+            return
+        put((end, None))
+
+    threading.Thread(target=produce, name="localai-rag-read", daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if isinstance(item, tuple) and item and item[0] is end:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+class DocumentIndex:
+    """
+    Chunks of the text files under ``folder``, embedded with ``embed``, and kept in a
+    ``VectorIndex`` under ``root`` (default: one directory per folder in
+    ``RAG_INDEX_DIR``).
+
+    ``refresh()`` streams the folder through read → chunk → embed: files whose size and
+    mtime match the index are skipped without being opened, and a file whose mtime
+    changed but whose contents hash the same is not re-embedded. Reading and chunking
+    run on a thread ahead of the embedder, and chunks from several files go to
+    ``embed`` together, ``batch_size`` at a time. ``search()`` works while a refresh is
+    running, over whatever is indexed so far.
+    """
+
+    def __init__(
+        self,
+        folder: str | Path,
+        embed: Embedder,
+        root: Path | None = None,
+        chunk_chars: int = DEFAULT_RAG_CHUNK_CHARS,
+        chunk_overlap: int = DEFAULT_RAG_CHUNK_OVERLAP,
+        batch_size: int = DEFAULT_RAG_EMBED_BATCH,
+        min_score: float = DEFAULT_RAG_MIN_SCORE,
+    ) -> None:
+        self.folder = Path(folder).expanduser().resolve()
+        self.embed = embed
+        key = hashlib.sha1(str(self.folder).encode("utf-8")).hexdigest()[:16]
+        self.root = Path(root) if root is not None else RAG_INDEX_DIR / key
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = max(1, int(batch_size))
+        self.min_score = min_score
+        self._index: VectorIndex | None = None
+        self._open_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def index(self) -> VectorIndex:
+        with self._open_lock:
+            if self._index is None:
+                self._index = VectorIndex(self.root, self.embed.dim, self.embed.name)
+            return self._index
+
+    # ---- indexing ----
+    def _scan(self) -> Iterator[tuple[str, os.stat_result]]:
+        stack = [self.folder]
+        while stack:
+            d = stack.pop()
+            try:
+                with os.scandir(d) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for e in entries:
+                if e.name.startswith("."):
+                    continue
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(Path(e.path))
+                elif Path(e.name).suffix.lower() in TEXT_SUFFIXES and e.is_file():
+                    rel = Path(e.path).relative_to(self.folder).as_posix()
+                    yield rel, e.stat()
+
+    def _read(self, changed: list[tuple[str, os.stat_result]]) -> Iterator[tuple]:
+        for rel, st in changed:
+            try:
+                data = (self.folder / rel).read_bytes()
+            except OSError:
+                yield rel, st, None, None
+                continue
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            current = self._index.files.get(rel)
+            if current is not None and current.digest == digest:
+                yield rel, st, digest, None  # same contents: no need to chunk
+                continue
+            text = data.decode("utf-8", errors="replace")
+            yield rel, st, digest, chunk_text(text, self.chunk_chars, self.chunk_overlap)
+
+    def refresh(self, progress: Callable[[IndexStats], None] | None = None) -> IndexStats:
+        """Bring the index in line with the folder; returns what changed."""
+        with self._refresh_lock:
+            index = self.index
+            stats = IndexStats()
+            changed, seen = [], set()
+            for rel, st in self._scan():
+                seen.add(rel)
+                cur = index.files.get(rel)
+                if cur is None or (cur.mtime_ns, cur.size) != (st.st_mtime_ns, st.st_size):
+                    changed.append((rel, st))
+            stats.scanned = len(seen)
+            for rel in set(index.files) - seen:
+                index.remove(rel)
+                stats.removed += 1
+
+            pending: list[tuple[str, FileEntry, list[str]]] = []
+            n_pending = since_save = 0
+            for rel, st, digest, chunks in _read_ahead(self._read(changed), READ_AHEAD):
+                if digest is None:
+                    stats.failed += 1
+                    continue
+                if chunks is None:
+                    index.touch(rel, st.st_mtime_ns)
+                    stats.touched += 1
+                    continue
+                if rel in index.files:
+                    stats.updated += 1
+                else:
+                    stats.added += 1
+                pending.append((rel, FileEntry(st.st_mtime_ns, st.st_size, digest, 0, 0), chunks))
+                n_pending += len(chunks)
+                if n_pending >= self.batch_size:
+                    since_save += len(pending)
+                    self._embed_files(pending, stats)
+                    n_pending = 0
+                    if progress is not None:
+                        progress(stats)
+                    if since_save >= SAVE_EVERY:
+                        index.save()
+                        since_save = 0
+            self._embed_files(pending, stats)
+            index.save()
+            if progress is not None:
+                progress(stats)
+            return stats
+
+    def _embed_files(self, pending: list[tuple[str, FileEntry, list[str]]], stats) -> None:
+        texts = [t for _, _, chunks in pending for t in chunks]
+        dim = self.index.dim
+        vectors = np.empty((len(texts), dim), dtype=np.float32)
+        for i in range(0, len(texts), self.batch_size):
+            vectors[i : i + self.batch_size] = self.embed(texts[i : i + self.batch_size])
+        row = 0
+        for rel, entry, chunks in pending:
+            self.index.put(rel, entry, vectors[row : row + len(chunks)], chunks)
+            row += len(chunks)
+        stats.chunks += len(texts)
+        pending.clear()
+
+    # ---- retrieval ----
+    def search(self, query: str, k: int = 4) -> list[Passage]:
+        """The ``k`` chunks closest to ``query`` scoring at least ``min_score``, best first."""
+        hits = self.index.nearest(self.embed([query]), k, self.min_score)[0]
+        return [Passage(p or "", t, s) for p, t, s in hits]
@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from config import DEFAULT_QUEUE_SIZE, DEFAULT_SEND_POLICY
+
+POLICIES = ("queue", "cancel")
+ORDERINGS = ("fifo", "priority", "fair")
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+@dataclass(order=True)
+class _Job:
+    sort_key: tuple
+    run: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.perf_counter)
+
+
+class GenerationScheduler:
+    """
+    Runs generation jobs on the event loop, one at a time unless ``concurrency`` allows
+    more (e.g. when a ``BatchEngine`` can decode several sequences together).
+
+    ``policy="queue"`` lets new jobs wait their turn in a bounded queue (``maxsize``,
+    ``QueueFullError`` when full); ``policy="cancel"`` makes a new job replace the
+    running one and anything still queued. ``ordering`` is ``"fifo"`` or ``"priority"``
+    (lower value first, FIFO among equals) or ``"fair"`` (round-robin across the
+    ``client`` keys passed to ``submit``, so one client queueing many requests cannot
+    starve the others). Cancelling only cancels the job's task, which in turn signals
+    the worker thread; nothing here ever blocks the loop. Cancelling a future returned
+    by ``submit`` cancels that job whether it is queued or running.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        policy: str = DEFAULT_SEND_POLICY,
+        ordering: str = "fifo",
+        concurrency: int = 1,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        if ordering not in ORDERINGS:
+            raise ValueError(f"ordering must be one of {ORDERINGS}")
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        self.ordering = ordering
+        self.concurrency = max(1, int(concurrency))
+        self._heap: list[_Job] = []
+        self._seq = itertools.count()
+        self._running: set[asyncio.Task] = set()
+        self._pump_task: asyncio.Task | None = None
+        # seconds the last started job spent waiting in the queue
+        self.last_wait: float = 0.0
+        # fair ordering: the round being served and each client's next round
+        self._round = 0
+        self._client_round: dict[Any, int] = {}
+
+    # ---- state ----
+    @property
+    def pending(self) -> int:
+        return sum(1 for j in self._heap if not j.future.done())
+
+    @property
+    def busy(self) -> bool:
+        return any(not t.done() for t in self._running)
+
+    @property
+    def full(self) -> bool:
+        return self.maxsize > 0 and self.pending >= self.maxsize
+
+    # ---- API (call on the event loop) ----
+    def submit(
+        self, run: Callable[[], Awaitable[Any]], priority: int = 0, client: Any = None
+    ) -> asyncio.Future:
+        """Queue ``run`` (a coroutine factory); the returned future resolves to its result."""
+        if self.policy == "cancel":
+            self.cancel_all()
+        elif self.full:
+            raise QueueFullError(f"{self.pending} requests already queued")
+        loop = asyncio.get_running_loop()
+        seq = next(self._seq)
+        if self.ordering == "priority":
+            key = (priority, seq)
+        elif self.ordering == "fair":
+            start = max(self._client_round.get(client, 0), self._round)
+            self._client_round[client] = start + 1
+            key = (start, seq)
+        else:
+            key = (seq,)
+        job = _Job(key, run, loop.create_future())
+        heapq.heappush(self._heap, job)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = loop.create_task(self._pump())
+        return job.future
+
+    def cancel_current(self) -> None:
+        for task in self._running:
+            task.cancel()
+
+    def cancel_all(self) -> None:
+        for job in self._heap:
+            job.future.cancel()
+        self._heap.clear()
+        self._client_round.clear()
+        self.cancel_current()
+
+    # ---- internals ----
+    async def _pump(self) -> None:
+        while self._heap:
+            if len(self._running) >= self.concurrency:
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            job = heapq.heappop(self._heap)
+            if job.future.done():  # cancelled while queued
+                continue
+            self.last_wait = time.perf_counter() - job.enqueued_at
+            if self.ordering == "fair":
+                self._advance_round(job.sort_key[0])
+            task = asyncio.ensure_future(job.run())
+            self._running.add(task)
+            task.add_done_callback(lambda t, job=job: self._finished(job, t))
+            job.future.add_done_callback(lambda f, t=task: t.cancel() if f.cancelled() else None)
+
+    def _finished(self, job: _Job, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        if job.future.done():
+            return
+        if task.cancelled():
+            job.future.cancel()
+        elif task.exception() is not None:
+            job.future.set_exception(task.exception())
+        else:
+            job.future.set_result(task.result())
+
+    def _advance_round(self, round_: int) -> None:
+        self._round = round_
+        if len(self._client_round) > 256:
+            # clients that are not ahead of the current round carry no state
+            self._client_round = {c: r for c, r in self._client_round.items() if r > round_}
@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from config import DEFAULT_DRAFT_MODEL, DEFAULT_DRAFT_TOKENS, DEFAULT_SPECULATIVE, LLMDefaults
+
+MODES = ("off", "lookup", "draft")
+
+
+@dataclass(frozen=True)
+class SpeculativeConfig:
+    """
+    Speculative decoding for ``LlamaRunner.load``: ``"lookup"`` drafts tokens by
+    matching n-grams already in the prompt (free, and very effective when the reply
+    quotes its input, as in summaries and code edits); ``"draft"`` drafts with a small
+    GGUF (``draft_model``) sharing the main model's vocabulary. The main model verifies
+    ``draft_tokens`` drafted tokens per step in one batch.
+    """
+
+    mode: str = DEFAULT_SPECULATIVE
+    draft_model: str | None = DEFAULT_DRAFT_MODEL
+    draft_tokens: int = DEFAULT_DRAFT_TOKENS
+    max_ngram_size: int = 2
+
+    def __post_init__(self) -> None:
+        if self.mode not in MODES:
+            raise ValueError(f"speculative mode must be one of {MODES}")
+        if self.mode == "draft" and not self.draft_model:
+            raise ValueError("speculative mode 'draft' needs a draft model path")
+
+    @classmethod
+    def from_defaults(cls, defaults: LLMDefaults) -> "SpeculativeConfig":
+        return cls(defaults.speculative, defaults.draft_model, defaults.draft_tokens)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def variant(self) -> str:
+        """Distinguishes pooled ``Llama`` instances built with different drafting setups."""
+        if not self.enabled:
+            return ""
+        src = str(Path(self.draft_model).expanduser().resolve()) if self.mode == "draft" else ""
+        return f"{self.mode}:{src}:{self.draft_tokens}:{self.max_ngram_size}"
+
+
+class CountingDraftModel:
+    """
+    Wraps a llama-cpp-python draft model and estimates how many drafted tokens the main
+    model accepted: each call sees the sequence so far, so the previous draft was
+    accepted up to where it stops matching the tokens that were actually kept.
+    """
+
+    def __init__(self, inner) -> None:
+        self.inner = inner
+        self.calls = 0
+        self.drafted = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._prev_input: np.ndarray | None = None
+        self._prev_draft: np.ndarray | None = None
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        ids = np.asarray(input_ids)
+        self._settle(ids)
+        draft = np.asarray(self.inner(input_ids, **kwargs), dtype=np.intc)
+        self.calls += 1
+        self.drafted += len(draft)
+        self._prev_input = ids.copy()
+        self._prev_draft = draft
+        return draft
+
+    def _settle(self, ids: np.ndarray) -> None:
+        prev, draft = self._prev_input, self._prev_draft
+        self._prev_input = self._prev_draft = None
+        if prev is None or draft is None or not len(draft):
+            return
+        n = len(prev)
+        if len(ids) <= n or not np.array_equal(ids[:n], prev):
+            return  # a new prompt: the last draft of the previous reply was never checked
+        kept = ids[n : n + len(draft)]
+        mismatch = np.nonzero(kept != draft[: len(kept)])[0]
+        ok = int(mismatch[0]) if len(mismatch) else len(kept)
+        self.accepted += ok
+        self.rejected += len(draft) - ok
+
+    def stats(self) -> dict:
+        checked = self.accepted + self.rejected
+        return {
+            "calls": self.calls,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "acceptance_rate": self.accepted / checked if checked else 0.0,
+        }
+
+
+class GGUFDraftModel:
+    """
+    Greedy drafts from a small GGUF model, reusing its KV cache across calls.
+
+    ``Llama.scores`` is only filled when the model is built with ``logits_all=True``,
+    which costs an ``n_ctx`` × ``n_vocab`` buffer; llama.cpp keeps the last token's
+    logits either way, so drafting reads those.
+    """
+
+    def __init__(self, llm, num_pred_tokens: int) -> None:
+        self.llm = llm
+        self.num_pred_tokens = int(num_pred_tokens)
+        self._n_vocab = int(llm.n_vocab())
+
+    def _next_token(self) -> int:
+        ptr = self.llm._ctx.get_logits_ith(-1)
+        return int(np.argmax(np.ctypeslib.as_array(ptr, shape=(self._n_vocab,))))
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        llm = self.llm
+        ids = np.asarray(input_ids, dtype=np.intc)
+        if len(ids) + self.num_pred_tokens >= llm.n_ctx():
+            return np.array([], dtype=np.intc)
+        # keep the longest prefix the draft context already evaluated
+        limit = min(llm.n_tokens, len(ids))
+        diff = np.nonzero(llm.input_ids[:limit] != ids[:limit])[0]
+        common = int(diff[0]) if len(diff) else limit
+        common = min(common, len(ids) - 1)  # re-evaluate at least one token for fresh logits
+        llm.n_tokens = common
+        llm.eval(ids[common:].tolist())
+        out: list[int] = []
+        eos = llm.token_eos()
+        for i in range(self.num_pred_tokens):
+            tok = self._next_token()
+            if tok == eos:
+                break
+            out.append(tok)
+            if i + 1 < self.num_pred_tokens:
+                llm.eval([tok])
+        return np.array(out, dtype=np.intc)
+
+    def check_vocab(self, main_llm) -> None:
+        if self.llm.n_vocab() != main_llm.n_vocab():
+            raise RuntimeError(
+                f"draft model vocabulary ({self.llm.n_vocab()} tokens) does not match the "
+                f"main model ({main_llm.n_vocab()} tokens)"
+            )
+
+
+def make_draft_model(
+    config: SpeculativeConfig, n_ctx: int, n_threads: int | None = None
+) -> CountingDraftModel | None:
+    """Build the ``draft_model`` argument for ``Llama`` (None when speculation is off)."""
+    if not config.enabled:
+        return None
+    if config.mode == "lookup":
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+        inner = LlamaPromptLookupDecoding(
+            max_ngram_size=config.max_ngram_size, num_pred_tokens=config.draft_tokens
+        )
+        return CountingDraftModel(inner)
+
+    from llama_cpp import Llama
+
+    path = Path(config.draft_model).expanduser()
+    if not path.exists():
+        raise FileNotFoundError(f"Draft model not found: {path.resolve()}")
+    draft = Llama(model_path=str(path), n_ctx=int(n_ctx), n_threads=n_threads, verbose=False)
+    return CountingDraftModel(GGUFDraftModel(draft, config.draft_tokens))
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from collections import deque
+
+
+class TokenStream:
+    """
+    Async iterator over text deltas produced by a worker thread.
+
+    The producer side (``put``/``close``, callable from any thread) hands each item to the
+    event loop with ``call_soon_threadsafe``, so the loop wakes exactly when data arrives
+    instead of polling. ``close(error)`` ends the stream; a non-None ``error`` is raised
+    from the consumer's ``async for``. ``cancel()`` never blocks: it only signals the
+    producer, which stops at its next check.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self._loop = loop or asyncio.get_running_loop()
+        self._items: deque[str] = deque()
+        self._waiter: asyncio.Future | None = None
+        self._done = False
+        self._error: BaseException | None = None
+        self.cancel_event = threading.Event()
+        self.thread: threading.Thread | None = None
+        # why generation ended ("stop", "length", ...), when the producer knows
+        self.finish_reason: str | None = None
+
+    # ---- producer side (any thread) ----
+    def put(self, delta: str) -> None:
+        self._call(self._push, delta)
+
+    def close(self, error: BaseException | None = None) -> None:
+        self._call(self._finish, error)
+
+    def _call(self, fn, arg) -> None:
+        try:
+            self._loop.call_soon_threadsafe(fn, arg)
+        except RuntimeError:
+            # loop already closed (app shutting down): nobody is listening anymore
+            self.cancel_event.set()
+
+    # ---- loop side ----
+    def _push(self, delta: str) -> None:
+        self._items.append(delta)
+        self._wake()
+
+    def _finish(self, error: BaseException | None) -> None:
+        self._done = True
+        self._error = error
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done and not self._items
+
+    def __aiter__(self) -> "TokenStream":
+        return self
+
+    async def __anext__(self) -> str:
+        while not self._items:
+            if self._done:
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._items.popleft()
@@ -0,0 +1,239 @@
+import hashlib
+import math
+import os
+import platform
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from config import DEFAULT_BATCH_SIZE, DEFAULT_THREADS, DEFAULT_THREADS_BATCH
+
+SYS_CPU = Path("/sys/devices/system/cpu")
+CGROUP = Path("/sys/fs/cgroup")
+BATCH_SIZES = (64, 128, 256, 512)
+
+
+def allowed_cpus() -> set[int]:
+    """CPU ids this process may run on (its affinity mask where the OS has one)."""
+    if hasattr(os, "sched_getaffinity"):
+        return set(os.sched_getaffinity(0))
+    return set(range(os.cpu_count() or 1))
+
+
+def own_cgroup() -> str:
+    # "0::/some/group" on cgroup v2
+    try:
+        for line in Path("/proc/self/cgroup").read_text().splitlines():
+            if line.startswith("0::"):
+                return line[3:].strip().lstrip("/")
+    except OSError:
+        pass
+    return ""
+
+
+def cgroup_cpu_limit(root: Path = CGROUP, group: str | None = None) -> float | None:
+    """CPUs' worth of time the cgroup quota allows (v2 ``cpu.max`` or v1 CFS), or None."""
+    group = own_cgroup() if group is None else group
+    for d in (root / group, root) if group else (root,):
+        try:
+            quota, period = (d / "cpu.max").read_text().split()[:2]
+        except (OSError, ValueError):
+            continue
+        return int(quota) / int(period) if quota != "max" else None
+    try:
+        quota = int((root / "cpu" / "cpu.cfs_quota_us").read_text())
+        period = int((root / "cpu" / "cpu.cfs_period_us").read_text())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def physical_cores(cpus: Iterable[int], sys_cpu: Path = SYS_CPU) -> int:
+    """Distinct physical cores among ``cpus`` (SMT siblings count once)."""
+    cpus = list(cpus)
+    cores = set()
+    for cpu in cpus:
+        topo = sys_cpu / f"cpu{cpu}" / "topology"
+        try:
+            package = (topo / "physical_package_id").read_text().strip()
+            core = (topo / "core_id").read_text().strip()
+        except OSError:
+            return len(cpus)  # no topology (not Linux): assume no SMT
+        cores.add((package, core))
+    return len(cores)
+
+
+@dataclass(frozen=True)
+class CPUInfo:
+    logical: int  # CPUs in the machine
+    allowed: int  # CPUs in our affinity mask
+    physical: int  # physical cores among the allowed CPUs
+    quota: float | None  # cgroup CPU limit
+    model: str
+
+    @classmethod
+    def detect(cls) -> "CPUInfo":
+        cpus = allowed_cpus()
+        return cls(
+            logical=os.cpu_count() or len(cpus),
+            allowed=len(cpus),
+            physical=physical_cores(cpus),
+            quota=cgroup_cpu_limit(),
+            model=_cpu_model(),
+        )
+
+    @property
+    def usable(self) -> int:
+        """CPUs we can actually keep busy: the affinity mask, capped by the quota."""
+        n = self.allowed
+        if self.quota is not None:
+            n = min(n, max(1, math.floor(self.quota)))
+        return max(1, n)
+
+    def signature(self) -> str:
+        """Changes whenever the best thread counts might: CPU model, cores, limits."""
+        raw = f"{self.model}|{self.logical}|{self.allowed}|{self.physical}|{self.usable}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _cpu_model() -> str:
+    try:
+        for line in Path("/proc/cpuinfo").read_text().splitlines():
+            if line.startswith("model name"):
+                return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+@dataclass(frozen=True)
+class TuningParams:
+    n_threads: int
+    n_threads_batch: int
+    n_batch: int = 512
+
+    @classmethod
+    def defaults(cls, cpu: CPUInfo | None = None) -> "TuningParams":
+        """
+        Without calibration: decode is memory-bound and SMT siblings only contend for
+        the same core, so one thread per physical core; prefill is compute-bound and can
+        use every CPU we are allowed. Both are capped by the cgroup quota, since threads
+        beyond it just get throttled. ``LOCALAI_THREADS*``/``LOCALAI_BATCH_SIZE`` win.
+        """
+        cpu = cpu or CPUInfo.detect()
+        return cls(
+            n_threads=DEFAULT_THREADS or max(1, min(cpu.physical, cpu.usable)),
+            n_threads_batch=DEFAULT_THREADS_BATCH or cpu.usable,
+            n_batch=DEFAULT_BATCH_SIZE or 512,
+        )
+
+    def llama_kwargs(self) -> dict:
+        return {
+            "n_threads": self.n_threads,
+            "n_threads_batch": self.n_threads_batch,
+            "n_batch": self.n_batch,
+        }
+
+
+def thread_candidates(cpu: CPUInfo) -> list[int]:
+    """Powers of two up to the usable CPUs, plus the physical core and usable counts."""
+    top = cpu.usable
+    values = {1, top, max(1, min(cpu.physical, top))}
+    n = 2
+    while n < top:
+        values.add(n)
+        n *= 2
+    return sorted(values)
+
+
+# (params) -> (prefill tokens/s, decode tokens/s)
+MeasureFn = Callable[[TuningParams], tuple[float, float]]
+
+
+@dataclass
+class Calibration:
+    params: TuningParams
+    prefill_tps: float
+    decode_tps: float
+    trials: list[dict]
+
+
+def calibrate(
+    measure: MeasureFn,
+    cpu: CPUInfo | None = None,
+    batch_sizes: Iterable[int] = BATCH_SIZES,
+    log: Callable[[str], None] | None = None,
+) -> Calibration:
+    """
+    Coordinate search: first the decode thread count (with the default prefill
+    settings), then prefill threads, then ``n_batch`` for the best prefill threads.
+    Each step keeps the fastest value, so the number of trials grows with the sum, not
+    the product, of the candidate lists.
+    """
+    cpu = cpu or CPUInfo.detect()
+    base = TuningParams.defaults(cpu)
+    trials: list[dict] = []
+    cache: dict[TuningParams, tuple[float, float]] = {}
+
+    def run(params: TuningParams) -> tuple[float, float]:
+        if params not in cache:
+            cache[params] = measure(params)
+            prefill, decode = cache[params]
+            trials.append({**params.llama_kwargs(), "prefill_tps": prefill, "decode_tps": decode})
+            if log is not None:
+                log(f"{params}: prefill {prefill:.1f} tok/s, decode {decode:.1f} tok/s")
+        return cache[params]
+
+    candidates = thread_candidates(cpu)
+    n_threads = max(candidates, key=lambda n: run(replace(base, n_threads=n))[1])
+    base = replace(base, n_threads=n_threads)
+    n_threads_batch = max(candidates, key=lambda n: run(replace(base, n_threads_batch=n))[0])
+    base = replace(base, n_threads_batch=n_threads_batch)
+    n_batch = max(sorted(set(batch_sizes)), key=lambda b: run(replace(base, n_batch=b))[0])
+    best = replace(base, n_batch=n_batch)
+    prefill, decode = run(best)
+    return Calibration(best, prefill, decode, trials)
+
+
+def llama_measure(
+    model_path: str | Path, prompt_tokens: int = 256, decode_tokens: int = 16
+) -> MeasureFn:
+    """A ``MeasureFn`` that loads ``model_path`` with each candidate and times evals."""
+    from llama_cpp import Llama
+
+    def measure(params: TuningParams) -> tuple[float, float]:
+        llm = Llama(
+            model_path=str(model_path),
+            n_ctx=prompt_tokens + decode_tokens + 8,
+            verbose=False,
+            **params.llama_kwargs(),
+        )
+        try:
+            text = b"The quick brown fox jumps over the lazy dog. " * prompt_tokens
+            tokens = llm.tokenize(text)[:prompt_tokens]
+            started = time.perf_counter()
+            llm.eval(tokens)
+            prefill = len(tokens) / (time.perf_counter() - started)
+            started = time.perf_counter()
+            for _ in range(decode_tokens):
+                llm.eval([tokens[-1]])
+            decode = decode_tokens / (time.perf_counter() - started)
+        finally:
+            llm.close()
+        return prefill, decode
+
+    return measure
+
+
+def model_fingerprint(path: str | Path, chunk: int = 1 << 20) -> str:
+    """Content hash of a model file's size, head and tail (cheap even for large GGUFs)."""
+    p = Path(path)
+    size = p.stat().st_size
+    h = hashlib.sha1(str(size).encode())
+    with p.open("rb") as f:
+        h.update(f.read(chunk))
+        if size > chunk:
+            f.seek(max(chunk, size - chunk))
+            h.update(f.read(chunk))
+    return h.hexdigest()[:16]
@@ -0,0 +1,243 @@
+import contextlib
+import multiprocessing
+import threading
+import weakref
+from collections.abc import Callable, Iterator
+from typing import Any
+
+MODES = ("thread", "process")
+# crashes in a row (without a request finishing in between) before we stop restarting
+MAX_RESTARTS = 3
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+class WorkerCrashedError(WorkerError):
+    pass
+
+
+def _serve(conn, factory: Callable[[], Any]) -> None:
+    """
+    Worker process main loop: build the model with ``factory``, then answer one
+    request at a time. Streamed completions send ``("chunk", ...)`` messages and end
+    with ``("done", None)``; a ``("cancel",)`` arriving meanwhile stops the stream
+    after the current token.
+    """
+    from core.llm_adapter import restore_state, snapshot_state
+
+    try:
+        llm = factory()
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None))
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):  # parent gone
+            return
+        op, args = msg[0], msg[1:]
+        if op == "close":
+            return
+        if op == "cancel":  # arrived after the stream it was meant for had ended
+            continue
+        try:
+            if op == "tokenize":
+                conn.send(("ok", list(llm.tokenize(*args[0], **args[1]))))
+            elif op == "complete":
+                kwargs = args[0]
+                if not kwargs.get("stream"):
+                    conn.send(("ok", llm.create_completion(**kwargs)))
+                    continue
+                for chunk in llm.create_completion(**kwargs):
+                    if conn.poll() and conn.recv()[0] == "cancel":
+                        break
+                    conn.send(("chunk", chunk))
+                conn.send(("done", None))
+            elif op == "snapshot":
+                conn.send(("ok", snapshot_state(llm)))
+            elif op == "restore":
+                restore_state(llm, *args)
+                conn.send(("ok", None))
+            elif op == "n_vocab":
+                conn.send(("ok", llm.n_vocab()))
+            elif op == "speculative_stats":
+                draft = getattr(llm, "draft_model", None)
+                conn.send(("ok", draft.stats() if draft is not None else None))
+            else:
+                conn.send(("error", f"unknown request {op!r}"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _shutdown(conn, proc) -> None:
+    with contextlib.suppress(OSError, ValueError):
+        conn.send(("close",))
+    proc.join(timeout=2)
+    if proc.is_alive():
+        proc.kill()
+    conn.close()
+
+
+class RemoteLlama:
+    """
+    A ``Llama`` running in a spawned subprocess, with the subset of its interface that
+    ``LlamaRunner`` uses. Requests and token chunks travel over a ``Pipe``; the parent
+    only waits on it, so the GIL stays free for the UI while the model works, and a
+    crash in native code kills only the worker. The next request after a crash starts
+    a new worker (reloading the model) before it runs.
+
+    ``factory`` must be picklable (e.g. a ``functools.partial`` of a module-level
+    function); it is called once per worker start. Only one request runs at a time.
+    With ``start=False`` the worker is started by ``start()``, which blocks until the
+    model has loaded; ``kill()`` from another thread aborts it.
+    """
+
+    def __init__(self, factory: Callable[[], Any], start: bool = True) -> None:
+        self.factory = factory
+        self.restarts = 0
+        self._crashes = 0
+        self._lock = threading.RLock()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._conn = None
+        self._proc = None
+        self._finalizer = None
+        # kill() before the first process exists; start() honours it once
+        self._killed = False
+        self._kill_lock = threading.Lock()
+        if start:
+            self.start()
+
+    # ---- process lifecycle ----
+    def start(self) -> None:
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_serve, args=(child, self.factory), name="localai-inference", daemon=True
+        )
+        proc.start()
+        child.close()
+        with self._kill_lock:
+            self._conn, self._proc = parent, proc
+            killed, self._killed = self._killed, False
+        self._finalizer = weakref.finalize(self, _shutdown, parent, proc)
+        if killed:  # kill() came while the process was still spawning
+            proc.kill()
+        try:
+            kind, payload = parent.recv()
+        except (EOFError, OSError):
+            self._finalizer()
+            proc.join(timeout=1)
+            raise WorkerError(
+                f"inference worker exited while loading (code {proc.exitcode})"
+            ) from None
+        if kind != "ready":
+            self._finalizer()
+            raise WorkerError(payload)
+
+    @property
+    def pid(self) -> int | None:
+        return self._proc.pid if self._proc is not None else None
+
+    def is_alive(self) -> bool:
+        return self._proc is not None and self._proc.is_alive()
+
+    def kill(self) -> None:
+        """Stop the worker now, e.g. to abort a load; safe to call from any thread."""
+        with self._kill_lock:
+            proc = self._proc
+            if proc is None:
+                self._killed = True
+        if proc is not None:
+            proc.kill()
+
+    def close(self) -> None:
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def _ensure_worker(self) -> None:
+        if self.is_alive():
+            return
+        if self._crashes > MAX_RESTARTS:
+            raise WorkerError("inference worker keeps crashing; not restarting it")
+        self.close()
+        self.restarts += 1
+        self.start()
+
+    def _crashed(self) -> WorkerCrashedError:
+        self._crashes += 1
+        self._proc.join(timeout=1)
+        return WorkerCrashedError(
+            f"inference worker died (exit code {self._proc.exitcode}); it restarts on "
+            "the next request"
+        )
+
+    # ---- requests ----
+    def _recv(self) -> tuple[str, Any]:
+        try:
+            kind, payload = self._conn.recv()
+        except (EOFError, OSError):
+            raise self._crashed() from None
+        if kind == "error":
+            raise WorkerError(payload)
+        return kind, payload
+
+    def _call(self, *msg) -> Any:
+        with self._lock:
+            self._ensure_worker()
+            try:
+                self._conn.send(msg)
+            except OSError:
+                raise self._crashed() from None
+            _kind, payload = self._recv()
+            self._crashes = 0
+            return payload
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> list[int]:
+        return self._call("tokenize", (bytes(text),), {"add_bos": add_bos, "special": special})
+
+    def n_vocab(self) -> int:
+        return self._call("n_vocab")
+
+    def speculative_stats(self) -> dict | None:
+        """The worker's draft model stats, as ``LlamaRunner.speculative_stats()``."""
+        return self._call("speculative_stats")
+
+    def snapshot(self) -> tuple[list[int], bytes, int]:
+        return self._call("snapshot")
+
+    def restore(self, tokens: list[int], state, seed: int = 0) -> None:
+        self._call("restore", list(tokens), bytes(state), int(seed))
+
+    def create_completion(self, **kwargs):
+        if not kwargs.get("stream"):
+            return self._call("complete", kwargs)
+        return self._stream(kwargs)
+
+    def _stream(self, kwargs: dict) -> Iterator[dict]:
+        with self._lock:
+            self._ensure_worker()
+            self._conn.send(("complete", kwargs))
+            finished = False
+            try:
+                while True:
+                    try:
+                        kind, payload = self._recv()
+                    except WorkerError:
+                        finished = True  # nothing more is coming for this request
+                        raise
+                    if kind == "done":
+                        finished = True
+                        self._crashes = 0
+                        return
+                    yield payload
+            finally:
+                if not finished and self.is_alive():
+                    # the consumer stopped early: cancel, then drain up to the end marker
+                    self._conn.send(("cancel",))
+                    try:
+                        while self._conn.recv()[0] not in ("done", "error"):
+                            pass
+                    except (EOFError, OSError):
+                        pass
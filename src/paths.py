@@ -48,9 +48,16 @@ LLM_MODELS_DIR = ASSETS_DIR / "models" / "llm"
 
 APP_DIR = DEFAULT_APP_DIR
 OUTPUTS_DIR = APP_DIR / "outputs"
+SESSIONS_DIR = APP_DIR / "sessions"
+MODEL_INDEX_PATH = APP_DIR / "model_index.json"
+RESPONSE_CACHE_DIR = APP_DIR / "response_cache"
+METRICS_LOG_PATH = APP_DIR / "metrics.jsonl"
+TUNING_PATH = APP_DIR / "tuning.json"
+HISTORY_DB_PATH = APP_DIR / "history.sqlite3"
+RAG_INDEX_DIR = APP_DIR / "rag"
 
 
 def ensure_app_dirs() -> None:
     """Ensure application data directories exist."""
-    for p in (APP_DIR, OUTPUTS_DIR):
+    for p in (APP_DIR, OUTPUTS_DIR, SESSIONS_DIR):
         p.mkdir(parents=True, exist_ok=True)
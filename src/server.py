@@ -0,0 +1,559 @@
+"""
+OpenAI-compatible HTTP server, so local tools can share one loaded model.
+
+Serves ``POST /v1/chat/completions``, ``POST /v1/completions`` (JSON, or SSE with
+``"stream": true``), ``GET /v1/models`` and ``GET /metrics`` (Prometheus text) from a small
+asyncio HTTP/1.1 server; no web framework needed. Generations go through a
+``GenerationScheduler`` with fair ordering, so a client that queues many requests cannot
+starve the others, and a full queue answers ``429``. With ``--parallel N`` up to N
+requests share each decode step through a ``BatchEngine``. Tokens are buffered per request
+while the client drains them, so a slow reader never holds up the model. Deliberately
+does not import flet.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from config import (
+    DEFAULT_CTX_SIZE,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_METRICS_LOG,
+    DEFAULT_RESPONSE_CACHE,
+    DEFAULT_SERVER_HOST,
+    DEFAULT_SERVER_PARALLEL,
+    DEFAULT_SERVER_PORT,
+    DEFAULT_SERVER_QUEUE_SIZE,
+    DEFAULT_TEMPERATURE,
+    ENV_MODEL,
+)
+from core.batching import BatchEngine
+from core.context import ContextOverflowError
+from core.conversation import Conversation, Message
+from core.llm_adapter import LlamaRunner
+from core.metrics import MetricsLog, MetricsRecorder
+from core.scheduler import GenerationScheduler, QueueFullError
+from core.streaming import TokenStream
+from paths import LLM_MODELS_DIR, METRICS_LOG_PATH, ensure_app_dirs
+from storage.model_index import find_model
+from storage.response_cache import ResponseCache
+from storage.tuning import TuningStore
+
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_HEADERS = 100
+# how often a non-streaming request checks whether its client hung up
+DISCONNECT_POLL_S = 0.25
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# (temperature, max_tokens, seconds queued) -> stream
+StartFn = Callable[[float, int, float], TokenStream]
+
+
+class HTTPError(Exception):
+    def __init__(
+        self,
+        status: int,
+        message: str,
+        err_type: str = "invalid_request_error",
+        headers: tuple[str, ...] = (),
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        self.type = err_type
+        self.headers = headers
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    version: str
+    client: str
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+    # the connection's reader; at EOF once the client has hung up
+    reader: asyncio.StreamReader | None = field(default=None, repr=False)
+
+    @property
+    def keep_alive(self) -> bool:
+        conn = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return conn == "keep-alive"
+        return conn != "close"
+
+    def json(self) -> dict:
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError as e:
+            raise HTTPError(400, f"invalid JSON body: {e}") from None
+        if not isinstance(data, dict):
+            raise HTTPError(400, "request body must be a JSON object")
+        return data
+
+
+def _content_text(content) -> str:
+    if content is None or isinstance(content, str):
+        return content or ""
+    if isinstance(content, list):
+        return "".join(
+            p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text"
+        )
+    raise HTTPError(400, "message content must be a string or a list of text parts")
+
+
+def conversation_from_messages(messages) -> tuple[Conversation, str]:
+    """Split OpenAI ``messages`` into prior history and the user turn to answer."""
+    if not isinstance(messages, list) or not messages:
+        raise HTTPError(400, "'messages' must be a non-empty list")
+    system: list[str] = []
+    turns: list[Message] = []
+    for m in messages:
+        if not isinstance(m, dict):
+            raise HTTPError(400, "each message must be an object")
+        role = m.get("role")
+        text = _content_text(m.get("content"))
+        if role in ("system", "developer"):
+            system.append(text)
+        elif role in ("user", "assistant"):
+            turns.append(Message(role, text))
+        else:
+            raise HTTPError(400, f"unsupported role {role!r}")
+    if not turns or turns[-1].role != "user":
+        raise HTTPError(400, "the last message must be from the user")
+    return Conversation(system_prompt="\n\n".join(system), messages=turns[:-1]), turns[-1].content
+
+
+class OpenAIServer:
+    def __init__(
+        self,
+        runner: LlamaRunner,
+        scheduler: GenerationScheduler | None = None,
+        model_name: str | None = None,
+        engine: BatchEngine | None = None,
+    ) -> None:
+        self.runner = runner
+        # with an engine, up to ``engine.slots`` requests decode together in one batch
+        self.engine = engine
+        self.scheduler = scheduler or GenerationScheduler(
+            maxsize=DEFAULT_SERVER_QUEUE_SIZE, policy="queue", ordering="fair"
+        )
+        self.model_name = model_name or (
+            Path(runner.model_path).stem if runner.model_path else "local"
+        )
+        self.created = int(time.time())
+        self._server: asyncio.Server | None = None
+        self._conns: set[asyncio.StreamWriter] = set()
+
+    # ---- lifecycle ----
+    async def start(
+        self, host: str = DEFAULT_SERVER_HOST, port: int = DEFAULT_SERVER_PORT
+    ) -> asyncio.Server:
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.scheduler.cancel_all()
+        if self._server is not None:
+            self._server.close()
+        for w in list(self._conns):
+            w.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    # ---- HTTP plumbing ----
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if isinstance(peer, tuple) else str(peer)
+        self._conns.add(writer)
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader, client)
+                except HTTPError as e:
+                    await self._send_error(writer, e, keep_alive=False)
+                    break
+                if req is None or not await self._dispatch(req, writer):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self._conns.discard(writer)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader, client: str) -> Request | None:
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "malformed request line") from None
+        req = Request(method.upper(), target.split("?", 1)[0], version.upper(), client)
+        req.reader = reader
+        for _ in range(MAX_HEADERS + 1):
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = h.decode("latin-1").partition(":")
+            req.headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(400, "too many headers")
+        try:
+            length = int(req.headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "invalid Content-Length") from None
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "request body too large")
+        if length:
+            req.body = await reader.readexactly(length)
+        return req
+
+    async def _dispatch(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        """Answer one request; returns whether the connection can be reused."""
+        routes = {
+            "/v1/chat/completions": ("POST", self._chat_completions),
+            "/v1/completions": ("POST", self._completions),
+            "/v1/models": ("GET", self._models),
+            "/metrics": ("GET", self._metrics),
+        }
+        try:
+            if req.path not in routes:
+                raise HTTPError(404, f"no route for {req.path}", "not_found")
+            method, handler = routes[req.path]
+            if req.method != method:
+                raise HTTPError(405, f"use {method} for {req.path}", headers=(f"Allow: {method}",))
+            return await handler(req, writer)
+        except HTTPError as e:
+            await self._send_error(writer, e, req.keep_alive)
+            return req.keep_alive
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: list[str],
+        body: bytes = b"",
+    ) -> None:
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", *headers]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _send_json(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: dict,
+        keep_alive: bool,
+        extra: tuple[str, ...] = (),
+    ) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        headers = [
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+            *extra,
+        ]
+        await self._send(writer, status, headers, body)
+
+    async def _send_error(
+        self, writer: asyncio.StreamWriter, e: HTTPError, keep_alive: bool
+    ) -> None:
+        payload = {"error": {"message": str(e), "type": e.type, "code": e.status}}
+        await self._send_json(writer, e.status, payload, keep_alive, e.headers)
+
+    # ---- endpoints ----
+    async def _models(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        data = [{"id": self.model_name, "object": "model", "created": self.created}]
+        await self._send_json(writer, 200, {"object": "list", "data": data}, req.keep_alive)
+        return req.keep_alive
+
+    async def _metrics(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        body = self.runner.metrics.prometheus_text().encode("utf-8")
+        headers = [
+            "Content-Type: text/plain; version=0.0.4",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if req.keep_alive else 'close'}",
+        ]
+        await self._send(writer, 200, headers, body)
+        return req.keep_alive
+
+    async def _chat_completions(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        body = req.json()
+        conv, user_prompt = conversation_from_messages(body.get("messages"))
+
+        def start(temperature: float, max_tokens: int, queue_wait: float) -> TokenStream:
+            if self.engine is not None:
+                conv.add("user", user_prompt)
+                tokens = self.runner.conversation_tokens(conv, max_tokens)
+                return self.runner.astream_batched(
+                    self.engine, tokens, "chat", temperature, max_tokens, queue_wait=queue_wait
+                )
+            return self.runner.astream_conversation(
+                conv,
+                user_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                queue_wait=queue_wait,
+            )
+
+        return await self._generate(req, writer, body, start, chat=True)
+
+    async def _completions(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        body = req.json()
+        prompt = body.get("prompt")
+        if isinstance(prompt, list) and len(prompt) == 1:
+            prompt = prompt[0]
+        if not isinstance(prompt, str):
+            raise HTTPError(400, "'prompt' must be a string")
+        seed = body.get("seed")
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            raise HTTPError(400, "'seed' must be an integer")
+
+        def start(temperature: float, max_tokens: int, queue_wait: float) -> TokenStream:
+            if self.engine is not None:
+                return self.runner.astream_batched(
+                    self.engine, prompt, "completion", temperature, max_tokens, seed, queue_wait
+                )
+            return self.runner.astream_completion(
+                prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                seed=seed,
+                queue_wait=queue_wait,
+            )
+
+        return await self._generate(req, writer, body, start, chat=False)
+
+    # ---- generation ----
+    @staticmethod
+    def _params(body: dict) -> tuple[float, int, bool]:
+        temperature = body.get("temperature", DEFAULT_TEMPERATURE)
+        max_tokens = body.get("max_tokens", body.get("max_completion_tokens"))
+        if max_tokens is None:
+            max_tokens = DEFAULT_MAX_TOKENS
+        if not isinstance(temperature, int | float) or isinstance(temperature, bool):
+            raise HTTPError(400, "'temperature' must be a number")
+        if not isinstance(max_tokens, int) or isinstance(max_tokens, bool) or max_tokens < 1:
+            raise HTTPError(400, "'max_tokens' must be a positive integer")
+        return float(temperature), max_tokens, bool(body.get("stream", False))
+
+    async def _generate(
+        self,
+        req: Request,
+        writer: asyncio.StreamWriter,
+        body: dict,
+        start: StartFn,
+        chat: bool,
+    ) -> bool:
+        temperature, max_tokens, stream = self._params(body)
+        if not self.runner.is_loaded():
+            raise HTTPError(503, "model not loaded", "server_error")
+        client = body.get("user") or req.headers.get("x-client-id") or req.client
+        out: asyncio.Queue[str | None] = asyncio.Queue()
+        submitted = time.perf_counter()
+
+        async def run() -> str | None:
+            s = start(temperature, max_tokens, time.perf_counter() - submitted)
+            try:
+                async for delta in s:
+                    out.put_nowait(delta)
+            finally:
+                s.cancel()
+            return s.finish_reason
+
+        try:
+            future = self.scheduler.submit(run, client=client)
+        except QueueFullError as e:
+            raise HTTPError(
+                429, f"server busy: {e}", "rate_limit_exceeded", ("Retry-After: 1",)
+            ) from None
+        future.add_done_callback(lambda _f: out.put_nowait(None))
+
+        rid = f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex}"
+        obj = "chat.completion" if chat else "text_completion"
+        created = int(time.time())
+
+        def envelope(choice: dict, chunk: bool) -> dict:
+            kind = f"{obj}.chunk" if chunk and chat else obj
+            choice = {"index": 0, **choice}
+            return {
+                "id": rid,
+                "object": kind,
+                "created": created,
+                "model": self.model_name,
+                "choices": [choice],
+            }
+
+        try:
+            if stream:
+                return await self._stream_response(writer, out, future, envelope, chat, max_tokens)
+            parts: list[str] = []
+            while (delta := await self._next_delta(req, writer, out)) is not None:
+                parts.append(delta)
+        except BaseException:
+            future.cancel()
+            raise
+        if future.cancelled():
+            raise HTTPError(503, "request cancelled", "server_error")
+        if isinstance(future.exception(), ContextOverflowError):
+            raise HTTPError(400, str(future.exception()), "context_length_exceeded")
+        if future.exception() is not None:
+            raise HTTPError(500, f"generation failed: {future.exception()}", "server_error")
+        text = "".join(parts)
+        finish = future.result() or ("length" if len(parts) >= max_tokens else "stop")
+        if chat:
+            choice = {"message": {"role": "assistant", "content": text}, "finish_reason": finish}
+        else:
+            choice = {"text": text, "finish_reason": finish, "logprobs": None}
+        await self._send_json(writer, 200, envelope(choice, chunk=False), req.keep_alive)
+        return req.keep_alive
+
+    @staticmethod
+    async def _next_delta(
+        req: Request, writer: asyncio.StreamWriter, out: "asyncio.Queue[str | None]"
+    ) -> str | None:
+        """
+        ``out.get()`` for a reply sent all at once: nothing is written until it is done,
+        so a client that hangs up is only noticed by watching the connection, and then
+        ``ConnectionResetError`` cancels the generation instead of running to max_tokens.
+        """
+
+        def gone() -> bool:
+            return writer.is_closing() or (req.reader is not None and req.reader.at_eof())
+
+        get = asyncio.ensure_future(out.get())
+        while not gone():
+            done, _ = await asyncio.wait({get}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return get.result()
+        get.cancel()
+        raise ConnectionResetError("client disconnected")
+
+    async def _stream_response(
+        self,
+        writer: asyncio.StreamWriter,
+        out: "asyncio.Queue[str | None]",
+        future: asyncio.Future,
+        envelope: Callable[[dict, bool], dict],
+        chat: bool,
+        max_tokens: int,
+    ) -> bool:
+        headers = [
+            "Content-Type: text/event-stream",
+            "Cache-Control: no-cache",
+            "Connection: close",
+        ]
+        await self._send(writer, 200, headers)
+
+        async def event(payload) -> None:
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            writer.write(f"data: {data}\n\n".encode())
+            # waits while the socket buffer is full; the model keeps going meanwhile
+            await writer.drain()
+
+        if chat:
+            delta = {"role": "assistant", "content": ""}
+            await event(envelope({"delta": delta, "finish_reason": None}, True))
+        n = 0
+        while (delta := await out.get()) is not None:
+            n += 1
+            if chat:
+                choice = {"delta": {"content": delta}, "finish_reason": None}
+            else:
+                choice = {"text": delta, "finish_reason": None, "logprobs": None}
+            await event(envelope(choice, True))
+        if future.cancelled():
+            return False
+        if future.exception() is not None:
+            err = {"message": f"generation failed: {future.exception()}", "type": "server_error"}
+            await event({"error": err})
+            return False
+        finish = future.result() or ("length" if n >= max_tokens else "stop")
+        last = {"delta": {}} if chat else {"text": "", "logprobs": None}
+        await event(envelope({**last, "finish_reason": finish}, True))
+        await event("[DONE]")
+        return False
+
+
+async def _serve(server: OpenAIServer, host: str, port: int) -> None:
+    srv = await server.start(host, port)
+    print(f"Serving {server.model_name} on http://{host}:{server.port}/v1", file=sys.stderr)
+    async with srv:
+        await srv.serve_forever()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a GGUF model over an OpenAI-style API.")
+    parser.add_argument("--model", default=os.environ.get(ENV_MODEL), help="GGUF model path")
+    parser.add_argument("--host", default=DEFAULT_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT)
+    parser.add_argument("--ctx", type=int, default=DEFAULT_CTX_SIZE)
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_SERVER_QUEUE_SIZE,
+        help="Requests allowed to wait for the model before answering 429",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=DEFAULT_SERVER_PARALLEL,
+        help="Requests decoded together in one batch (1 = one at a time)",
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=DEFAULT_RESPONSE_CACHE,
+        help="Replay replies to requests that were already answered",
+    )
+    args = parser.parse_args(argv)
+
+    ensure_app_dirs()
+    model = find_model(args.model)
+    if model is None:
+        print(f"No GGUF models found in: {LLM_MODELS_DIR}", file=sys.stderr)
+        return 2
+    runner = LlamaRunner(
+        cache=ResponseCache() if args.cache else None,
+        metrics=MetricsRecorder(MetricsLog(METRICS_LOG_PATH) if DEFAULT_METRICS_LOG else None),
+        tuning=TuningStore(),
+    )
+    runner.load(str(model), n_ctx=args.ctx, parallel=args.parallel)
+    engine = runner.batch_engine(args.parallel) if args.parallel > 1 else None
+    scheduler = GenerationScheduler(
+        maxsize=args.queue_size, policy="queue", ordering="fair", concurrency=args.parallel
+    )
+    server = OpenAIServer(runner, scheduler, model_name=model.stem, engine=engine)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(_serve(server, args.host, args.port))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
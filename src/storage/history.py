@@ -0,0 +1,316 @@
+import contextlib
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from config import DEFAULT_HISTORY_FLUSH_MS
+from paths import HISTORY_DB_PATH
+
+SCHEMA_VERSION = 1
+# characters of the first user message kept as a conversation's title
+TITLE_CHARS = 80
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updated);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (conversation_id, seq)
+);
+"""
+
+# external-content FTS5 table over messages.content, kept in sync by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+_UPSERT_MESSAGE = """
+INSERT INTO messages (conversation_id, seq, role, content, created) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (conversation_id, seq) DO UPDATE SET content = excluded.content
+WHERE content != excluded.content
+"""
+
+_UPSERT_CONVERSATION = """
+INSERT INTO conversations (id, title, created, updated) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    updated = max(updated, excluded.updated),
+    title = CASE WHEN title = '' THEN excluded.title ELSE title END
+"""
+
+
+@dataclass(frozen=True)
+class StoredMessage:
+    conversation_id: str
+    seq: int
+    role: str
+    content: str
+    created: float
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    conversation_id: str
+    seq: int
+    role: str
+    # the matching part of the message, terms wrapped in ``[`` ``]``
+    snippet: str
+    created: float
+
+
+@dataclass(frozen=True)
+class ConversationSummary:
+    id: str
+    title: str
+    created: float
+    updated: float
+    messages: int
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = [w.replace('"', '""') for w in text.split()]
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class HistoryStore:
+    """
+    Every chat message, in a SQLite database with an FTS5 index over the text.
+
+    ``append()`` and ``update()`` only queue the write and return. A writer thread
+    commits whatever has queued up within ``flush_s`` of the first write in one
+    transaction, with later updates to the same message collapsed into one row write.
+    The database is in WAL mode with ``synchronous=NORMAL``, so commits do not fsync.
+    Reads (``page``, ``search``, ...) use their own connection and see committed
+    writes only; ``flush()`` waits for the queue to drain.
+    """
+
+    def __init__(
+        self, path: Path = HISTORY_DB_PATH, flush_s: float = DEFAULT_HISTORY_FLUSH_MS / 1000
+    ) -> None:
+        self.path = Path(path)
+        self.flush_s = max(0.0, float(flush_s))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._read = self._connect()
+        self._read_lock = threading.Lock()
+        self.fts = self._create_schema(self._read)
+        self._seq: dict[str, int] = {}
+        self._seq_lock = threading.Lock()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.commits = 0
+        self.last_error: Exception | None = None
+        self._writer = threading.Thread(
+            target=self._write_loop, args=(self._connect(),), name="localai-history", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> bool:
+        """Create the tables; returns False where this SQLite build lacks FTS5."""
+        conn.executescript(_SCHEMA)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        try:
+            conn.executescript(_FTS_SCHEMA)
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    # ---- writes (queued) ----
+    def append(self, conversation_id: str, role: str, content: str) -> int:
+        """Queue a new message at the end of the conversation; returns its ``seq``."""
+        with self._seq_lock:
+            seq = self._seq.get(conversation_id)
+            if seq is None:
+                seq = self.count(conversation_id)
+            self._seq[conversation_id] = seq + 1
+        self._queue.put(("put", conversation_id, seq, role, content, time.time()))
+        return seq
+
+    def update(self, conversation_id: str, seq: int, content: str) -> None:
+        """Queue new text for a message, e.g. a reply while it streams."""
+        self._queue.put(("put", conversation_id, seq, None, content, time.time()))
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        with self._seq_lock:
+            self._seq[conversation_id] = 0
+        self._queue.put(("delete", conversation_id))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until everything queued so far is committed."""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._queue.put(("close",))
+            self._writer.join()
+        with self._read_lock:
+            self._read.close()
+
+    # ---- writer thread ----
+    def _write_loop(self, conn: sqlite3.Connection) -> None:
+        try:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.flush_s
+                while batch[-1][0] not in ("flush", "close"):
+                    try:
+                        batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                self._commit(conn, batch)
+                for op in batch:
+                    if op[0] == "flush":
+                        op[1].set()
+                if batch[-1][0] == "close":
+                    return
+        finally:
+            with contextlib.suppress(sqlite3.Error):
+                conn.execute("PRAGMA optimize")
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list[tuple]) -> None:
+        # (conversation_id, seq) -> [role, content, created]; the first put decides the
+        # role and creation time, the last one the content
+        puts: dict[tuple[str, int], list] = {}
+        if not any(op[0] in ("put", "delete") for op in batch):
+            return
+        try:
+            conn.execute("BEGIN")
+            for op in batch:
+                if op[0] == "put":
+                    _, conv, seq, role, content, created = op
+                    cur = puts.get((conv, seq))
+                    if cur is None:
+                        puts[(conv, seq)] = [role, content, created]
+                    else:
+                        cur[0] = cur[0] or role
+                        cur[1] = content
+                elif op[0] == "delete":
+                    self._write_puts(conn, puts)
+                    conn.execute("DELETE FROM messages WHERE conversation_id = ?", (op[1],))
+                    conn.execute("DELETE FROM conversations WHERE id = ?", (op[1],))
+            self._write_puts(conn, puts)
+            conn.execute("COMMIT")
+            self.commits += 1
+        except sqlite3.Error as e:
+            self.last_error = e
+            with contextlib.suppress(sqlite3.Error):
+                conn.execute("ROLLBACK")
+
+    @staticmethod
+    def _write_puts(conn: sqlite3.Connection, puts: dict[tuple[str, int], list]) -> None:
+        if not puts:
+            return
+        inserts = [(c, s, r, t, at) for (c, s), (r, t, at) in puts.items() if r]
+        updates = [(t, c, s) for (c, s), (r, t, _at) in puts.items() if not r]
+        conn.executemany(_UPSERT_MESSAGE, inserts)
+        conn.executemany(
+            "UPDATE messages SET content = ? WHERE conversation_id = ? AND seq = ?", updates
+        )
+        convs: dict[str, list] = {}
+        for (c, _s), (r, t, at) in puts.items():
+            title = t[:TITLE_CHARS] if r == "user" else ""
+            cur = convs.setdefault(c, [title, at, at])
+            cur[0] = cur[0] or title
+            cur[2] = max(cur[2], at)
+        conn.executemany(_UPSERT_CONVERSATION, [(c, *v) for c, v in convs.items()])
+        puts.clear()
+
+    # ---- reads ----
+    def _query(self, sql: str, args: tuple = ()) -> list[tuple]:
+        with self._read_lock:
+            return self._read.execute(sql, args).fetchall()
+
+    def count(self, conversation_id: str) -> int:
+        """Number of messages stored for the conversation (its next ``seq``)."""
+        rows = self._query(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation_id = ?",
+            (conversation_id,),
+        )
+        return rows[0][0]
+
+    def page(
+        self, conversation_id: str, before: int | None = None, limit: int = 50
+    ) -> list[StoredMessage]:
+        """Up to ``limit`` messages before ``seq`` ``before`` (default: the end), oldest first."""
+        rows = self._query(
+            "SELECT seq, role, content, created FROM messages"
+            " WHERE conversation_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (conversation_id, before if before is not None else 2**62, int(limit)),
+        )
+        return [StoredMessage(conversation_id, *row) for row in reversed(rows)]
+
+    def conversations(self, limit: int = 50) -> list[ConversationSummary]:
+        """The most recently updated conversations first."""
+        rows = self._query(
+            "SELECT c.id, c.title, c.created, c.updated,"
+            " (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = c.id)"
+            " FROM conversations c ORDER BY c.updated DESC LIMIT ?",
+            (int(limit),),
+        )
+        return [ConversationSummary(*row) for row in rows]
+
+    def search(
+        self, text: str, limit: int = 20, conversation_id: str | None = None
+    ) -> list[SearchHit]:
+        """
+        Messages containing every word of ``text`` (the last one as a prefix), best
+        matches first. Falls back to a slow substring scan without FTS5.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        where, args = "", [query]
+        if conversation_id is not None:
+            where, args = " AND m.conversation_id = ?", [query, conversation_id]
+        if self.fts:
+            sql = (
+                "SELECT m.conversation_id, m.seq, m.role,"
+                " snippet(messages_fts, 0, '[', ']', '…', 12), m.created"
+                " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+                f" WHERE messages_fts MATCH ?{where} ORDER BY rank LIMIT ?"
+            )
+        else:
+            args[0] = f"%{text.strip()}%"
+            sql = (
+                "SELECT m.conversation_id, m.seq, m.role, m.content, m.created FROM messages m"
+                f" WHERE m.content LIKE ?{where} ORDER BY m.created DESC LIMIT ?"
+            )
+        return [SearchHit(*row) for row in self._query(sql, (*args, int(limit)))]
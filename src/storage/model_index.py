@@ -0,0 +1,180 @@
+import json
+import os
+from dataclasses import asdict, fields
+from pathlib import Path
+
+from core.gguf import GGUFError, GGUFInfo, read_gguf
+from paths import LLM_MODELS_DIR, MODEL_INDEX_PATH
+
+INDEX_VERSION = 2
+_INFO_FIELDS = {f.name for f in fields(GGUFInfo)}
+
+
+class ModelIndex:
+    """
+    Persistent catalogue of GGUF files under ``roots`` with their header metadata.
+
+    ``refresh()`` is incremental: a directory is only re-listed when its mtime changed,
+    and a file is only re-parsed when its size or mtime changed, so a warm refresh is a
+    handful of ``stat`` calls instead of a recursive walk plus header reads.
+    """
+
+    def __init__(self, path: Path = MODEL_INDEX_PATH, roots: list[Path] | None = None) -> None:
+        self.path = Path(path)
+        self.roots = [Path(r) for r in (roots if roots is not None else [LLM_MODELS_DIR])]
+        self._dirs: dict[str, dict] = {}
+        self._models: dict[str, GGUFInfo] = {}
+        self._invalid: dict[str, list[int]] = {}  # path -> [size, mtime_ns] of unreadable files
+        self._dirty = False
+        self._load()
+
+    # ---- persistence ----
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION:
+            return
+        self._dirs = data.get("dirs", {})
+        self._invalid = data.get("invalid", {})
+        for p, d in data.get("models", {}).items():
+            self._models[p] = GGUFInfo(**{k: v for k, v in d.items() if k in _INFO_FIELDS})
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "dirs": self._dirs,
+            "invalid": self._invalid,
+            "models": {p: asdict(info) for p, info in self._models.items()},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    # ---- refresh ----
+    def refresh(self) -> None:
+        seen_dirs: set[str] = set()
+        seen_files: set[str] = set()
+        for root in self.roots:
+            if root.is_dir():
+                self._scan_dir(root.resolve(), seen_dirs, seen_files)
+        for d in set(self._dirs) - seen_dirs:
+            del self._dirs[d]
+            self._dirty = True
+        for p in set(self._models) - seen_files:
+            del self._models[p]
+            self._dirty = True
+        for p in set(self._invalid) - seen_files:
+            del self._invalid[p]
+            self._dirty = True
+        self.save()
+
+    def _scan_dir(self, d: Path, seen_dirs: set[str], seen_files: set[str]) -> None:
+        key = str(d)
+        seen_dirs.add(key)
+        try:
+            mtime = d.stat().st_mtime_ns
+        except OSError:
+            return
+        rec = self._dirs.get(key)
+        if rec is None or rec["mtime_ns"] != mtime:
+            files, subdirs = [], []
+            with os.scandir(d) as it:
+                for e in it:
+                    if e.is_dir():
+                        subdirs.append(e.name)
+                    elif e.name.endswith(".gguf") and e.is_file():
+                        files.append(e.name)
+            rec = self._dirs[key] = {"mtime_ns": mtime, "files": files, "subdirs": subdirs}
+            self._dirty = True
+        for name in rec["files"]:
+            self._check_file(d / name, seen_files)
+        for name in rec["subdirs"]:
+            self._scan_dir(d / name, seen_dirs, seen_files)
+
+    def _check_file(self, p: Path, seen_files: set[str]) -> None:
+        key = str(p)
+        try:
+            st = p.stat()
+        except OSError:
+            return
+        seen_files.add(key)
+        cur = self._models.get(key)
+        if cur is not None and (cur.size, cur.mtime_ns) == (st.st_size, st.st_mtime_ns):
+            return
+        if self._invalid.get(key) == [st.st_size, st.st_mtime_ns]:
+            return
+        self._dirty = True
+        try:
+            self._models[key] = read_gguf(p)
+            self._invalid.pop(key, None)
+        except (OSError, GGUFError):
+            self._models.pop(key, None)
+            self._invalid[key] = [st.st_size, st.st_mtime_ns]
+
+    # ---- queries ----
+    def get(self, path: str | Path) -> GGUFInfo | None:
+        return self._models.get(str(Path(path).resolve()))
+
+    def entries(self) -> list[GGUFInfo]:
+        return sorted(self._models.values(), key=lambda i: i.path)
+
+    def query(
+        self,
+        architecture: str | None = None,
+        quantization: str | None = None,
+        min_ctx: int | None = None,
+        chat_template: bool | None = None,
+        max_size: int | None = None,
+        name: str | None = None,
+    ) -> list[GGUFInfo]:
+        """Filter indexed models; string filters are case-insensitive (``name`` is a substring)."""
+        out = []
+        for info in self.entries():
+            if architecture and (info.architecture or "").lower() != architecture.lower():
+                continue
+            if quantization and (info.quantization or "").lower() != quantization.lower():
+                continue
+            if min_ctx and (info.context_length or 0) < min_ctx:
+                continue
+            if chat_template is not None and bool(info.chat_template) != chat_template:
+                continue
+            if max_size is not None and info.size > max_size:
+                continue
+            if name and name.lower() not in f"{info.name or ''} {info.path}".lower():
+                continue
+            out.append(info)
+        return out
+
+    def best(self, **filters) -> GGUFInfo | None:
+        """Pick a chat model: prefer ones that ship a chat template, then the smallest weights."""
+        matches = self.query(**filters)
+        if not matches:
+            return None
+        return min(matches, key=lambda i: (not i.chat_template, i.weights_bytes(), i.path))
+
+
+def find_model(
+    explicit: str | Path | None = None,
+    root: Path | None = None,
+    index_path: Path | None = None,
+    **filters,
+) -> Path | None:
+    """
+    ``explicit`` if given, else the best chat model under ``root`` (default
+    ``LLM_MODELS_DIR``) matching ``filters`` (see ``ModelIndex.query``).
+    """
+    if explicit:
+        return Path(explicit).expanduser()
+    root = Path(root) if root is not None else LLM_MODELS_DIR
+    if not root.exists():
+        return None
+    index = ModelIndex(index_path or MODEL_INDEX_PATH, roots=[root])
+    index.refresh()
+    info = index.best(**filters)
+    return Path(info.path) if info else None
@@ -0,0 +1,143 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from config import DEFAULT_RESPONSE_CACHE_ENTRIES, DEFAULT_RESPONSE_CACHE_MB
+from paths import RESPONSE_CACHE_DIR
+from storage.sessions import model_key
+
+SUFFIX = ".json"
+FORMAT_VERSION = 1
+
+
+class ResponseCache:
+    """
+    Completed replies keyed by (model file, rendered prompt, sampling params).
+
+    Replies are stored as the list of streamed deltas so a hit can be replayed through
+    the same streaming path as a real generation. The most recent ``max_entries`` live in
+    an in-memory LRU; every entry is also written to ``root`` (one JSON file per key,
+    fanned out by key prefix), touched on read, and the least recently used files are
+    deleted once the directory grows past ``budget_bytes``.
+    """
+
+    def __init__(
+        self,
+        root: Path = RESPONSE_CACHE_DIR,
+        max_entries: int = DEFAULT_RESPONSE_CACHE_ENTRIES,
+        budget_bytes: int = DEFAULT_RESPONSE_CACHE_MB * 1024 * 1024,
+    ) -> None:
+        self.root = Path(root)
+        self.max_entries = int(max_entries)
+        self.budget_bytes = int(budget_bytes)
+        self._mem: OrderedDict[str, list[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: int | None = None  # computed on first write
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def key(model_path: str | Path, n_ctx: int, prompt: str | list[int], params: dict) -> str:
+        raw = json.dumps(
+            {"model": model_key(model_path, n_ctx), "prompt": prompt, "params": params},
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{SUFFIX}"
+
+    # ---- API ----
+    def get(self, key: str) -> list[str] | None:
+        with self._lock:
+            deltas = self._mem.get(key)
+            if deltas is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return list(deltas)
+        p = self.path_for(key)
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+            deltas = data["deltas"] if data.get("v") == FORMAT_VERSION else None
+        except (OSError, ValueError, KeyError, AttributeError):
+            deltas = None
+        with self._lock:
+            if deltas is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, deltas)
+        with contextlib.suppress(OSError):
+            os.utime(p)
+        return list(deltas)
+
+    def put(self, key: str, deltas: list[str]) -> None:
+        deltas = list(deltas)
+        p = self.path_for(key)
+        body = json.dumps({"v": FORMAT_VERSION, "deltas": deltas}, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, deltas)
+            self.stores += 1
+            old = p.stat().st_size if p.exists() else 0
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(".tmp")
+            tmp.write_text(body, encoding="utf-8")
+            os.replace(tmp, p)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_bytes()
+            else:
+                self._disk_bytes += p.stat().st_size - old
+            if self._disk_bytes > self.budget_bytes:
+                self._evict(keep=p)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            for p in self._files():
+                p.unlink(missing_ok=True)
+            self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "entries": len(self._mem),
+                "disk_bytes": self._disk_bytes
+                if self._disk_bytes is not None
+                else self._scan_bytes(),
+            }
+
+    # ---- internals (call with the lock held) ----
+    def _remember(self, key: str, deltas: list[str]) -> None:
+        self._mem[key] = deltas
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _files(self) -> list[Path]:
+        if not self.root.exists():
+            return []
+        return list(self.root.glob(f"*/*{SUFFIX}"))
+
+    def _scan_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self._files())
+
+    def _evict(self, keep: Path) -> None:
+        files = sorted(self._files(), key=lambda p: p.stat().st_mtime)
+        for p in files:
+            if self._disk_bytes <= self.budget_bytes:
+                break
+            if p == keep:
+                continue
+            self._disk_bytes -= p.stat().st_size
+            p.unlink(missing_ok=True)
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+
+from config import DEFAULT_SESSION_BUDGET_MB
+from paths import SESSIONS_DIR
+
+MAGIC = b"LLSESS1\n"
+SUFFIX = ".llsession"
+_HEADER_LEN = struct.Struct("<I")
+
+
+def model_key(
+    model_path: str | Path,
+    n_ctx: int,
+    type_k: str = "f16",
+    type_v: str = "f16",
+    flash_attn: bool = False,
+) -> str:
+    """
+    Identify a model file, context size and KV cache layout (element types and flash
+    attention, which ``core.memory`` may change to fit RAM); snapshots are only valid
+    for the same ones.
+    """
+    p = Path(model_path).expanduser().resolve()
+    st = p.stat()
+    raw = f"{p}|{st.st_size}|{st.st_mtime_ns}|{int(n_ctx)}"
+    if (type_k, type_v, bool(flash_attn)) != ("f16", "f16", False):
+        raw += f"|{type_k}|{type_v}|{int(bool(flash_attn))}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class Snapshot:
+    """A restored session. ``state`` is a view into the mmapped file; call ``close()`` after use."""
+
+    conversation_id: str
+    tokens: list[int]
+    state: memoryview
+    meta: dict
+    _mm: mmap.mmap
+
+    def close(self) -> None:
+        self.state.release()
+        self._mm.close()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SessionStore:
+    """
+    Llama context snapshots (KV cache + evaluated tokens) on disk, one file per
+    (conversation, model key). File layout:
+
+        MAGIC | u32 header length | JSON header | int32 tokens | raw llama state
+
+    Loading mmaps the file so the state bytes go straight from the page cache into
+    llama.cpp. Files are touched on load, and the least recently used ones are deleted
+    whenever the directory grows past ``budget_bytes``.
+    """
+
+    def __init__(
+        self,
+        root: Path = SESSIONS_DIR,
+        budget_bytes: int = DEFAULT_SESSION_BUDGET_MB * 1024 * 1024,
+    ) -> None:
+        self.root = Path(root)
+        self.budget_bytes = int(budget_bytes)
+
+    def path_for(self, conversation_id: str, key: str) -> Path:
+        return self.root / f"{conversation_id}-{key}{SUFFIX}"
+
+    def save(
+        self,
+        conversation_id: str,
+        key: str,
+        tokens: list[int],
+        state: bytes,
+        meta: dict | None = None,
+    ) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        header = json.dumps(
+            {
+                "conversation_id": conversation_id,
+                "model_key": key,
+                "n_tokens": len(tokens),
+                "state_size": len(state),
+                "meta": meta or {},
+            }
+        ).encode("utf-8")
+        path = self.path_for(conversation_id, key)
+        tmp = path.with_suffix(SUFFIX + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            f.write(struct.pack(f"<{len(tokens)}i", *tokens))
+            f.write(state)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+        return path
+
+    def load(self, conversation_id: str, key: str) -> Snapshot | None:
+        path = self.path_for(conversation_id, key)
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        except ValueError:  # empty file
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            header, tokens, start = self._parse(mm)
+            end = start + int(header["state_size"])
+            if end > len(mm):
+                raise ValueError("truncated snapshot")
+        except (ValueError, KeyError, struct.error):
+            # corrupt or partial file: drop it rather than fail the chat
+            mm.close()
+            path.unlink(missing_ok=True)
+            return None
+        with memoryview(mm) as view:
+            state = view[start:end]
+        os.utime(path)
+        return Snapshot(conversation_id, tokens, state, header.get("meta", {}), mm)
+
+    @staticmethod
+    def _parse(mm: mmap.mmap) -> tuple[dict, list[int], int]:
+        if mm[: len(MAGIC)] != MAGIC:
+            raise ValueError("bad magic")
+        pos = len(MAGIC)
+        (hlen,) = _HEADER_LEN.unpack_from(mm, pos)
+        pos += _HEADER_LEN.size
+        header = json.loads(mm[pos : pos + hlen])
+        pos += hlen
+        n_tokens = int(header["n_tokens"])
+        tokens = list(struct.unpack_from(f"<{n_tokens}i", mm, pos))
+        return header, tokens, pos + 4 * n_tokens
+
+    def latest(self, key: str) -> str | None:
+        """Conversation id of the most recently used snapshot for ``key``."""
+        suffix = f"-{key}{SUFFIX}"
+        best: tuple[float, str] | None = None
+        for p in self._files():
+            if p.name.endswith(suffix):
+                mtime = p.stat().st_mtime
+                if best is None or mtime > best[0]:
+                    best = (mtime, p.name[: -len(suffix)])
+        return best[1] if best else None
+
+    def delete(self, conversation_id: str, key: str) -> None:
+        self.path_for(conversation_id, key).unlink(missing_ok=True)
+
+    def total_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self._files())
+
+    def evict(self, keep: Path | None = None) -> list[Path]:
+        """Delete least recently used snapshots until the store fits the budget."""
+        files = sorted(self._files(), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        removed = []
+        for p in files:
+            if total <= self.budget_bytes:
+                break
+            if keep is not None and p == keep:
+                continue
+            total -= p.stat().st_size
+            p.unlink(missing_ok=True)
+            removed.append(p)
+        return removed
+
+    def _files(self) -> list[Path]:
+        if not self.root.exists():
+            return []
+        return [p for p in self.root.iterdir() if p.suffix == SUFFIX]
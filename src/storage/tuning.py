@@ -0,0 +1,53 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from core.tuning import Calibration, TuningParams
+from paths import TUNING_PATH
+
+TUNING_VERSION = 1
+
+
+class TuningStore:
+    """
+    Calibrated ``TuningParams`` keyed by (model fingerprint, CPU signature), in one JSON
+    file. A different CPU, affinity mask or cgroup quota changes the signature, so
+    settings measured elsewhere are never reused.
+    """
+
+    def __init__(self, path: Path = TUNING_PATH) -> None:
+        self.path = Path(path)
+        self._entries: dict[str, dict] = {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") == TUNING_VERSION:
+            self._entries = data.get("entries", {})
+
+    @staticmethod
+    def _key(model_fingerprint: str, cpu_signature: str) -> str:
+        return f"{model_fingerprint}|{cpu_signature}"
+
+    def get(self, model_fingerprint: str, cpu_signature: str) -> TuningParams | None:
+        entry = self._entries.get(self._key(model_fingerprint, cpu_signature))
+        if entry is None:
+            return None
+        try:
+            return TuningParams(**entry["params"])
+        except (KeyError, TypeError):
+            return None
+
+    def put(self, model_fingerprint: str, cpu_signature: str, result: Calibration) -> None:
+        self._entries[self._key(model_fingerprint, cpu_signature)] = {
+            "params": result.params.llama_kwargs(),
+            "prefill_tps": result.prefill_tps,
+            "decode_tps": result.decode_tps,
+            "calibrated_at": time.time(),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        data = {"version": TUNING_VERSION, "entries": self._entries}
+        tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
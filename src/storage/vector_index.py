@@ -0,0 +1,272 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+VECTORS = "vectors.f32"
+SPANS = "spans.i64"
+TEXTS = "texts.bin"
+META = "meta.json"
+# rows allocated up front; the arrays double when full
+MIN_CAPACITY = 1024
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    """What a file looked like when its chunks were embedded, and where they went."""
+
+    mtime_ns: int
+    size: int
+    digest: str
+    start: int  # first row of the file's chunks
+    stop: int  # one past the last
+
+
+class VectorIndex:
+    """
+    Chunk embeddings for a folder of documents, on disk under ``root``:
+
+        vectors.f32   float32 [capacity, dim], one row per chunk
+        spans.i64     int64 [capacity, 2], (offset, length) of the chunk text in texts.bin
+        texts.bin     UTF-8 chunk texts, appended
+        meta.json     dim, embedder, row count, and per file its mtime/size/hash and rows
+
+    Both arrays are memory-mapped, so opening an index reads only ``meta.json`` and the
+    OS pages vectors in on the first search. ``put()`` appends a file's chunks; the rows
+    it had before become dead and are skipped by ``search()`` until ``compact()`` (run
+    by ``save()`` once over half the rows are dead) rewrites the files without them.
+    Writes become durable with ``save()``; rows past the saved count are ignored.
+    Safe to search from one thread while another writes.
+    """
+
+    def __init__(self, root: Path, dim: int, embedder: str = "") -> None:
+        self.root = Path(root)
+        self.dim = int(dim)
+        self.embedder = embedder
+        self.files: dict[str, FileEntry] = {}
+        self.count = 0
+        self._lock = threading.RLock()
+        self._vectors: np.memmap | None = None
+        self._spans: np.memmap | None = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._text_end = 0
+        # (starts, stops, paths) of live files sorted by row, built on demand by ``paths()``
+        self._owners: tuple[np.ndarray, np.ndarray, list[str]] | None = None
+        self._load()
+
+    # ---- persistence ----
+    def _path(self, name: str) -> Path:
+        return self.root / name
+
+    def _load(self) -> None:
+        try:
+            meta = json.loads(self._path(META).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            meta = None
+        valid = (
+            meta is not None
+            and meta.get("version") == FORMAT_VERSION
+            and meta.get("dim") == self.dim
+            and meta.get("embedder") == self.embedder
+        )
+        if not valid:
+            # missing, or built with another embedding model: start over
+            self.root.mkdir(parents=True, exist_ok=True)
+            for name in (VECTORS, SPANS, TEXTS, META):
+                self._path(name).unlink(missing_ok=True)
+            self._map(0)
+            return
+        self.count = int(meta["count"])
+        self._text_end = int(meta["text_end"])
+        self.files = {p: FileEntry(**e) for p, e in meta["files"].items()}
+        self._map(self.count)
+        self._alive = self._alive_mask()
+
+    def _map(self, rows: int) -> None:
+        """(Re)map the arrays with room for at least ``rows`` rows."""
+        capacity = MIN_CAPACITY
+        while capacity < rows:
+            capacity *= 2
+        for name, width, dtype in ((VECTORS, self.dim, np.float32), (SPANS, 2, np.int64)):
+            p = self._path(name)
+            need = capacity * width * np.dtype(dtype).itemsize
+            with open(p, "ab") as f:
+                if f.tell() < need:
+                    f.truncate(need)
+        self._vectors = np.memmap(
+            self._path(VECTORS), dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+        self._spans = np.memmap(self._path(SPANS), dtype=np.int64, mode="r+", shape=(capacity, 2))
+        self._path(TEXTS).touch()
+
+    @property
+    def capacity(self) -> int:
+        return self._vectors.shape[0]
+
+    def _alive_mask(self) -> np.ndarray:
+        alive = np.zeros(self.count, dtype=bool)
+        for e in self.files.values():
+            alive[e.start : e.stop] = True
+        return alive
+
+    def save(self) -> None:
+        with self._lock:
+            if self.dead > self.count // 2:
+                self.compact()
+            self._vectors.flush()
+            self._spans.flush()
+            meta = {
+                "version": FORMAT_VERSION,
+                "dim": self.dim,
+                "embedder": self.embedder,
+                "count": self.count,
+                "text_end": self._text_end,
+                "files": {p: e.__dict__ for p, e in self.files.items()},
+            }
+            tmp = self._path(META + ".tmp")
+            tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp, self._path(META))
+
+    # ---- updates ----
+    @property
+    def dead(self) -> int:
+        return self.count - int(self._alive.sum())
+
+    def put(self, path: str, entry: FileEntry, vectors: np.ndarray, texts: list[str]) -> None:
+        """Store ``path``'s chunks (``entry.start``/``stop`` are filled in here)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(vectors) != len(texts):
+            raise ValueError("one vector per chunk text expected")
+        with self._lock:
+            self.remove(path)
+            n = len(texts)
+            start = self.count
+            if start + n > self.capacity:
+                self._grow(start + n)
+            blobs = [t.encode("utf-8") for t in texts]
+            with open(self._path(TEXTS), "r+b") as f:
+                f.seek(self._text_end)
+                f.write(b"".join(blobs))
+            lengths = np.array([len(b) for b in blobs], dtype=np.int64)
+            offsets = self._text_end + np.cumsum(lengths) - lengths
+            self._text_end += int(lengths.sum())
+            self._vectors[start : start + n] = vectors
+            self._spans[start : start + n, 0] = offsets
+            self._spans[start : start + n, 1] = lengths
+            self.count += n
+            self._alive = np.concatenate((self._alive, np.ones(n, dtype=bool)))
+            self.files[path] = FileEntry(entry.mtime_ns, entry.size, entry.digest, start, start + n)
+            self._owners = None
+
+    def touch(self, path: str, mtime_ns: int) -> None:
+        """Record a new mtime for a file whose contents did not change."""
+        with self._lock:
+            e = self.files[path]
+            self.files[path] = FileEntry(mtime_ns, e.size, e.digest, e.start, e.stop)
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            e = self.files.pop(path, None)
+            if e is not None:
+                self._alive[e.start : e.stop] = False
+                self._owners = None
+
+    def _grow(self, rows: int) -> None:
+        self._vectors.flush()
+        self._spans.flush()
+        self._vectors = self._spans = None
+        self._map(rows)
+
+    def compact(self) -> None:
+        """Rewrite the arrays and texts without dead rows."""
+        with self._lock:
+            order = sorted(self.files.items(), key=lambda kv: kv[1].start)
+            keep = (
+                np.concatenate([np.arange(e.start, e.stop) for _, e in order])
+                if order
+                else np.zeros(0, dtype=np.int64)
+            )
+            vectors = np.array(self._vectors[keep])
+            texts = self._texts(keep)
+            files, row = {}, 0
+            for p, e in order:
+                n = e.stop - e.start
+                files[p] = FileEntry(e.mtime_ns, e.size, e.digest, row, row + n)
+                row += n
+            self._vectors = self._spans = None
+            for name in (VECTORS, SPANS, TEXTS):
+                self._path(name).unlink(missing_ok=True)
+            self.count, self._text_end, self.files = 0, 0, {}
+            self._alive = np.zeros(0, dtype=bool)
+            self._map(len(keep))
+            for p, e in files.items():
+                self.put(p, e, vectors[e.start : e.stop], texts[e.start : e.stop])
+
+    # ---- queries ----
+    def _texts(self, rows) -> list[str]:
+        out = []
+        with open(self._path(TEXTS), "rb") as f:
+            for off, n in self._spans[np.asarray(rows, dtype=np.int64)]:
+                f.seek(int(off))
+                out.append(f.read(int(n)).decode("utf-8", errors="replace"))
+        return out
+
+    def paths(self, rows) -> list[str | None]:
+        """The file each row belongs to (None for dead rows)."""
+        with self._lock:
+            if self._owners is None:
+                order = sorted(self.files.items(), key=lambda kv: kv[1].start)
+                starts = np.array([e.start for _, e in order], dtype=np.int64)
+                stops = np.array([e.stop for _, e in order], dtype=np.int64)
+                self._owners = (starts, stops, [p for p, _ in order])
+            starts, stops, names = self._owners
+        rows = np.asarray(rows, dtype=np.int64)
+        i = np.searchsorted(starts, rows, side="right") - 1
+        return [
+            names[j] if j >= 0 and r < stops[j] else None
+            for j, r in zip(i.tolist(), rows.tolist(), strict=True)
+        ]
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Rows and scores (dot products, i.e. cosine similarity for normalized vectors)
+        of the ``k`` best chunks for each query, best first: two ``[n_queries, k']``
+        arrays, where ``k'`` is ``k`` or the number of live chunks if smaller.
+        """
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            n_alive = int(self._alive.sum())
+            k = min(int(k), n_alive)
+            if k <= 0:
+                return np.zeros((len(q), 0), dtype=np.int64), np.zeros((len(q), 0), np.float32)
+            scores = q @ self._vectors[: self.count].T
+            scores[:, ~self._alive] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def texts(self, rows) -> list[str]:
+        with self._lock:
+            return self._texts(rows)
+
+    def nearest(
+        self, queries: np.ndarray, k: int, min_score: float = -np.inf
+    ) -> list[list[tuple[str | None, str, float]]]:
+        """
+        ``search()`` resolved to (path, text, score) per query, dropping scores below
+        ``min_score``. Under one hold of the lock, so a ``compact()`` on another thread
+        cannot renumber the rows between finding and reading them.
+        """
+        with self._lock:
+            rows, scores = self.search(queries, k)
+            out = []
+            for r, sc in zip(rows, scores, strict=True):
+                keep = sc >= min_score
+                r, sc = r[keep], sc[keep]
+                out.append(list(zip(self.paths(r), self._texts(r), sc.tolist(), strict=True)))
+            return out
@@ -1,24 +1,41 @@
 # chat.py
 import asyncio
-import threading
+import concurrent.futures
+import time
 from collections.abc import Callable
 from pathlib import Path
 
 import flet as ft
 
-from config import DEFAULT_CTX_SIZE, DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE
+from config import (
+    DEFAULT_CTX_SIZE,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_SESSION_IDLE_SECS,
+    DEFAULT_TEMPERATURE,
+)
+from core.conversation import Conversation
 from core.llm_adapter import LlamaRunner
-from paths import LLM_MODELS_DIR
+from core.scheduler import GenerationScheduler, QueueFullError
+from core.streaming import TokenStream
+from paths import LLM_MODELS_DIR, MODEL_INDEX_PATH
+from storage.history import HistoryStore
+from storage.model_index import find_model
+from storage.sessions import SessionStore, model_key
+from ui.render import CoalescingWriter
+from ui.transcript import MessageSink, VirtualTranscript
 
 NotifyFn = Callable[[str], None]
 
+# seconds between live tokens/s updates of the status bar
+STATUS_INTERVAL = 0.5
+# reply placeholders for a message waiting its turn, and for one dropped before it ran
+QUEUED_TEXT = "(queued)"
+NOT_SENT_TEXT = "(not sent)"
 
-def find_gguf_model() -> Path | None:
-    """Return the first GGUF model under ``LLM_MODELS_DIR`` if available."""
-    if not LLM_MODELS_DIR.exists():
-        return None
-    files = sorted(LLM_MODELS_DIR.rglob("*.gguf"))
-    return files[0] if files else None
+
+def find_gguf_model(**filters) -> Path | None:
+    """The best GGUF model under ``LLM_MODELS_DIR``; see ``storage.model_index.find_model``."""
+    return find_model(root=LLM_MODELS_DIR, index_path=MODEL_INDEX_PATH, **filters)
 
 
 class ChatView:
@@ -26,7 +43,14 @@ class ChatView:
     Minimal chat UI:
       - Transcript (scrolling) on top
       - One input field + Send on bottom
-    Lazy-loads a model on first send if not already loaded.
+    Lazy-loads a model on first send if not already loaded, or up front via ``preload()``.
+    Keeps the whole exchange in ``self.conversation`` so the model sees prior turns.
+    A message shows up as soon as it is sent, with its reply slot marked queued until
+    it runs, or not sent if Stop (or the cancel policy) drops it first.
+    With a ``SessionStore``, the KV cache is snapshotted when the chat goes idle (and on
+    ``save_session()``), and the latest snapshot is restored right after the model loads.
+    With a ``HistoryStore``, every message is written to it as it is sent or streamed,
+    and a restored conversation is paged into the transcript from there as you scroll up.
     """
 
     def __init__(
@@ -35,19 +59,30 @@ class ChatView:
         llm: LlamaRunner,
         notify: NotifyFn,
         model_path: Path | None = None,
+        sessions: SessionStore | None = None,
+        scheduler: GenerationScheduler | None = None,
+        history: HistoryStore | None = None,
     ) -> None:
         self.page = page
         self.llm = llm
         self.notify = notify
         self.model_path = model_path.expanduser().resolve() if model_path else None
+        self.sessions = sessions
+        self.history = history
 
         # state
-        self._chat_task: asyncio.Task | None = None
-        self._cancel_flag: threading.Event | None = None
-        self._worker_thread: threading.Thread | None = None
+        self.conversation = Conversation()
+        # sends go through the scheduler: queued (default) or replacing the running reply
+        self.scheduler = scheduler or GenerationScheduler()
+        self._stream: TokenStream | None = None
+        self._idle_task: asyncio.Task | None = None
+        self._load_task: asyncio.Future | concurrent.futures.Future | None = None
+        # a model load is running (Stop can abort it in process mode), or was aborted
+        self._loading = False
+        self._load_aborted = False
 
         # transcript
-        self.transcript = ft.ListView(expand=True, spacing=8, auto_scroll=True, padding=10)
+        self.transcript = VirtualTranscript(self._format_message)
 
         # compose area
         self.input = ft.TextField(
@@ -58,14 +93,16 @@ class ChatView:
             max_lines=4,
         )
         self.btn_send = ft.ElevatedButton("Send", on_click=self._on_send)
+        # stops the running reply and drops queued messages
+        self.btn_stop = ft.ElevatedButton("Stop", on_click=self._on_stop, disabled=True)
         self.status = ft.Text("Ready.")
 
         # layout
         self.container = ft.Column(
             [
-                self.transcript,
+                self.transcript.view,
                 ft.Row(
-                    [self.input, self.btn_send],
+                    [self.input, self.btn_send, self.btn_stop],
                     vertical_alignment=ft.CrossAxisAlignment.END,
                 ),
                 self.status,
@@ -83,23 +120,48 @@ class ChatView:
 
     # ---- helpers ----
     def _set_busy(self, running: bool) -> None:
-        self.btn_send.disabled = running
-        self.status.value = "Thinking…" if running else "Ready."
+        self.btn_send.disabled = self.scheduler.full
+        queued = self.scheduler.pending
+        self.btn_stop.disabled = not (running or queued or self._loading)
+        if running:
+            self.status.value = f"Thinking… ({queued} queued)" if queued else "Thinking…"
+        else:
+            self.status.value = f"Queued: {queued}" if queued else "Ready."
         self.page.update()
 
+    @staticmethod
+    def _format_message(role: str, text: str) -> str:
+        label = "You" if role == "user" else "Assistant"
+        return f"{label}: {text}"
+
     def _append_user(self, text: str) -> None:
-        self.transcript.controls.append(ft.Text(f"You: {text}", selectable=True))
+        self.transcript.append("user", text)
         self.page.update()
 
-    def _append_assistant_stub(self) -> ft.Text:
-        assistant_text = ft.Text("Assistant: ", selectable=True)
-        self.transcript.controls.append(assistant_text)
+    def _append_assistant_stub(self, text: str) -> MessageSink:
+        sink = self.transcript.append("assistant", text)
         self.page.update()
-        return assistant_text
+        return sink
+
+    def preload(self) -> None:
+        """Start loading the model in the background; the first send awaits this load."""
+        if self.llm.is_loaded() or self._load_task is not None:
+            return
+        self._load_task = self.page.run_task(self._load_model)
 
     async def _ensure_model_loaded(self) -> bool:
         if self.llm.is_loaded():
             return True
+        task = self._load_task
+        if task is None or (task.done() and (task.cancelled() or not task.result())):
+            # nothing in flight (or the last attempt failed): start a load now
+            task = self._load_task = asyncio.ensure_future(self._load_model())
+        if isinstance(task, concurrent.futures.Future):
+            task = asyncio.wrap_future(task)
+        # shield: canceling a chat must not abort a shared in-flight load
+        return await asyncio.shield(task)
+
+    async def _load_model(self) -> bool:
         if not self.llm.is_available():
             self.notify("llama-cpp-python not installed. `pip install llama-cpp-python`")
             return False
@@ -119,86 +181,281 @@ class ChatView:
             self.status.value = f"Loading: {model_path}"
             self.page.update()
 
-            self.llm.load(str(model_path), n_ctx=DEFAULT_CTX_SIZE)
-            self.notify(f"Loaded: {model_path.name}")
-            self.status.value = "Model loaded."
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            last_pct = -1
+
+            def on_progress(frac: float) -> None:
+                nonlocal last_pct
+                pct = int(frac * 100)
+                if pct != last_pct:
+                    last_pct = pct
+                    loop.call_soon_threadsafe(self._show_load_progress, model_path.name, pct)
+
+            self._loading = True
+            self.btn_stop.disabled = False
+            self.page.update()
+            try:
+                await asyncio.to_thread(
+                    self.llm.load, str(model_path), n_ctx=DEFAULT_CTX_SIZE, progress=on_progress
+                )
+            finally:
+                self._loading = False
+                self._set_busy(self.scheduler.busy)
+            plan = getattr(self.llm, "memory_plan", None)
+            if plan is not None and plan.changes:
+                self.notify(f"Loaded: {model_path.name} (to fit RAM: {', '.join(plan.changes)})")
+            else:
+                self.notify(f"Loaded: {model_path.name}")
+            self.status.value = f"Model loaded in {time.perf_counter() - started:.1f}s."
+            if self.sessions and await asyncio.to_thread(self._restore_session):
+                self._show_restored()
+                self.status.value = "Session restored."
             self.page.update()
             return True
         except Exception as e:
-            self.notify(f"Failed to load model ({e.__class__.__name__}): {e}")
-            self.status.value = "Load failed."
+            if self._load_aborted:
+                self._load_aborted = False
+                self.status.value = "Load canceled."
+            else:
+                self.notify(f"Failed to load model ({e.__class__.__name__}): {e}")
+                self.status.value = "Load failed."
             self.page.update()
             return False
 
-    async def _run_chat(self, prompt: str) -> None:
-        if not await self._ensure_model_loaded():
+    def _show_load_progress(self, name: str, pct: int) -> None:
+        if self.llm.is_loaded():
+            return
+        self.status.value = f"Loading {name}… {pct}%" if pct < 100 else f"Initializing {name}…"
+        self.page.update()
+
+    def _show_restored(self) -> None:
+        """Put the restored conversation in front of the transcript, from history if it has it."""
+        conv_id = self.conversation.id
+        page = self.history.page(conv_id, limit=self.transcript.window) if self.history else []
+        if not page:
+            self.transcript.prepend([(m.role, m.content) for m in self.conversation.messages])
+            return
+        oldest = page[0].seq
+
+        def fetch_older(n: int) -> list[tuple[str, str]]:
+            nonlocal oldest
+            older = self.history.page(conv_id, before=oldest, limit=n)
+            if older:
+                oldest = older[0].seq
+            return [(m.role, m.content) for m in older]
+
+        self.transcript.prepend([(m.role, m.content) for m in page])
+        self.transcript.fetch_older = fetch_older
+
+    def _record(self, role: str, text: str) -> int | None:
+        if self.history is None:
+            return None
+        return self.history.append(self.conversation.id, role, text)
+
+    def _record_update(self, seq: int | None, text: str) -> None:
+        if seq is not None:
+            self.history.update(self.conversation.id, seq, text)
+
+    def _show_live_rate(self, tokens: int, first_at: float) -> None:
+        elapsed = time.perf_counter() - first_at
+        rate = f", {(tokens - 1) / elapsed:.1f} tok/s" if tokens > 1 and elapsed > 0 else ""
+        self.status.value = f"Thinking… {tokens} tokens{rate}"
+        self.status.update()
+
+    def _mark_not_sent(self, reply: MessageSink) -> None:
+        reply.value = NOT_SENT_TEXT
+        self.page.update()
+
+    async def _run_chat(self, prompt: str, assistant_node: MessageSink) -> None:
+        queue_wait = self.scheduler.last_wait  # this job is the one the scheduler just started
+        assistant_node.value = ""
+        self.page.update()
+        try:
+            loaded = await self._ensure_model_loaded()
+        except asyncio.CancelledError:
+            self._mark_not_sent(assistant_node)
+            raise
+        if not loaded:
+            self._mark_not_sent(assistant_node)
             return
+        # recorded once loaded: restoring a session can switch to another conversation id
+        self._record("user", prompt)
 
         self._set_busy(True)
-        assistant_node = self._append_assistant_stub()
+        reply_seq = self._record("assistant", "")
 
         # start streaming
-        q, cancel_flag, th = self.llm.stream_chat(
-            system_prompt="",  # keep it simple
+        stream = self.llm.astream_conversation(
+            self.conversation,
             user_prompt=prompt,
             temperature=DEFAULT_TEMPERATURE,
             max_tokens=DEFAULT_MAX_TOKENS,
+            queue_wait=queue_wait,
         )
+        self._stream = stream
 
-        self._cancel_flag = cancel_flag
-        self._worker_thread = th
-
-        # read stream
+        # read stream: the loop only wakes when the worker hands over a delta, and the
+        # transcript is redrawn at most once per frame
+        writer = CoalescingWriter(assistant_node)
+        tokens, first_at, shown_at = 0, 0.0, 0.0
+        completed = False
         try:
-            while True:
-                try:
-                    item = q.get_nowait()
-                except Exception:
-                    item = ...
-
-                if item is None:
-                    break
-                elif item is ...:
-                    if not th.is_alive():
-                        break
-                    await asyncio.sleep(0.01)
-                else:
-                    assistant_node.value += item
-                    assistant_node.update()
+            async for delta in stream:
+                writer.write(delta)
+                tokens += 1
+                now = time.perf_counter()
+                if tokens == 1:
+                    first_at = now
+                if now - shown_at >= STATUS_INTERVAL:
+                    shown_at = now
+                    self._show_live_rate(tokens, first_at)
+                    self._record_update(reply_seq, writer.text)
+            completed = True
         except asyncio.CancelledError:
             pass
+        except Exception as e:
+            writer.write(f"\n[Error: {e}]\n")
         finally:
-            if self._worker_thread:
-                self._worker_thread.join()
-            self._cancel_flag = None
-            self._worker_thread = None
+            writer.close()
+            self._record_update(reply_seq, assistant_node.value)
+            # never join the worker here: it stops at its next check, off the UI thread
+            stream.cancel()
+            if self._stream is stream:
+                self._stream = None
             self._set_busy(False)
+            self._schedule_idle_save()
+        metrics = self.llm.metrics.last
+        if completed and metrics is not None and not self.scheduler.pending:
+            self.status.value = f"Ready. {metrics.summary()}"
+            self.page.update()
+
+    # ---- session snapshots ----
+    def _session_key(self) -> str | None:
+        if not self.sessions or not self.llm.model_path or not self.llm.n_ctx:
+            return None
+        plan = getattr(self.llm, "memory_plan", None)
+        if plan is None:
+            return model_key(self.llm.model_path, self.llm.n_ctx)
+        kv = plan.settings
+        return model_key(
+            self.llm.model_path, self.llm.n_ctx, kv.type_k, kv.type_v, kv.uses_flash_attn
+        )
+
+    def save_session(self) -> bool:
+        """Snapshot the KV cache of the current conversation. Blocking; skipped mid-reply."""
+        key = self._session_key()
+        if key is None or not self.conversation.messages or not self.llm.is_loaded():
+            return False
+        if self.scheduler.busy or self.scheduler.pending:
+            return False
+        tokens, state, seed = self.llm.save_state()
+        meta = {
+            "seed": seed,
+            "system_prompt": self.conversation.system_prompt,
+            "messages": [
+                {"role": m.role, "content": m.content, "context": m.context}
+                for m in self.conversation.messages
+            ],
+        }
+        self.sessions.save(self.conversation.id, key, tokens, state, meta)
+        return True
+
+    def _restore_session(self) -> bool:
+        key = self._session_key()
+        if key is None or self.conversation.messages:
+            return False
+        conv_id = self.sessions.latest(key)
+        snap = self.sessions.load(conv_id, key) if conv_id else None
+        if snap is None:
+            return False
+        try:
+            with snap:
+                self.llm.load_state(snap.tokens, snap.state, int(snap.meta.get("seed", 0)))
+        except Exception:
+            self.sessions.delete(conv_id, key)
+            return False
+        conv = Conversation(system_prompt=snap.meta.get("system_prompt", ""), id=conv_id)
+        for m in snap.meta.get("messages", []):
+            # with the retrieved context the turns re-render to the snapshot's tokens
+            conv.add(m["role"], m["content"], context=m.get("context", ""))
+        self.conversation = conv
+        return True
+
+    def _schedule_idle_save(self) -> None:
+        if not self.sessions:
+            return
+        if self._idle_task:
+            self._idle_task.cancel()
+        self._idle_task = self.page.run_task(self._idle_save)
+
+    async def _idle_save(self) -> None:
+        await asyncio.sleep(DEFAULT_SESSION_IDLE_SECS)
+        try:
+            await asyncio.to_thread(self.save_session)
+        except Exception as e:
+            self.notify(f"Session snapshot failed: {e}")
 
     # ---- events ----
     def _cancel_chat(self) -> None:
-        if self._cancel_flag:
-            self._cancel_flag.set()
-        if self._chat_task:
-            self._chat_task.cancel()
-        if self._worker_thread:
-            self._worker_thread.join()
-        self._cancel_flag = None
-        self._worker_thread = None
-        self._chat_task = None
+        # non-blocking: the worker thread notices the cancel at its next check
+        if self._stream:
+            self._stream.cancel()
+        self.scheduler.cancel_all()
+        self._stream = None
         self._set_busy(False)
         self.status.value = "Canceled."
         self.page.update()
 
+    async def _submit(self, text: str) -> None:
+        started = False
+
+        async def run() -> None:
+            nonlocal started
+            started = True
+            await self._run_chat(text, reply)
+
+        try:
+            job = self.scheduler.submit(run)
+        except QueueFullError:
+            self.notify(f"Still busy: {self.scheduler.pending} messages queued.")
+            if not self.input.value:  # give the message back unless a new one was typed
+                self.input.value = text
+                self.input.update()
+            return
+        # the job cannot start before the next await, so its reply slot is in place by then
+        self._append_user(text)
+        reply = self._append_assistant_stub(QUEUED_TEXT)
+        job.add_done_callback(
+            lambda f: self._mark_not_sent(reply) if f.cancelled() and not started else None
+        )
+        self._set_busy(self.scheduler.busy)
+
     def _on_send(self, _: ft.ControlEvent) -> None:
         text = self.input.value.strip()
         if not text:
             self.notify("Type something first.")
             return
+        if self.scheduler.policy != "cancel" and self.scheduler.full:
+            self.notify(f"Still busy: {self.scheduler.pending} messages queued.")
+            return
 
-        self._append_user(text)
+        if self._idle_task:
+            self._idle_task.cancel()
+            self._idle_task = None
         self.input.value = ""
         self.input.update()
 
-        if self._chat_task and not self._chat_task.done():
-            self._cancel_chat()
-        self._chat_task = self.page.run_task(self._run_chat, text)
+        # the scheduler lives on the event loop; Flet may call us from a worker thread
+        self.page.run_task(self._submit, text)
+
+    async def _stop(self) -> None:
+        if self._loading:
+            if self.llm.abort_load():
+                self._load_aborted = True
+            else:
+                self.notify("This load cannot be interrupted; set LOCALAI_INFERENCE=process.")
+        self._cancel_chat()
+
+    def _on_stop(self, _: ft.ControlEvent) -> None:
+        self.page.run_task(self._stop)
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from config import DEFAULT_UI_FPS
+
+
+class CoalescingWriter:
+    """
+    Appends streamed deltas to a text control at most ``fps`` times per second.
+
+    Deltas are buffered in a list and joined once per frame, so the cost of a reply is
+    bounded by the frame rate rather than the model's tokens/s. A trailing timer makes
+    sure the last deltas of a burst still show up; ``close()`` flushes whatever is left.
+    ``fps <= 0`` updates on every delta.
+    """
+
+    def __init__(self, node, fps: float = DEFAULT_UI_FPS, clock=time.monotonic) -> None:
+        self._node = node
+        self._text = node.value
+        self._pending: list[str] = []
+        self._interval = 1.0 / fps if fps > 0 else 0.0
+        self._clock = clock
+        self._last_flush = float("-inf")
+        self._timer: asyncio.TimerHandle | None = None
+        self.flushes = 0
+
+    @property
+    def text(self) -> str:
+        return self._text + "".join(self._pending)
+
+    def write(self, delta: str) -> None:
+        if not delta:
+            return
+        self._pending.append(delta)
+        wait = self._last_flush + self._interval - self._clock()
+        if wait <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(wait, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._last_flush = self._clock()
+        if not self._pending:
+            return
+        self._text += "".join(self._pending)
+        self._pending.clear()
+        self._node.value = self._text
+        self._node.update()
+        self.flushes += 1
+
+    def close(self) -> None:
+        self.flush()
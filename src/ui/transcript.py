@@ -0,0 +1,196 @@
+from collections.abc import Callable
+
+import flet as ft
+
+from config import DEFAULT_TRANSCRIPT_WINDOW
+
+FormatFn = Callable[[str, str], str]
+# given a count, returns up to that many messages from just before the oldest one loaded
+FetchFn = Callable[[int], list[tuple[str, str]]]
+
+
+class MessageSink:
+    """Text target for a message being streamed; follows it in and out of the live window."""
+
+    def __init__(self, transcript: "VirtualTranscript", index: int) -> None:
+        self._transcript = transcript
+        # stays valid when older messages are inserted in front
+        self._pos = index - transcript.prepended
+
+    @property
+    def index(self) -> int:
+        return self._pos + self._transcript.prepended
+
+    @property
+    def value(self) -> str:
+        return self._transcript.messages[self.index][1]
+
+    @value.setter
+    def value(self, text: str) -> None:
+        self._transcript.set_text(self.index, text)
+
+    def update(self) -> None:
+        ctrl = self._transcript.live_control(self.index)
+        if ctrl is not None:
+            ctrl.update()
+
+
+class VirtualTranscript:
+    """
+    Chat transcript that only keeps a window of messages as live Flet controls.
+
+    Every message lives in ``self.messages`` as a ``(role, text)`` tuple; only
+    ``messages[start:end]`` have controls in ``self.view``. While the window follows
+    the tail, appends push the oldest control out. Scrolling near the top or bottom
+    rehydrates the next page of messages from the backing store and drops the same
+    number from the far end, so append and scroll cost stays flat however long the
+    session gets. With ``fetch_older`` set, scrolling past the oldest message loaded
+    pulls the page before it from storage, until that returns nothing.
+    """
+
+    def __init__(
+        self,
+        format_message: FormatFn,
+        window: int = DEFAULT_TRANSCRIPT_WINDOW,
+        page_size: int | None = None,
+        edge_px: float = 200.0,
+    ) -> None:
+        self.format_message = format_message
+        self.window = max(2, int(window))
+        self.page_size = page_size or max(1, self.window // 3)
+        self.edge_px = edge_px
+        self.messages: list[tuple[str, str]] = []
+        self.start = 0
+        self.end = 0
+        self.prepended = 0
+        self.fetch_older: FetchFn | None = None
+        self.view = ft.ListView(
+            expand=True,
+            spacing=8,
+            auto_scroll=True,
+            padding=10,
+            on_scroll=self._on_scroll,
+        )
+
+    # ---- state ----
+    @property
+    def controls(self) -> list[ft.Control]:
+        return self.view.controls
+
+    @property
+    def following(self) -> bool:
+        return self.end == len(self.messages)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def live_control(self, index: int) -> ft.Control | None:
+        if self.start <= index < self.end:
+            return self.controls[index - self.start]
+        return None
+
+    # ---- mutations ----
+    def append(self, role: str, text: str) -> MessageSink:
+        """Store a message (and show it if the view follows the tail)."""
+        self.messages.append((role, text))
+        index = len(self.messages) - 1
+        if self.end == index:
+            self.end += 1
+            self.controls.append(self._control(index))
+            over = self.end - self.start - self.window
+            if over > 0:
+                del self.controls[:over]
+                self.start += over
+        return MessageSink(self, index)
+
+    def set_text(self, index: int, text: str) -> None:
+        role, _ = self.messages[index]
+        self.messages[index] = (role, text)
+        ctrl = self.live_control(index)
+        if ctrl is not None:
+            ctrl.value = self.format_message(role, text)
+
+    def prepend(self, items: list[tuple[str, str]]) -> None:
+        """Insert older messages (e.g. a restored session) before everything else."""
+        if not items:
+            return
+        self._insert_front(items)
+        room = self.window - (self.end - self.start)
+        if room > 0:
+            self._show_older(min(room, self.start))
+
+    def clear(self) -> None:
+        self.messages.clear()
+        self.controls.clear()
+        self.start = self.end = 0
+        self.fetch_older = None
+
+    def _insert_front(self, items: list[tuple[str, str]]) -> None:
+        self.messages[:0] = items
+        self.start += len(items)
+        self.end += len(items)
+        self.prepended += len(items)
+        self._rekey()
+
+    def _fetch_page(self) -> None:
+        if self.fetch_older is None:
+            return
+        items = self.fetch_older(self.page_size)
+        if items:
+            self._insert_front(items)
+        else:
+            self.fetch_older = None  # reached the first message
+
+    # ---- scrolling ----
+    def _on_scroll(self, e) -> None:
+        pixels = float(getattr(e, "pixels", 0) or 0)
+        top = float(getattr(e, "min_scroll_extent", 0) or 0)
+        bottom = float(getattr(e, "max_scroll_extent", 0) or 0)
+        if pixels - top <= self.edge_px and (self.start > 0 or self.fetch_older is not None):
+            self.load_older()
+        elif bottom - pixels <= self.edge_px and not self.following:
+            self.load_newer()
+
+    def load_older(self) -> bool:
+        if self.start == 0:
+            self._fetch_page()
+        n = min(self.page_size, self.start)
+        if n <= 0:
+            return False
+        anchor = self.start
+        self._show_older(n)
+        over = self.end - self.start - self.window
+        if over > 0:
+            del self.controls[-over:]
+            self.end -= over
+        self.view.auto_scroll = self.following
+        self.view.update()
+        # keep the message that was on top in place instead of jumping to the new top
+        self.view.scroll_to(key=str(anchor), duration=0)
+        return True
+
+    def load_newer(self) -> bool:
+        n = min(self.page_size, len(self.messages) - self.end)
+        if n <= 0:
+            return False
+        self.controls.extend(self._control(i) for i in range(self.end, self.end + n))
+        self.end += n
+        over = self.end - self.start - self.window
+        if over > 0:
+            del self.controls[:over]
+            self.start += over
+        self.view.auto_scroll = self.following
+        self.view.update()
+        return True
+
+    def _show_older(self, n: int) -> None:
+        self.controls[:0] = [self._control(i) for i in range(self.start - n, self.start)]
+        self.start -= n
+
+    def _control(self, index: int) -> ft.Control:
+        role, text = self.messages[index]
+        return ft.Text(self.format_message(role, text), selectable=True, key=str(index))
+
+    def _rekey(self) -> None:
+        for offset, ctrl in enumerate(self.controls):
+            ctrl.key = str(self.start + offset)
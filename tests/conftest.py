@@ -1,12 +1,24 @@
 # tests/conftest.py
+import asyncio
+import importlib
+import struct
 import sys
+import threading
+import time
 import types
 from types import SimpleNamespace
 
+import numpy as np
+import pytest
+
+from core.metrics import MetricsRecorder
+from core.streaming import TokenStream
+
 
 class _Text:
     def __init__(self, value: str = "", selectable: bool = False, **kw):
         self.value = value
+        self.key = kw.get("key")
 
     def update(self) -> None:
         pass
@@ -61,3 +73,212 @@ fake_flet.Page = object
 
 # Install into sys.modules before any tests import ui.chat
 sys.modules["flet"] = fake_flet
+
+
+# ---- chat view fakes ----
+class DummyRunner:
+    """Loaded model that streams "hi" one character per 50 ms."""
+
+    metrics = MetricsRecorder()
+
+    def is_loaded(self) -> bool:
+        return True
+
+    def is_available(self) -> bool:
+        return True
+
+    def astream_conversation(
+        self, conversation, *, user_prompt, temperature, max_tokens, queue_wait=0.0
+    ):
+        stream = TokenStream()
+
+        def worker() -> None:
+            for ch in "hi":
+                if stream.cancelled:
+                    break
+                stream.put(ch)
+                time.sleep(0.05)
+            stream.close()
+
+        stream.thread = threading.Thread(target=worker)
+        stream.thread.start()
+        return stream
+
+
+class DummyPage:
+    def run_task(self, coro, *args):
+        return asyncio.create_task(coro(*args))
+
+    def update(self) -> None:
+        pass
+
+
+# ---- synthetic GGUF files (header + tensor table only) ----
+def _gguf_string(s: str) -> bytes:
+    b = s.encode("utf-8")
+    return struct.pack("<Q", len(b)) + b
+
+
+def _gguf_value(v) -> bytes:
+    if isinstance(v, bool):
+        return struct.pack("<I?", 7, v)
+    if isinstance(v, int):
+        return struct.pack("<IQ", 10, v)  # uint64
+    if isinstance(v, float):
+        return struct.pack("<If", 6, v)
+    if isinstance(v, str):
+        return struct.pack("<I", 8) + _gguf_string(v)
+    if isinstance(v, list):  # array of strings, like tokenizer.ggml.tokens
+        return struct.pack("<IIQ", 9, 8, len(v)) + b"".join(_gguf_string(x) for x in v)
+    raise TypeError(v)
+
+
+def write_gguf(path, metadata: dict, tensors=(("w", (256, 256), 0),)):
+    """Write a GGUF v3 header; ``tensors`` are (name, shape, ggml type) tuples."""
+    out = [b"GGUF", struct.pack("<IQQ", 3, len(tensors), len(metadata))]
+    for k, v in metadata.items():
+        out.append(_gguf_string(k) + _gguf_value(v))
+    for name, shape, ttype in tensors:
+        out.append(_gguf_string(name) + struct.pack("<I", len(shape)))
+        out.append(struct.pack(f"<{len(shape)}Q", *shape) + struct.pack("<IQ", ttype, 0))
+    path.write_bytes(b"".join(out))
+    return path
+
+
+def llama_metadata(**overrides) -> dict:
+    meta = {
+        "general.architecture": "llama",
+        "general.name": "Tiny",
+        "general.file_type": 15,
+        "llama.context_length": 8192,
+        "llama.block_count": 2,
+        "llama.embedding_length": 256,
+        "llama.attention.head_count": 8,
+        "llama.attention.head_count_kv": 4,
+        "tokenizer.ggml.tokens": ["a", "b", "c"],
+        "tokenizer.chat_template": "{{ messages }}",
+    }
+    meta.update(overrides)
+    return {k: v for k, v in meta.items() if v is not None}
+
+
+@pytest.fixture
+def make_gguf(tmp_path):
+    def make(name="model.gguf", metadata=None, tensors=(("w", (256, 256), 0),)):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return write_gguf(path, llama_metadata() if metadata is None else metadata, tensors)
+
+    return make
+
+
+# ---- fake llama_cpp ----
+class FakeLlama:
+    """Stands in for ``llama_cpp.Llama``: one token per byte and a canned reply."""
+
+    def __init__(self, *, model_path, n_ctx, n_threads, verbose, n_gpu_layers=0, **kw):
+        # record params for assertions
+        self.kwargs = dict(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            verbose=verbose,
+            n_gpu_layers=n_gpu_layers,
+            **kw,
+        )
+        # simulate failure if caller tries to use GPU in "dev" test where we want a fallback
+        if kw.get("_fail_on_gpu") and n_gpu_layers == -1:
+            raise RuntimeError("GPU init failed")
+        self.draft_model = kw.get("draft_model")
+        # simulated KV cache: tokens evaluated so far, and how many each call had to prefill
+        self.evaluated: list[int] = []
+        self.prefilled: list[int] = []
+
+    def tokenize(self, text, add_bos=True, special=False):
+        # one token per byte, BOS = -1
+        return ([-1] if add_bos else []) + list(text)
+
+    def create_completion(self, *, prompt, stream, max_tokens, temperature, top_p, stop):
+        # stream a couple of chunks then end
+        chunks = ["Hello", ", world!", "\n"]
+        if isinstance(prompt, list):
+            common = 0
+            for a, b in zip(prompt, self.evaluated, strict=False):
+                if a != b:
+                    break
+                common += 1
+            self.prefilled.append(len(prompt) - common)
+            self.evaluated = prompt + self.tokenize("".join(chunks).encode(), add_bos=False)
+        if stream:
+            for t in chunks:
+                yield {"choices": [{"text": t}]}
+                time.sleep(0.01)
+        else:
+            return {"choices": [{"text": "".join(chunks)}]}
+
+
+@pytest.fixture
+def fake_llama_monkeypatch(monkeypatch):
+    """Install a stand-in ``llama_cpp`` module whose ``Llama`` is ``FakeLlama``."""
+    mod = types.ModuleType("llama_cpp")
+    mod.Llama = FakeLlama
+    monkeypatch.setitem(sys.modules, "llama_cpp", mod)
+    return mod
+
+
+def fresh_runner_module():
+    # Ensure we import a fresh copy of the runner with our fake llama in place
+    if "core.llm_adapter" in sys.modules:
+        del sys.modules["core.llm_adapter"]
+    return importlib.import_module("core.llm_adapter")
+
+
+# ---- fake batch backend (core.batching) ----
+EOG = 0
+
+
+class FakeBatchBackend:
+    """Byte-level fake: each sequence replies with its prompt upper-cased, then EOG."""
+
+    def __init__(self, n_seq_max=4, n_batch=64, n_ctx=256, delay=0.0) -> None:
+        self.n_seq_max = n_seq_max
+        self.n_batch = n_batch
+        self.n_ctx = n_ctx
+        self.delay = delay
+        self.calls: list[list[tuple[int, int]]] = []  # (seq_id, n_tokens) per decode
+        self.cleared: list[int] = []
+        self._prompt: dict[int, list[int]] = {}
+        self._gen: dict[int, int] = {}
+
+    def tokenize(self, text):
+        return list(text.encode())
+
+    def token_bytes(self, token):
+        return bytes([token])
+
+    def is_eog(self, token):
+        return token == EOG
+
+    def decode(self, entries):
+        self.calls.append([(e.seq_id, len(e.tokens)) for e in entries])
+        if self.delay:
+            time.sleep(self.delay)
+        out = {}
+        for e in entries:
+            if e.seq_id not in self._gen:
+                # negative ids are FakeLlama's BOS, for prompts the runner tokenized
+                self._prompt.setdefault(e.seq_id, []).extend(t for t in e.tokens if t >= 0)
+            if e.logits:
+                i = self._gen.get(e.seq_id, 0)
+                self._gen[e.seq_id] = i + 1
+                reply = bytes(self._prompt[e.seq_id]).upper()
+                nxt = reply[i] if i < len(reply) else EOG
+                logits = np.zeros(256, dtype=np.float32)
+                logits[nxt] = 10.0
+                out[e.seq_id] = logits
+        return out
+
+    def clear_seq(self, seq_id):
+        self.cleared.append(seq_id)
+        self._prompt.pop(seq_id, None)
+        self._gen.pop(seq_id, None)
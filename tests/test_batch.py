@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import batch
+
+
+class _Runner:
+    def __init__(self, fail_on: str | None = None) -> None:
+        self.fail_on = fail_on
+        self.prompts: list[str] = []
+
+    def chat(self, system_prompt, user_prompt, temperature, max_tokens, on_delta=None, seed=None):
+        if user_prompt == self.fail_on:
+            raise KeyboardInterrupt  # simulated crash mid-run
+        self.prompts.append(user_prompt)
+        reply = f"{system_prompt}:{user_prompt.upper()}"
+        for ch in reply:
+            on_delta(ch)
+        return reply
+
+
+def _write_prompts(path, prompts):
+    path.write_text("".join(json.dumps(p) + "\n" for p in prompts), encoding="utf-8")
+
+
+def _results(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_batch_writes_results_and_stats(tmp_path):
+    src = tmp_path / "in.jsonl"
+    _write_prompts(src, [{"id": "a", "prompt": "hi"}, {"prompt": "yo", "system": "S"}])
+    out = tmp_path / "out.jsonl"
+
+    stats = batch.run_batch(_Runner(), src, out, system_prompt="D")
+
+    rows = _results(out)
+    assert [r["id"] for r in rows] == ["a", "2"]
+    assert rows[0]["output"] == "D:HI" and rows[0]["tokens"] == 4
+    assert rows[1]["output"] == "S:YO"
+    assert stats.prompts == 2 and stats.tokens == 8 and stats.errors == 0
+    assert stats.tokens_per_s > 0
+
+
+def test_batch_resumes_after_crash(tmp_path):
+    src = tmp_path / "in.jsonl"
+    _write_prompts(src, [{"prompt": p} for p in ("one", "two", "three")])
+    out = tmp_path / "out.jsonl"
+
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_batch(_Runner(fail_on="two"), src, out)
+    with open(out, "a", encoding="utf-8") as f:
+        f.write('{"id": "2", "outp')  # torn write from the crash
+
+    runner = _Runner()
+    stats = batch.run_batch(runner, src, out)
+
+    assert runner.prompts == ["two", "three"]
+    assert stats.skipped == 1
+    assert [r["id"] for r in _results(out)] == ["1", "2", "3"]
+
+
+def test_unterminated_last_line_is_redone(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_bytes(b'{"id": "1", "output": "a"}\n{"id": "2", "output": "b"}')
+
+    assert batch.completed_ids(out) == {"1"}
+    assert out.read_bytes() == b'{"id": "1", "output": "a"}\n'
+
+
+def test_batch_records_errors_and_continues(tmp_path):
+    class _Flaky(_Runner):
+        def chat(self, system_prompt, user_prompt, *a, **kw):
+            if user_prompt == "bad":
+                raise RuntimeError("boom")
+            return super().chat(system_prompt, user_prompt, *a, **kw)
+
+    src = tmp_path / "in.jsonl"
+    _write_prompts(src, [{"prompt": "bad"}, {"prompt": "ok"}])
+    out = tmp_path / "out.jsonl"
+    stats = batch.run_batch(_Flaky(), src, out)
+    rows = _results(out)
+    assert rows[0]["error"] == "RuntimeError: boom"
+    assert rows[1]["output"] == ":OK"
+    assert stats.errors == 1
+
+
+def test_batch_does_not_import_flet():
+    src = Path(__file__).resolve().parents[1] / "src"
+    code = "import sys, batch; sys.exit('flet' in sys.modules)"
+    env = {**os.environ, "PYTHONPATH": str(src)}
+    assert subprocess.run([sys.executable, "-c", code], env=env).returncode == 0
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+from conftest import FakeBatchBackend
+
+from core.batching import BatchEngine, SamplingParams, sample_token
+
+
+def _collect(engine, prompt, **params):
+    parts: list[str] = []
+    done = threading.Event()
+    result = {}
+
+    def on_done(reason, error):
+        result.update(reason=reason, error=error)
+        done.set()
+
+    greedy = {"temperature": 0.0, **params}
+    req = engine.submit(prompt, SamplingParams(**greedy), parts.append, on_done)
+    return req, parts, done, result
+
+
+def test_single_sequence_runs_to_eog():
+    engine = BatchEngine(FakeBatchBackend())
+    _, parts, done, result = _collect(engine, "abc")
+    assert done.wait(5)
+    engine.close()
+    assert "".join(parts) == "ABC"
+    assert result == {"reason": "stop", "error": None}
+
+
+def test_max_tokens_and_stop_strings():
+    engine = BatchEngine(FakeBatchBackend())
+    _, p1, d1, r1 = _collect(engine, "abcdef", max_tokens=2)
+    _, p2, d2, r2 = _collect(engine, "abcdef", stop=("CDE", "X"))
+    assert d1.wait(5) and d2.wait(5)
+    engine.close()
+    assert "".join(p1) == "AB" and r1["reason"] == "length"
+    # "C" is held back until it is clear it starts the stop string
+    assert p2 == ["A", "B"] and r2["reason"] == "stop"
+
+
+def test_sequences_share_decode_steps():
+    backend = FakeBatchBackend(n_seq_max=4)
+    engine = BatchEngine(backend, threaded=False)
+    prompts = ["hello there", "abc", "general kenobi", "xyz"]
+    for p in prompts:
+        engine.submit(p, SamplingParams(temperature=0.0), lambda _d: None)
+    while engine.step():
+        pass
+    assert engine.stats.max_active == 4
+    generated = sum(len(p) + 1 for p in prompts)  # reply + EOG
+    assert engine.stats.tokens_out == generated
+    # continuous batching: far fewer steps than decoding one sequence at a time
+    assert engine.stats.steps <= max(len(p) for p in prompts) + 2
+    assert sorted(backend.cleared) == [0, 1, 2, 3]
+
+
+def test_late_request_joins_without_waiting():
+    backend = FakeBatchBackend(n_seq_max=2, delay=0.002)
+    engine = BatchEngine(backend)
+    _, long_parts, long_done, _ = _collect(engine, "a" * 60)
+    time.sleep(0.02)
+    _, short_parts, short_done, _ = _collect(engine, "hi")
+    assert short_done.wait(5)
+    assert not long_done.is_set()  # the short one finished while the long one kept going
+    assert long_done.wait(5)
+    engine.close()
+    assert "".join(short_parts) == "HI" and "".join(long_parts) == "A" * 60
+    assert any(len(call) == 2 for call in backend.calls)
+
+
+def test_long_prefill_is_chunked_around_running_decodes():
+    backend = FakeBatchBackend(n_seq_max=2, n_batch=8)
+    engine = BatchEngine(backend, threaded=False)
+    engine.submit("ab", SamplingParams(temperature=0.0), lambda _d: None)
+    engine.step()  # prefill "ab", sample "A"
+    engine.submit("z" * 20, SamplingParams(temperature=0.0), lambda _d: None)
+    engine.step()
+    # the running sequence decodes its token and the new prompt gets the rest of the batch
+    assert backend.calls[-1] == [(0, 1), (1, 7)]
+    while engine.step():
+        pass
+    assert all(sum(n for _, n in call) <= 8 for call in backend.calls)
+
+
+def test_cancel_frees_slot():
+    backend = FakeBatchBackend(n_seq_max=1, delay=0.002)
+    engine = BatchEngine(backend)
+    req, _, done, result = _collect(engine, "x" * 100)
+    _, parts, done2, _ = _collect(engine, "ok")
+    time.sleep(0.02)
+    req.cancel()
+    assert done.wait(5) and result["reason"] == "cancelled"
+    assert done2.wait(5)
+    engine.close()
+    assert "".join(parts) == "OK"
+
+
+def test_close_while_sequences_finish():
+    for _ in range(20):
+        engine = BatchEngine(FakeBatchBackend(n_seq_max=4, delay=0.001))
+        pending = [_collect(engine, "ok", max_tokens=1) for _ in range(4)]
+        engine.close()
+        assert all(done.wait(5) for _, _, done, _ in pending)
+
+
+def test_prompt_too_long_is_an_error():
+    engine = BatchEngine(FakeBatchBackend(n_ctx=8))
+    _, _, done, result = _collect(engine, "x" * 20)
+    assert done.wait(5)
+    engine.close()
+    assert result["reason"] == "error" and isinstance(result["error"], ValueError)
+
+
+def test_astream_reports_finish_reason():
+    async def run():
+        engine = BatchEngine(FakeBatchBackend())
+        stream = engine.astream("hey", SamplingParams(temperature=0.0, max_tokens=8))
+        text = "".join([d async for d in stream])
+        engine.close()
+        return text, stream.finish_reason
+
+    assert asyncio.run(run()) == ("HEY", "stop")
+
+
+def test_sampling_is_seeded_and_respects_top_k():
+    logits = np.array([1.0, 3.0, 2.0, 0.5], dtype=np.float32)
+    params = SamplingParams(temperature=1.0, top_k=2, top_p=1.0, seed=7)
+    a = [sample_token(logits, params, np.random.default_rng(7)) for _ in range(20)]
+    b = [sample_token(logits, params, np.random.default_rng(7)) for _ in range(20)]
+    assert a == b
+    assert set(a) <= {1, 2}
+    assert sample_token(logits, SamplingParams(temperature=0.0), np.random.default_rng()) == 1
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from bench.__main__ import main
+from bench.fake import FakeLatency, FakeRunner
+from bench.measure import fresh_runner, percentile, run_bench
+
+FAST = FakeLatency(load_s=0.02, prefill_s_per_token=0.0002, decode_s_per_token=0.002)
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == pytest.approx(2.5)
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 90) == pytest.approx(4.6)
+
+
+def test_run_bench_measures_fake_latencies(tmp_path):
+    model = tmp_path / "fake.gguf"
+    model.write_bytes(b"x")
+    runner = fresh_runner(FakeRunner, latency=FAST)
+    result = run_bench(runner, model, 512, ["x" * 100, "hi"], repeat=2, max_tokens=5)
+
+    assert result["load_s"] >= FAST.load_s
+    summary = result["summary"]
+    assert summary["requests"] == 4
+    assert summary["tokens"] == 20
+    # the long prompt pays ~100 tokens of prefill before its first token
+    assert result["requests"][0]["ttft_ms"] >= 100 * FAST.prefill_s_per_token * 1000
+    assert summary["itl_ms"]["p50"] >= FAST.decode_s_per_token * 1000
+    assert 0 < summary["decode_tokens_per_s"] <= 1 / FAST.decode_s_per_token
+
+
+def test_cli_writes_json(tmp_path, capsys):
+    out = tmp_path / "bench.json"
+    argv = ["--fake", "--repeat", "1", "--max-tokens", "3", "--output", str(out)]
+    argv += ["--load-ms", "1", "--prefill-ms", "0", "--decode-ms", "1"]
+    assert main(argv) == 0
+
+    result = json.loads(out.read_text())
+    assert result["model"] == "fake"
+    assert result["fake_latency"]["decode_s_per_token"] == 0.001
+    assert result["summary"]["tokens"] == 6
+    assert result["environment"]["cpu_count"]
+    printed = json.loads(capsys.readouterr().out)
+    assert "ttft_ms" in printed and "load_s" in printed
@@ -0,0 +1,78 @@
+import ctypes
+import sys
+import threading
+import types
+
+from bench.fake import FakeLatency, FakeLlama, FakeRunner
+from bench.measure import fresh_runner, time_cancel
+from core.cancellation import abort_on, can_prefill, prefill, stopping_criteria
+
+SLOW_PREFILL = FakeLatency(load_s=0, prefill_s_per_token=0.002, decode_s_per_token=0.01)
+
+
+def test_prefill_reuses_cached_prefix_and_stops_on_cancel():
+    llm = FakeLlama(model_path="m", n_ctx=4096, latency=FakeLatency(0, 0, 0))
+    assert can_prefill(llm)
+    tokens = list(range(100))
+    assert prefill(llm, tokens, threading.Event(), chunk=16)
+    assert llm.input_ids == tokens[:-1]  # the last token is left for create_completion
+
+    evals = []
+    llm.eval = lambda batch: (evals.append(len(batch)), llm.evaluated.extend(batch))
+    assert prefill(llm, tokens[:50] + [7] * 50, threading.Event(), chunk=16)
+    assert evals == [16, 16, 16, 1]  # only the 49 tokens after the common prefix
+
+    cancel = threading.Event()
+    llm.eval = lambda batch: (llm.evaluated.extend(batch), cancel.set())
+    assert not prefill(llm, list(range(500, 600)), cancel, chunk=16)
+    assert llm.n_tokens == 16
+
+
+def test_abort_callback_follows_cancel_and_is_removed(monkeypatch):
+    installed = []
+    mod = types.ModuleType("llama_cpp")
+    mod.ggml_abort_callback = ctypes.CFUNCTYPE(ctypes.c_bool, ctypes.c_void_p)
+    mod.llama_set_abort_callback = lambda ctx, cb, data: installed.append((ctx, cb))
+    monkeypatch.setitem(sys.modules, "llama_cpp", mod)
+    llm = types.SimpleNamespace(_ctx=types.SimpleNamespace(ctx="ctx"))
+    cancel = threading.Event()
+
+    with abort_on(llm, cancel) as abortable:
+        assert abortable
+        callback = installed[-1][1]
+        assert not callback(None)
+        cancel.set()
+        assert callback(None)
+    assert not installed[-1][1]  # NULL callback
+    with abort_on(object(), cancel) as abortable:
+        assert not abortable
+
+
+def test_stopping_criteria(monkeypatch):
+    mod = types.ModuleType("llama_cpp")
+
+    class StoppingCriteriaList(list):
+        def __call__(self, input_ids, logits):
+            return any(c(input_ids, logits) for c in self)
+
+    mod.StoppingCriteriaList = StoppingCriteriaList
+    monkeypatch.setitem(sys.modules, "llama_cpp", mod)
+    cancel = threading.Event()
+    criteria = stopping_criteria(cancel)
+    assert not criteria([], None)
+    cancel.set()
+    assert criteria([], None)
+    monkeypatch.setitem(sys.modules, "llama_cpp", None)
+    assert stopping_criteria(cancel) is None
+
+
+def test_cancel_lands_within_a_chunk_during_prefill(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    runner = fresh_runner(FakeRunner, latency=SLOW_PREFILL)
+    runner.load(str(model))
+    # 2000 prompt tokens take 4 s to prefill; one 64-token chunk takes 0.13 s
+    latency = time_cancel(runner, "x" * 2000, 16, after_first_token=False, delay_s=0.05)
+    assert latency < 0.3
+    latency = time_cancel(runner, "y" * 10, 1000, after_first_token=True, delay_s=0.02)
+    assert latency < 0.1
@@ -1,12 +1,14 @@
 import asyncio
-import queue
 import sys
 import threading
-import time
 import types
 from types import SimpleNamespace
 
+from conftest import DummyPage, DummyRunner
+
 import ui.chat as chat
+from core.scheduler import GenerationScheduler
+from core.worker import WorkerError
 
 
 # Minimal flet stub so ui.chat can be imported without the real dependency.
@@ -66,60 +68,138 @@ fake_flet.Page = object
 sys.modules["flet"] = fake_flet
 
 
-class DummyRunner:
-    def is_loaded(self) -> bool:
-        return True
-
-    def is_available(self) -> bool:
-        return True
-
-    def stream_chat(self, *, system_prompt, user_prompt, temperature, max_tokens):
-        q: queue.Queue[str | None] = queue.Queue()
-        cancel = threading.Event()
-
-        def worker() -> None:
-            for ch in "hi":
-                if cancel.is_set():
-                    break
-                q.put(ch)
-                time.sleep(0.05)
-            q.put(None)
-
-        th = threading.Thread(target=worker)
-        th.start()
-        return q, cancel, th
-
-
-class DummyPage:
-    def run_task(self, coro, *args):
-        return asyncio.create_task(coro(*args))
-
-    def update(self) -> None:
-        pass
-
-
 def test_on_send_cancels_previous() -> None:
     async def run_test() -> None:
         page = DummyPage()
         notes: list[str] = []
-        view = chat.ChatView(page, DummyRunner(), notes.append)
+        view = chat.ChatView(
+            page, DummyRunner(), notes.append, scheduler=GenerationScheduler(policy="cancel")
+        )
 
         view.input.value = "first"
         view._on_send(None)
         await asyncio.sleep(0.06)
-        first_flag = view._cancel_flag
-        first_thread = view._worker_thread
-        first_task = view._chat_task
-        assert first_flag and not first_flag.is_set()
-        assert first_thread and first_thread.is_alive()
+        first_stream = view._stream
+        assert first_stream and not first_stream.cancelled
+        assert first_stream.thread.is_alive()
 
         view.input.value = "second"
         view._on_send(None)
-        assert first_flag.is_set()
-        assert first_thread and not first_thread.is_alive()
-        assert view._chat_task and view._chat_task is not first_task
+        await asyncio.sleep(0.01)
+        # canceling signals the old worker but never joins it on the UI thread
+        assert first_stream.cancelled
+        assert view._stream and view._stream is not first_stream
+        first_stream.thread.join(timeout=1)
+        assert not first_stream.thread.is_alive()
 
         view._cancel_chat()
         await asyncio.sleep(0.01)
+        assert not view.scheduler.busy
+
+    asyncio.run(run_test())
+
+
+def test_on_send_queues_by_default() -> None:
+    async def run_test() -> list[str]:
+        view = chat.ChatView(DummyPage(), DummyRunner(), lambda _: None)
+        for text in ("first", "second", "third"):
+            view.input.value = text
+            view._on_send(None)
+        await asyncio.sleep(0.01)
+        assert view.scheduler.busy and view.scheduler.pending == 2
+        while view.scheduler.busy or view.scheduler.pending:
+            await asyncio.sleep(0.02)
+        return [c.value for c in view.transcript.controls]
+
+    assert asyncio.run(run_test()) == [
+        "You: first",
+        "Assistant: hi",
+        "You: second",
+        "Assistant: hi",
+        "You: third",
+        "Assistant: hi",
+    ]
+
+
+def test_queue_full_is_reported() -> None:
+    async def run_test() -> list[str]:
+        notes: list[str] = []
+        view = chat.ChatView(
+            DummyPage(), DummyRunner(), notes.append, scheduler=GenerationScheduler(maxsize=1)
+        )
+        for text in ("a", "b", "c"):
+            view.input.value = text
+            view._on_send(None)
+            await asyncio.sleep(0.01)
+        # "a" is running, "b" fills the one queue slot, "c" is rejected and kept
+        assert view.btn_send.disabled
+        assert view.input.value == "c"
+        view._cancel_chat()
+        return notes
+
+    assert asyncio.run(run_test()) == ["Still busy: 1 messages queued."]
+
+
+def test_stop_cancels_the_running_reply_and_the_queue() -> None:
+    async def run_test() -> None:
+        view = chat.ChatView(DummyPage(), DummyRunner(), lambda _: None)
+        for text in ("first", "second"):
+            view.input.value = text
+            view._on_send(None)
+        await asyncio.sleep(0.01)
+        stream = view._stream
+        assert stream and not view.btn_stop.disabled
+        # the queued message is on screen while it waits
+        shown = [c.value for c in view.transcript.controls]
+        assert shown[2:] == ["You: second", f"Assistant: {chat.QUEUED_TEXT}"]
+
+        view._on_stop(None)
+        await asyncio.sleep(0.01)
+        assert stream.cancelled
+        assert not view.scheduler.busy and not view.scheduler.pending
+        assert view.btn_stop.disabled
+        shown = [c.value for c in view.transcript.controls]
+        assert shown[0] == "You: first"
+        # the dropped message stays, marked as never sent
+        assert shown[2:] == ["You: second", f"Assistant: {chat.NOT_SENT_TEXT}"]
+
+    asyncio.run(run_test())
+
+
+class _SlowLoadRunner(DummyRunner):
+    """A process-mode load that blocks until ``abort_load()``."""
+
+    def __init__(self) -> None:
+        self.aborted = threading.Event()
+
+    def is_loaded(self) -> bool:
+        return False
+
+    def load(self, path, n_ctx, progress=None):
+        self.aborted.wait(5)
+        raise WorkerError("model load aborted")
+
+    def abort_load(self) -> bool:
+        self.aborted.set()
+        return True
+
+
+def test_stop_aborts_a_model_load(tmp_path) -> None:
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+
+    async def run_test() -> None:
+        runner = _SlowLoadRunner()
+        notes: list[str] = []
+        view = chat.ChatView(DummyPage(), runner, notes.append, model_path=model)
+        view.preload()
+        await asyncio.sleep(0.05)
+        assert not view.btn_stop.disabled
+
+        view._on_stop(None)
+        await view._load_task
+        assert runner.aborted.is_set()
+        assert view.status.value == "Load canceled." and not notes
+        assert view.btn_stop.disabled
 
     asyncio.run(run_test())
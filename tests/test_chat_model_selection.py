@@ -1,5 +1,6 @@
 import asyncio
 import sys
+import time
 import types
 from types import SimpleNamespace
 
@@ -65,11 +66,13 @@ sys.modules.setdefault("flet", fake_flet)
 
 def test_find_gguf_model_none(tmp_path, monkeypatch):
     monkeypatch.setattr(chat, "LLM_MODELS_DIR", tmp_path)
+    monkeypatch.setattr(chat, "MODEL_INDEX_PATH", tmp_path / "index.json")
     assert chat.find_gguf_model() is None
 
 
 def test_ensure_model_loaded_no_models(tmp_path, monkeypatch):
     monkeypatch.setattr(chat, "LLM_MODELS_DIR", tmp_path)
+    monkeypatch.setattr(chat, "MODEL_INDEX_PATH", tmp_path / "index.json")
     notes: list[str] = []
     page = SimpleNamespace(update=lambda: None)
     llm = SimpleNamespace(
@@ -81,3 +84,36 @@ def test_ensure_model_loaded_no_models(tmp_path, monkeypatch):
     ok = asyncio.run(view._ensure_model_loaded())
     assert not ok
     assert notes and "No GGUF models found" in notes[-1]
+
+
+def test_send_awaits_inflight_preload(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    calls: list[dict] = []
+    loaded = {"ok": False}
+
+    def load(path, **kw):
+        calls.append(kw)
+        kw["progress"](0.5)
+        time.sleep(0.05)
+        loaded["ok"] = True
+
+    llm = SimpleNamespace(
+        is_loaded=lambda: loaded["ok"],
+        is_available=lambda: True,
+        load=load,
+    )
+
+    async def run() -> tuple[bool, bool]:
+        page = SimpleNamespace(
+            update=lambda: None, run_task=lambda coro, *a: asyncio.create_task(coro(*a))
+        )
+        view = chat.ChatView(page, llm, lambda _: None, model_path=model)
+        view.preload()
+        await asyncio.sleep(0.01)
+        # the event loop stays free while the model loads in a worker thread
+        assert not loaded["ok"]
+        return await asyncio.gather(view._ensure_model_loaded(), view._ensure_model_loaded())
+
+    assert asyncio.run(run()) == [True, True]
+    assert len(calls) == 1
@@ -0,0 +1,70 @@
+import pytest
+
+from core.context import ContextOverflowError, ContextWindow
+from core.conversation import Conversation
+
+
+def _tokens(msg):
+    return [0] * len(msg.content)  # one token per character
+
+
+def _conv(*turns, **kw):
+    conv = Conversation(**kw)
+    for i, content in enumerate(turns):
+        conv.add("user" if i % 2 == 0 else "assistant", content)
+    return conv
+
+
+def _select(window, conv, budget, n_system=0):
+    return window.select(conv, budget, 1, n_system, 2, _tokens)
+
+
+def test_fits_without_trimming():
+    conv = _conv("a" * 10, "b" * 10, "c" * 10)
+    keep, msgs = _select(ContextWindow(), conv, budget=100, n_system=5)
+    assert keep and msgs == conv.messages and conv.window_start == 0
+
+
+def test_trims_whole_turns_in_chunks_and_stays_stable():
+    window = ContextWindow(policy="pin_system", trim_fraction=0.5)
+    conv = _conv(*["x" * 10] * 9)  # 9 messages, 90 tokens
+    keep, msgs = _select(window, conv, budget=60, n_system=5)
+    # trimmed to <= 30 tokens (half the budget) and starts on a user turn
+    assert keep
+    assert msgs[0].role == "user"
+    assert sum(len(m.content) for m in msgs) + 1 + 5 + 2 <= 30
+    start = conv.window_start
+
+    # the next turn still fits: the window does not move, so the prompt prefix is unchanged
+    conv.add("assistant", "y" * 10)
+    conv.add("user", "z" * 10)
+    _, msgs2 = _select(window, conv, budget=60, n_system=5)
+    assert conv.window_start == start
+    assert msgs2[: len(msgs)] == msgs
+
+
+def test_pin_summary_keeps_pinned_messages():
+    conv = Conversation()
+    conv.add("system", "summary of the early chat", pinned=True)
+    for content in ["u" * 20, "a" * 20, "u" * 20, "a" * 20, "q" * 5]:
+        conv.add("user" if content[0] in "uq" else "assistant", content)
+    _, msgs = _select(ContextWindow(policy="pin_summary"), conv, budget=60)
+    assert msgs[0].pinned
+    assert msgs[-1].content == "q" * 5
+
+    conv.window_start = 0
+    _, msgs = _select(ContextWindow(policy="pin_system"), conv, budget=60)
+    assert not msgs[0].pinned
+
+
+def test_drop_oldest_drops_system_as_last_resort():
+    conv = _conv("x" * 40)
+    keep, msgs = _select(ContextWindow(policy="drop_oldest"), conv, budget=50, n_system=20)
+    assert not keep and len(msgs) == 1
+    with pytest.raises(ContextOverflowError):
+        _select(ContextWindow(policy="pin_system"), _conv("x" * 40), budget=50, n_system=20)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ContextWindow(policy="nope")
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from conftest import FakeLlama, fresh_runner_module
+
+from core.embeddings import EmbeddingCache, pack
+
+DIM = 8
+
+
+class _EmbedLlama(FakeLlama):
+    def n_embd(self) -> int:
+        return DIM
+
+
+class _FakeBackend:
+    """One "token" per byte; a sequence's embedding is its byte histogram mod ``DIM``."""
+
+    def __init__(self, n_batch: int = 64, n_seq_max: int = 4) -> None:
+        self.n_batch = n_batch
+        self.n_seq_max = n_seq_max
+        self.dim = DIM
+        self.batches: list[list[int]] = []
+
+    def tokenize(self, text: str) -> list[int]:
+        return list(text.encode("utf-8"))
+
+    def decode(self, seqs):
+        assert len(seqs) <= self.n_seq_max and sum(map(len, seqs)) <= self.n_batch
+        self.batches.append([len(s) for s in seqs])
+        out = np.zeros((len(seqs), DIM), dtype=np.float32)
+        for i, tokens in enumerate(seqs):
+            np.add.at(out[i], np.asarray(tokens) % DIM, 1.0)
+        return out
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def runner(fake_llama_monkeypatch, tmp_path):
+    fake_llama_monkeypatch.Llama = _EmbedLlama
+    model = tmp_path / "embed.gguf"
+    model.write_bytes(b"x")
+    r = fresh_runner_module().LlamaRunner()
+    r.load(str(model), n_ctx=512, embedding=True)
+    r.backend = _FakeBackend()
+    r._embedding_backend = lambda: r.backend
+    return r
+
+
+def test_pack_fills_batches_within_limits():
+    lengths = [30, 5, 60, 12, 12, 40, 1, 64, 20]
+    batches = pack(lengths, n_batch=64, n_seq_max=3)
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+    assert all(len(b) <= 3 and sum(lengths[i] for i in b) <= 64 for b in batches)
+    assert len(batches) == 5  # 244 tokens need at least 4 batches of 64
+    assert pack([], 64) == []
+
+
+def test_cache_is_lru():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put("a", np.ones(DIM))
+    cache.put("b", np.zeros(DIM))
+    assert cache.get("a") is not None  # now "b" is the least recently used
+    cache.put("c", np.zeros(DIM))
+    assert cache.get("b") is None and len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_embed_packs_texts_and_caches(runner):
+    assert runner._llm.kwargs["embedding"] is True
+    assert runner._llm.kwargs["n_ubatch"] == runner._llm.kwargs["n_batch"]
+    texts = [f"text number {i}" for i in range(40)] + ["text number 3", "x" * 100]
+    out = runner.embed(texts)
+    assert out.shape == (42, DIM) and out.dtype == np.float32 and out.flags.c_contiguous
+    # 41 distinct texts of ~14 tokens: 4 per decode, not one each
+    assert len(runner.backend.batches) == 11
+    assert max(runner.backend.batches[0]) == 64  # the long text was cut to n_batch
+    assert np.array_equal(out[3], out[40])
+
+    again = runner.embed(texts[::-1], normalize=True)
+    assert len(runner.backend.batches) == 11  # all from the cache
+    assert np.allclose(np.linalg.norm(again, axis=1), 1.0)
+    assert np.allclose(again[::-1], out / np.linalg.norm(out, axis=1, keepdims=True))
+    assert runner.embed([]).shape == (0, DIM)
+
+    runner.unload()
+    assert len(runner.embed_cache) == 0
+
+
+def test_embed_needs_an_embedding_model(fake_llama_monkeypatch, tmp_path):
+    fake_llama_monkeypatch.Llama = _EmbedLlama
+    model = tmp_path / "chat.gguf"
+    model.write_bytes(b"x")
+    r = fresh_runner_module().LlamaRunner()
+    with pytest.raises(RuntimeError, match="not loaded"):
+        r.embed(["hi"])
+    r.load(str(model), n_ctx=512)
+    assert "embedding" not in r._llm.kwargs
+    with pytest.raises(RuntimeError, match="embedding=True"):
+        r.embed(["hi"])
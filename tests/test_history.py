@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from conftest import DummyPage, DummyRunner
+
+import ui.chat as chat
+from storage.history import HistoryStore, fts_query
+
+
+def test_writes_are_batched_and_paged_back(tmp_path):
+    store = HistoryStore(tmp_path / "h.sqlite3", flush_s=0.05)
+    try:
+        assert store.append("c1", "user", "What is the capital of France?") == 0
+        seq = store.append("c1", "assistant", "")
+        for n in range(1, 200):  # a streamed reply: many updates of one row
+            store.update("c1", seq, "Paris" * n)
+        for i in range(10):
+            store.append("c1", "user", f"follow-up {i}")
+        assert store.flush(timeout=5)
+        assert store.commits <= 2 and store.last_error is None
+
+        assert store.count("c1") == 12
+        last = store.page("c1", limit=5)
+        assert [m.seq for m in last] == [7, 8, 9, 10, 11]
+        older = store.page("c1", before=last[0].seq, limit=5)
+        assert [m.seq for m in older] == [2, 3, 4, 5, 6]
+        first = store.page("c1", before=older[0].seq, limit=5)
+        assert [(m.role, m.content) for m in first] == [
+            ("user", "What is the capital of France?"),
+            ("assistant", "Paris" * 199),
+        ]
+        (conv,) = store.conversations()
+        assert conv.id == "c1" and conv.title.startswith("What is") and conv.messages == 12
+    finally:
+        store.close()
+
+    # reopened: numbering carries on after what is on disk
+    store = HistoryStore(tmp_path / "h.sqlite3", flush_s=0)
+    try:
+        assert store.append("c1", "user", "back again") == 12
+        store.delete_conversation("c1")
+        store.flush()
+        assert store.count("c1") == 0 and store.search("Paris") == []
+    finally:
+        store.close()
+
+
+def test_search_is_fast_over_many_messages(tmp_path):
+    store = HistoryStore(tmp_path / "h.sqlite3")
+    try:
+        assert store.fts
+        for c in range(200):
+            for i in range(100):
+                store.append(f"c{c}", "user", f"message {i} in conversation {c} about llamas")
+        store.append("c7", "assistant", "The Eiffel tower is in Paris.")
+        store.flush()
+
+        hits = store.search("eiff")
+        assert [(h.conversation_id, h.role) for h in hits] == [("c7", "assistant")]
+        assert "[Eiffel]" in hits[0].snippet
+        assert len(store.search("llamas", limit=20)) == 20
+        assert store.search("llamas", conversation_id="c3", limit=500)[0].conversation_id == "c3"
+        assert store.search('"; DROP TABLE messages') == []
+
+        best = float("inf")
+        for _ in range(3):
+            t0 = time.perf_counter()
+            store.search("conversation 199 llam")
+            best = min(best, time.perf_counter() - t0)
+        assert best < 0.05, f"search over 20k messages took {best * 1000:.1f} ms"
+    finally:
+        store.close()
+
+
+def test_fts_query():
+    assert fts_query("  hello  wor ") == '"hello" "wor"*'
+    assert fts_query('say "hi"') == '"say" """hi"""*'
+    assert fts_query("") == ""
+
+
+def test_chat_records_messages_and_pages_history(tmp_path):
+    store = HistoryStore(tmp_path / "h.sqlite3", flush_s=0)
+
+    async def run_test() -> chat.ChatView:
+        view = chat.ChatView(DummyPage(), DummyRunner(), lambda _: None, history=store)
+        view.input.value = "hello"
+        view._on_send(None)
+        await asyncio.sleep(0.01)
+        while view.scheduler.busy or view.scheduler.pending:
+            await asyncio.sleep(0.02)
+        return view
+
+    try:
+        view = asyncio.run(run_test())
+        store.flush()
+        conv_id = view.conversation.id
+        assert [(m.role, m.content) for m in store.page(conv_id)] == [
+            ("user", "hello"),
+            ("assistant", "hi"),
+        ]
+
+        for i in range(100):
+            store.append(conv_id, "user", f"old {i}")
+        store.flush()
+        view.transcript.clear()
+        view.transcript.view.update = lambda: None
+        view.transcript.view.scroll_to = lambda **kw: None
+        view._show_restored()
+        assert len(view.transcript) == view.transcript.window
+        while view.transcript.load_older():
+            pass
+        assert len(view.transcript) == 102
+        assert view.transcript.messages[0] == ("user", "hello")
+    finally:
+        store.close()
@@ -1,55 +1,10 @@
 import importlib
 import sys
-import time
-import types
 
 import pytest
+from conftest import FakeLlama, fresh_runner_module
 
-
-# ---- helpers: fake Llama class ----
-class _FakeLlama:
-    def __init__(self, *, model_path, n_ctx, n_threads, verbose, n_gpu_layers=0, **kw):
-        # record params for assertions
-        self.kwargs = dict(
-            model_path=model_path,
-            n_ctx=n_ctx,
-            n_threads=n_threads,
-            verbose=verbose,
-            n_gpu_layers=n_gpu_layers,
-            **kw,
-        )
-        # simulate failure if caller tries to use GPU in "dev" test where we want a fallback
-        if kw.get("_fail_on_gpu") and n_gpu_layers == -1:
-            raise RuntimeError("GPU init failed")
-
-    def create_completion(self, *, prompt, stream, max_tokens, temperature, top_p, stop):
-        # stream a couple of chunks then end
-        chunks = ["Hello", ", world!", "\n"]
-        if stream:
-            for t in chunks:
-                yield {"choices": [{"text": t}]}
-                time.sleep(0.01)
-        else:
-            return {"choices": [{"text": "".join(chunks)}]}
-
-
-# ---- fixture to monkeypatch llama_cpp.Llama at import time ----
-@pytest.fixture(autouse=True)
-def fake_llama_monkeypatch(monkeypatch, tmp_path):
-    # Build a temporary module to stand in for llama_cpp
-    mod = types.ModuleType("llama_cpp")
-    mod.Llama = _FakeLlama
-    sys.modules["llama_cpp"] = mod
-    yield
-    # cleanup
-    sys.modules.pop("llama_cpp", None)
-
-
-def fresh_runner_module():
-    # Ensure we import a fresh copy of the runner with our fake llama in place
-    if "core.llm_adapter" in sys.modules:
-        del sys.modules["core.llm_adapter"]
-    return importlib.import_module("core.llm_adapter")
+pytestmark = pytest.mark.usefixtures("fake_llama_monkeypatch")
 
 
 def fresh_config_module():
@@ -84,7 +39,7 @@ def test_load_dev_prefers_gpu_then_fallback(tmp_path, monkeypatch):
     model.write_bytes(b"dummy")
 
     # Swap in a FakeLlama that fails on GPU (-1) once, then succeeds on CPU
-    class _FlakyFake(_FakeLlama):
+    class _FlakyFake(FakeLlama):
         def __init__(self, **kw):
             kw["_fail_on_gpu"] = True
             super().__init__(**kw)
@@ -118,6 +73,19 @@ def test_stream_chat_yields_tokens(tmp_path):
     assert "".join(out).strip().startswith("Hello")
 
 
+def test_chat_blocking_collects_deltas(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    with pytest.raises(RuntimeError):
+        r.chat("", "Hi?")
+    r.load(str(model))
+    deltas = []
+    assert r.chat("", "Hi?", on_delta=deltas.append) == "Hello, world!\n"
+    assert len(deltas) == 3
+
+
 def test_stream_chat_cancel(tmp_path):
     model = tmp_path / "m.gguf"
     model.write_bytes(b"x")
@@ -181,3 +149,209 @@ def test_env_overrides(monkeypatch, tmp_path):
     assert cfg.DEFAULT_TEMPERATURE == 0.5
     assert cfg.DEFAULT_MAX_TOKENS == 64
     assert cfg.DEFAULT_CTX_SIZE == 2048
+
+
+def _drain(q):
+    out = []
+    while True:
+        item = q.get()
+        if item is None:
+            return "".join(out)
+        out.append(item)
+
+
+def test_stream_conversation_keeps_history(tmp_path):
+    from core.conversation import Conversation
+
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model))
+
+    conv = Conversation(system_prompt="Be brief.")
+    q, cancel, th = r.stream_conversation(conv, "first question")
+    assert _drain(q).startswith("Hello")
+    th.join()
+    q, cancel, th = r.stream_conversation(conv, "second")
+    _drain(q)
+    th.join()
+
+    assert [msg.role for msg in conv.messages] == ["user", "assistant", "user", "assistant"]
+    assert conv.messages[1].content == "Hello, world!\n"
+    text = bytes(t for t in r.conversation_tokens(conv) if t >= 0).decode()
+    assert text.count("<|im_start|>user\n") == 2
+    assert "<|im_start|>system\nBe brief.\n<|im_end|>" in text
+
+
+def test_stream_conversation_prefills_only_new_turn(tmp_path):
+    from core.conversation import Conversation
+
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model))
+
+    conv = Conversation()
+    for i in range(4):
+        q, cancel, th = r.stream_conversation(conv, f"question {i} " + "x" * 50 * i)
+        _drain(q)
+        th.join()
+
+    # later turns prefill only the new turn even though the transcript keeps growing
+    prefilled = r._llm.prefilled
+    new_turn = "\n<|im_end|>\n" + r._chatml_turn("user", "question 3 " + "x" * 150)
+    expected = len(new_turn.encode()) + len(r.ASSISTANT_HEADER.encode())
+    assert prefilled[3] == expected
+    assert len(r._llm.evaluated) > 2 * expected
+
+
+def test_switching_models_re_renders_conversation_tokens(tmp_path):
+    from core.conversation import Conversation
+
+    class _OtherVocab(FakeLlama):
+        def tokenize(self, text, add_bos=True, special=False):
+            return ([-2] if add_bos else []) + [1000 + b for b in text]
+
+    a, b = tmp_path / "a.gguf", tmp_path / "b.gguf"
+    a.write_bytes(b"a")
+    b.write_bytes(b"b")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(a))
+    conv = Conversation(system_prompt="Be brief.")
+    q, cancel, th = r.stream_conversation(conv, "first question")
+    _drain(q)
+    th.join()
+    on_a = r.conversation_tokens(conv)
+
+    sys.modules["llama_cpp"].Llama = _OtherVocab
+    r.load(str(b))
+    on_b = r.conversation_tokens(conv)
+    assert on_b[0] == -2 and all(t >= 1000 for t in on_b[1:])
+    assert [t - 1000 for t in on_b[1:]] == on_a[1:]
+    assert all(msg.tokens[0] >= 1000 for msg in conv.messages)
+
+    sys.modules["llama_cpp"].Llama = FakeLlama
+    r.load(str(a))
+    assert r.conversation_tokens(conv) == on_a
+
+
+def test_long_conversation_is_trimmed_to_context(tmp_path):
+    from core.conversation import Conversation
+
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model), n_ctx=600)
+
+    conv = Conversation(system_prompt="Be brief.")
+    starts = []
+    for i in range(12):
+        q, cancel, th = r.stream_conversation(conv, f"q{i} " + "x" * 60, max_tokens=100)
+        assert _drain(q).startswith("Hello")
+        th.join()
+        assert len(r._llm.evaluated) - len("Hello, world!\n") <= 600 - 100
+        starts.append(conv.window_start)
+
+    assert len(conv.messages) == 24  # the full history is kept
+    assert starts[-1] > 0
+    assert "Be brief." in bytes(t for t in r._llm.evaluated if t >= 0).decode()
+    # between trims the window holds still, and only the new turn is prefilled
+    steady = [i for i in range(1, 12) if starts[i] == starts[i - 1]]
+    assert steady
+    turn = len(r._chatml_turn("user", "q1 " + "x" * 60).encode())
+    assert all(r._llm.prefilled[i] < turn + 40 for i in steady)
+
+
+def test_save_and_load_state(tmp_path):
+    np = pytest.importorskip("numpy")
+
+    class _State:
+        def __init__(self, **kw):
+            self.__dict__.update(kw)
+
+    class _StatefulFake(FakeLlama):
+        def __init__(self, **kw):
+            super().__init__(**kw)
+            self.input_ids = np.zeros(8, dtype=np.intc)
+            self.scores = np.zeros((8, 4), dtype=np.single)
+            self.loaded = None
+
+        def save_state(self):
+            self.input_ids[:3] = [4, 5, 6]
+            return _State(input_ids=self.input_ids.copy(), n_tokens=3, llama_state=b"kv", seed=9)
+
+        def load_state(self, state):
+            self.loaded = state
+
+    sys.modules["llama_cpp"].Llama = _StatefulFake  # type: ignore[attr-defined]
+    sys.modules["llama_cpp"].LlamaState = _State  # type: ignore[attr-defined]
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model))
+
+    tokens, state, seed = r.save_state()
+    assert (tokens, state, seed) == ([4, 5, 6], b"kv", 9)
+
+    r.load_state([1, 2], memoryview(b"restored"), seed=9)
+    st = r._llm.loaded
+    assert st.n_tokens == 2 and list(st.input_ids[:2]) == [1, 2]
+    assert bytes(st.llama_state) == b"restored" and st.llama_state_size == 8
+    assert st.scores.shape == (2, 4)
+
+
+def test_load_reports_progress(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x" * 1000)
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    seen: list[float] = []
+    r.load(str(model), progress=seen.append)
+    assert seen == sorted(seen)
+    assert seen[-1] == 1.0 and len(seen) >= 2
+
+
+def test_astream_conversation_async_iterator(tmp_path):
+    import asyncio
+
+    from core.conversation import Conversation
+
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model))
+    conv = Conversation()
+
+    async def run() -> str:
+        return "".join([d async for d in r.astream_conversation(conv, "Hi?")])
+
+    assert asyncio.run(run()) == "Hello, world!\n"
+    assert [msg.role for msg in conv.messages] == ["user", "assistant"]
+
+
+def test_astream_chat_raises_errors(tmp_path):
+    import asyncio
+
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model))
+
+    def broken(**kw):
+        raise RuntimeError("decode failed")
+
+    r._llm.create_completion = broken  # type: ignore[attr-defined]
+
+    async def run() -> None:
+        async for _ in r.astream_chat("", "Hi?"):
+            pass
+
+    with pytest.raises(RuntimeError, match="decode failed"):
+        asyncio.run(run())
@@ -0,0 +1,191 @@
+import pytest
+from conftest import fresh_runner_module
+
+import core.memory
+from core.gguf import read_gguf
+from core.memory import (
+    MIN_CTX,
+    InsufficientMemoryError,
+    MemorySettings,
+    available_memory_bytes,
+    estimate_peak_bytes,
+    fit_memory,
+    plan_memory,
+)
+from core.speculative import SpeculativeConfig
+
+MB = 1024 * 1024
+
+
+def test_vocab_size_from_token_array(make_gguf):
+    assert read_gguf(make_gguf()).vocab_size == 3
+
+
+def test_estimate_breakdown(make_gguf):
+    info = read_gguf(make_gguf())
+    f16 = estimate_peak_bytes(info, 8192, MemorySettings())
+    assert f16.weights == 256 * 256 * 4
+    # 2 layers x 8192 tokens x (K + V of 4 kv heads x 32 dims) x 2 bytes
+    assert f16.kv_cache == 2 * 8192 * 256 * 2
+    # without flash attention the scores of a 512-token batch against the context dominate
+    assert f16.compute > 512 * 8192 * 8 * 4
+    q8 = estimate_peak_bytes(info, 8192, MemorySettings(type_k="q8_0", type_v="q8_0"))
+    assert q8.kv_cache == int(2 * 8192 * 256 * 34 / 32)
+    assert q8.compute < f16.compute  # quantized V turns on flash attention
+    assert f16.total == f16.weights + f16.kv_cache + f16.compute
+
+
+def test_settings_kwargs_and_variant():
+    default = MemorySettings()
+    assert default.variant() == ""
+    kw = MemorySettings(type_k="q8_0", type_v="q4_0", use_mlock=True).llama_kwargs()
+    assert kw == {
+        "use_mmap": True,
+        "use_mlock": True,
+        "type_k": 8,
+        "type_v": 2,
+        "flash_attn": True,
+    }
+    assert MemorySettings(type_k="q8_0").variant() != MemorySettings(type_v="q8_0").variant()
+    with pytest.raises(ValueError):
+        MemorySettings(type_k="q5_1")
+
+
+def test_fit_keeps_settings_when_there_is_room(make_gguf):
+    info = read_gguf(make_gguf())
+    plan = fit_memory(info, 8192, MemorySettings(headroom_bytes=0), available=1 << 40)
+    assert plan.n_ctx == 8192
+    assert plan.settings == MemorySettings(headroom_bytes=0)
+    assert plan.changes == ()
+
+
+def test_fit_quantizes_kv_before_shrinking_ctx(make_gguf):
+    info = read_gguf(make_gguf())
+    settings = MemorySettings(headroom_bytes=0)
+    q8 = estimate_peak_bytes(info, 8192, MemorySettings(type_k="q8_0", type_v="q8_0"))
+    plan = fit_memory(info, 8192, settings, available=q8.total)
+    assert (plan.n_ctx, plan.settings.type_k, plan.settings.type_v) == (8192, "q8_0", "q8_0")
+    assert plan.settings.llama_kwargs()["flash_attn"] is True
+    assert plan.changes == ("KV cache q8_0/q8_0",)
+
+    q4 = MemorySettings(type_k="q8_0", type_v="q4_0")
+    plan = fit_memory(info, 8192, settings, available=estimate_peak_bytes(info, 4096, q4).total)
+    assert (plan.n_ctx, plan.settings.type_v) == (4096, "q4_0")
+    assert plan.changes[-1] == "ctx 8192 -> 4096"
+
+
+def test_fit_raises_when_weights_alone_do_not_fit(make_gguf):
+    info = read_gguf(make_gguf())
+    with pytest.raises(InsufficientMemoryError, match=str(MIN_CTX)):
+        fit_memory(info, 8192, MemorySettings(headroom_bytes=0), available=info.weights_bytes())
+    # fitting disabled: load as configured and let the OS sort it out
+    plan = fit_memory(info, 8192, MemorySettings(fit=False), available=0)
+    assert plan.n_ctx == 8192 and plan.changes == ()
+
+
+def test_available_memory_caps_by_cgroup(tmp_path, monkeypatch):
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal: 16000000 kB\nMemAvailable: 8000000 kB\n")
+    monkeypatch.setattr(core.memory, "own_cgroup", lambda: "app")
+    root = tmp_path / "cgroup"
+    assert available_memory_bytes(meminfo, root) == 8000000 * 1024
+    (root / "app").mkdir(parents=True)
+    (root / "app" / "memory.max").write_text("max\n")
+    (root / "app" / "memory.current").write_text("0\n")
+    assert available_memory_bytes(meminfo, root) == 8000000 * 1024
+    (root / "app" / "memory.max").write_text(f"{2048 * MB}\n")
+    (root / "app" / "memory.current").write_text(f"{512 * MB}\n")
+    assert available_memory_bytes(meminfo, root) == 1536 * MB
+    assert available_memory_bytes(tmp_path / "missing", tmp_path / "none") is None
+
+
+def test_unparsable_model_loads_as_requested(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    plan = plan_memory(model, 4096, available=0)
+    assert plan.n_ctx == 4096 and plan.estimate is None
+
+
+def test_runner_loads_with_fitted_plan(fake_llama_monkeypatch, make_gguf, monkeypatch):
+    model = make_gguf()
+    info = read_gguf(model)
+    q4 = MemorySettings(type_k="q8_0", type_v="q4_0")
+    monkeypatch.setattr(
+        core.memory, "available_memory_bytes", lambda: estimate_peak_bytes(info, 2048, q4).total
+    )
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model), n_ctx=8192, memory=MemorySettings(use_mmap=False, headroom_bytes=0))
+    assert r.n_ctx == 2048
+    assert r._llm.kwargs["n_ctx"] == 2048
+    assert r._llm.kwargs["use_mmap"] is False
+    assert (r._llm.kwargs["type_k"], r._llm.kwargs["type_v"]) == (8, 2)
+    assert r.memory_plan.changes[-1] == "ctx 8192 -> 2048"
+    assert r.pool.key(str(model), 2048, q4.variant()) in r.pool
+
+
+def test_estimate_counts_speculation_draft_model_and_parallel_slots(make_gguf):
+    info = read_gguf(make_gguf())
+    draft_path = make_gguf("draft.gguf", tensors=(("w", (64, 64), 0),))
+    settings = MemorySettings()
+    base = estimate_peak_bytes(info, 8192, settings)
+    assert (base.logits, base.draft, base.parallel) == (0, 0, 0)
+
+    lookup = estimate_peak_bytes(info, 8192, settings, speculative=SpeculativeConfig("lookup"))
+    assert lookup.logits == 8192 * info.vocab_size * 4
+    assert lookup.total == base.total + lookup.logits
+
+    spec = SpeculativeConfig("draft", str(draft_path))
+    plan = plan_memory(make_gguf(), 8192, settings, available=1 << 40, speculative=spec)
+    draft_alone = estimate_peak_bytes(read_gguf(draft_path), 8192, settings)
+    assert plan.estimate.draft == draft_alone.total
+    assert plan.estimate.total == lookup.total + draft_alone.total
+
+    four = estimate_peak_bytes(info, 8192, settings, n_seq=4)
+    assert four.parallel > 4 * base.kv_cache
+    assert four.total == base.total + four.parallel
+
+
+def test_fit_shrinks_ctx_for_parallel_slots(make_gguf):
+    info = read_gguf(make_gguf())
+    settings = MemorySettings(type_k="q8_0", type_v="q4_0", headroom_bytes=0)
+    single = estimate_peak_bytes(info, 8192, settings)
+    assert fit_memory(info, 8192, settings, available=single.total).n_ctx == 8192
+    plan = fit_memory(info, 8192, settings, available=single.total, n_seq=4)
+    assert plan.n_ctx < 8192 and plan.estimate.total <= single.total
+    assert plan.estimate.parallel > 0
+
+
+def test_runner_plans_for_the_batch_engine(fake_llama_monkeypatch, make_gguf, monkeypatch):
+    model = make_gguf()
+    info = read_gguf(model)
+    settings = MemorySettings(type_k="q8_0", type_v="q4_0", headroom_bytes=0)
+    fits_alone = estimate_peak_bytes(info, 8192, settings).total
+    monkeypatch.setattr(core.memory, "available_memory_bytes", lambda: fits_alone)
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    r.load(str(model), n_ctx=8192, memory=settings)
+    assert r.n_ctx == 8192
+    r.load(str(model), n_ctx=8192, memory=settings, parallel=4)
+    assert r.n_ctx < 8192 and r.memory_plan.estimate.parallel > 0
+
+
+def test_pooled_models_count_as_reclaimable(fake_llama_monkeypatch, make_gguf, monkeypatch):
+    from core.model_pool import ModelPool
+
+    model, other = make_gguf(), make_gguf("other.gguf")
+    settings = MemorySettings(headroom_bytes=0)
+    ram = estimate_peak_bytes(read_gguf(model), 8192, settings).total
+    pool = ModelPool(budget_bytes=1 << 40)  # keeps every model it is given
+    # pooled models use RAM, as they would on a real machine
+    monkeypatch.setattr(core.memory, "available_memory_bytes", lambda: ram - pool.resident_bytes())
+    r = fresh_runner_module().LlamaRunner(pool=pool)
+    r.load(str(model), n_ctx=8192, memory=settings)
+    first = r._llm
+
+    r.load(str(model), n_ctx=8192, memory=settings)
+    assert r._llm is first and r.n_ctx == 8192 and not r.memory_plan.changes
+    # another model evicts the pooled one instead of shrinking its own context
+    r.load(str(other), n_ctx=8192, memory=settings)
+    assert r.n_ctx == 8192 and not r.memory_plan.changes
+    assert pool.stats()["models"] == 1 and pool.stats()["evictions"] == 1
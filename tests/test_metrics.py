@@ -0,0 +1,107 @@
+import json
+import threading
+
+from conftest import fresh_runner_module
+
+from bench.fake import FakeLatency, FakeRunner
+from core.metrics import MetricsLog, MetricsRecorder, RequestMetrics
+
+
+def test_request_metrics_timings():
+    m = RequestMetrics("chat", queue_wait_s=0.5)
+    m.generation_started()
+    assert m.queue_wait_s >= 0.5
+    for _ in range(3):
+        m.token()
+    m.finished("length")
+    assert m.tokens == 3
+    assert m.ttft_s is not None and m.prefill_s is not None
+    assert m.prefill_s <= m.ttft_s
+    d = m.to_dict()
+    assert d["stop_reason"] == "length" and "tokens_per_s" in d
+    assert not any(k.startswith("_") for k in d)
+    assert "3 tokens" in m.summary() and "length" in m.summary()
+
+
+def test_no_rate_for_single_token():
+    m = RequestMetrics()
+    m.token()
+    m.finished("stop")
+    assert m.tokens_per_s is None
+    assert m.prefill_s == m.ttft_s
+
+
+def test_metrics_log_rotates(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    log = MetricsLog(path, max_bytes=100, backups=2)
+    for i in range(10):
+        log.write({"i": i, "pad": "x" * 30})
+    assert path.exists()
+    assert (tmp_path / "metrics.jsonl.1").exists()
+    assert (tmp_path / "metrics.jsonl.2").exists()
+    assert not (tmp_path / "metrics.jsonl.3").exists()
+    last = [json.loads(line) for line in path.read_text().splitlines()]
+    assert last[-1]["i"] == 9
+
+
+def test_prometheus_text():
+    rec = MetricsRecorder()
+    for reason in ("stop", "stop", "cancelled"):
+        m = RequestMetrics(prompt_tokens=10)
+        m.token()
+        m.token()
+        m.finished(reason)
+        rec.record(m)
+    text = rec.prometheus_text()
+    assert 'localai_requests_total{stop_reason="stop"} 2' in text
+    assert 'localai_requests_total{stop_reason="cancelled"} 1' in text
+    assert "localai_prompt_tokens_total 30" in text
+    assert "localai_generated_tokens_total 6" in text
+    assert "localai_ttft_seconds_count 3" in text
+    assert text.endswith("\n")
+
+
+def test_runner_records_every_request(fake_llama_monkeypatch, tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    log = MetricsLog(tmp_path / "metrics.jsonl")
+    r = m.LlamaRunner(metrics=MetricsRecorder(log))
+    r.load(str(model))
+
+    r.chat("", "Hi?")
+    last = r.metrics.last
+    assert last.kind == "chat"
+    assert last.tokens == 3
+    assert last.stop_reason == "stop"
+    # one token per byte of the ChatML prompt, plus BOS
+    assert last.prompt_tokens == len(r._chatml_prompt("", "Hi?").encode()) + 1
+    assert last.ttft_s is not None
+
+    cancel = threading.Event()
+
+    def emit(_delta):
+        cancel.set()
+
+    r._chat_reply("", "again", cancel, 0.0, 16, emit)
+    assert r.metrics.last.stop_reason == "cancelled"
+    records = [json.loads(line) for line in log.path.read_text().splitlines()]
+    assert [rec["stop_reason"] for rec in records] == ["stop", "cancelled"]
+
+
+def test_prefill_is_measured_and_the_prompt_tokenized_once(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    r = FakeRunner(latency=FakeLatency(load_s=0, prefill_s_per_token=0.001, decode_s_per_token=0))
+    r.load(str(model))
+    calls = []
+    tokenize = r._llm.tokenize
+    r._llm.tokenize = lambda *a, **kw: calls.append(a) or tokenize(*a, **kw)
+
+    r.chat("", "x" * 200, max_tokens=4)
+    last = r.metrics.last
+    assert len(calls) == 1
+    # measured around the explicit prefill (all but the last prompt token, which the
+    # completion evaluates), not guessed from TTFT minus inter-token time
+    assert last.prefill_s >= (last.prompt_tokens - 1) * 0.001
+    assert last.prefill_s <= last.ttft_s
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from conftest import llama_metadata
+
+import storage.model_index as model_index
+import ui.chat as chat
+from core.gguf import GGUFError, read_gguf
+from storage.model_index import ModelIndex
+
+
+def test_read_gguf_header(make_gguf):
+    path = make_gguf(tensors=[("a", (256, 256), 0), ("b", (512, 256), 12)])
+    info = read_gguf(path)
+    assert info.architecture == "llama"
+    assert info.quantization == "Q4_K_M"
+    assert info.context_length == 8192
+    assert info.chat_template == "{{ messages }}"
+    assert info.parameter_count == 256 * 256 + 512 * 256
+    assert info.tensor_count == 2
+    # F32: 4 bytes/elem; Q4_K: 144 bytes per 256 elems
+    assert info.tensor_bytes == 256 * 256 * 4 + 512 * 144
+    # 2 layers * ctx * (K + V), head_dim 32 * 4 kv heads, f16
+    assert info.kv_cache_bytes(1024) == 2 * 1024 * (128 * 2 + 128 * 2)
+
+
+def test_read_gguf_rejects_other_files(tmp_path):
+    p = tmp_path / "x.gguf"
+    p.write_bytes(b"dummy")
+    with pytest.raises(GGUFError):
+        read_gguf(p)
+
+
+def test_index_refresh_is_incremental(tmp_path, make_gguf, monkeypatch):
+    models = tmp_path / "models"
+    make_gguf("models/a.gguf")
+    make_gguf("models/sub/b.gguf", llama_metadata(**{"general.architecture": "qwen2"}))
+    (models / "notes.txt").write_text("x")
+
+    calls: list[str] = []
+    real = model_index.read_gguf
+
+    def counting(p):
+        calls.append(os.path.basename(p))
+        return real(p)
+
+    monkeypatch.setattr(model_index, "read_gguf", counting)
+    index_path = tmp_path / "index.json"
+    ModelIndex(index_path, roots=[models]).refresh()
+    assert sorted(calls) == ["a.gguf", "b.gguf"]
+
+    # fresh instance, nothing changed: served from the persisted index
+    calls.clear()
+    index = ModelIndex(index_path, roots=[models])
+    index.refresh()
+    assert calls == []
+    assert [i.architecture for i in index.query(architecture="QWEN2")] == ["qwen2"]
+
+    # only the touched file is re-parsed; removed files drop out
+    make_gguf("models/a.gguf", llama_metadata(**{"general.file_type": 7}))
+    os.utime(models / "a.gguf", ns=(1, 1))
+    (models / "sub" / "b.gguf").unlink()
+    index.refresh()
+    assert calls == ["a.gguf"]
+    assert [i.quantization for i in index.entries()] == ["Q8_0"]
+
+
+def test_index_query_and_best(tmp_path, make_gguf):
+    make_gguf("m/big.gguf", tensors=[("w", (1024, 1024), 0)])
+    make_gguf("m/small.gguf")
+    make_gguf("m/base.gguf", llama_metadata(**{"tokenizer.chat_template": None}))
+    (tmp_path / "m" / "broken.gguf").write_bytes(b"nope")
+
+    index = ModelIndex(tmp_path / "index.json", roots=[tmp_path / "m"])
+    index.refresh()
+    assert len(index.entries()) == 3
+    assert index.best().path.endswith("small.gguf")
+    assert index.best(chat_template=False).path.endswith("base.gguf")
+    assert index.query(min_ctx=16384) == []
+    assert index.best(name="big").path.endswith("big.gguf")
+
+
+def test_find_gguf_model_uses_index(tmp_path, make_gguf, monkeypatch):
+    make_gguf("llm/z-chat.gguf")
+    make_gguf("llm/a-base.gguf", llama_metadata(**{"tokenizer.chat_template": None}))
+    monkeypatch.setattr(chat, "LLM_MODELS_DIR", tmp_path / "llm")
+    monkeypatch.setattr(chat, "MODEL_INDEX_PATH", tmp_path / "index.json")
+    # not simply the alphabetically first file: the base model has no chat template
+    assert chat.find_gguf_model().name == "z-chat.gguf"
+    assert (tmp_path / "index.json").exists()
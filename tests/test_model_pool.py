@@ -0,0 +1,156 @@
+import importlib
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from core.model_pool import ModelPool
+
+MB = 1024 * 1024
+
+
+def _models(tmp_path, *names):
+    out = []
+    for n in names:
+        p = tmp_path / n
+        p.write_bytes(b"x")
+        out.append(str(p))
+    return out
+
+
+def test_pool_lru_eviction_and_counters(tmp_path):
+    a, b, c = _models(tmp_path, "a.gguf", "b.gguf", "c.gguf")
+    pool = ModelPool(budget_bytes=250 * MB, estimator=lambda path, n_ctx: 100 * MB)
+    loads: list[str] = []
+
+    def loader(path):
+        return lambda: loads.append(path) or object()
+
+    ma = pool.acquire(a, 2048, loader(a))
+    pool.acquire(b, 2048, loader(b))
+    assert pool.acquire(a, 2048, loader(a)) is ma  # hit, a is now most recent
+    pool.acquire(c, 2048, loader(c))  # evicts b (LRU), not a
+    pool.acquire(a, 2048, loader(a))
+
+    assert loads == [a, b, c]
+    assert pool.stats() == {
+        "hits": 2,
+        "misses": 3,
+        "evictions": 1,
+        "models": 2,
+        "resident_bytes": 200 * MB,
+        "budget_bytes": 250 * MB,
+    }
+    # same file, different context size is a different model instance
+    pool.acquire(a, 4096, loader(a))
+    assert pool.misses == 4
+
+
+def test_pool_uses_gguf_estimate(tmp_path, make_gguf):
+    path = make_gguf(tensors=[("w", (1024, 1024), 1)])  # 2 MB of f16 weights
+    pool = ModelPool(budget_bytes=100 * MB)
+    pool.acquire(str(path), 1024, object)
+    # weights + f16 KV cache: 2 layers * 1024 ctx * (128 + 128) * 2 bytes
+    assert pool.resident_bytes() == 2 * MB + 2 * 1024 * 256 * 2
+
+
+def test_zero_budget_keeps_only_current(tmp_path):
+    a, b = _models(tmp_path, "a.gguf", "b.gguf")
+    pool = ModelPool(budget_bytes=0, estimator=lambda path, n_ctx: MB)
+    pool.acquire(a, 512, object)
+    pool.acquire(b, 512, object)
+    assert pool.stats()["models"] == 1
+    pool.trim()
+    assert pool.stats()["models"] == 0
+
+
+def test_evicts_before_loading_and_unlocks_during_load(tmp_path):
+    a, b = _models(tmp_path, "a.gguf", "b.gguf")
+    pool = ModelPool(budget_bytes=150 * MB, estimator=lambda path, n_ctx: 100 * MB)
+    pool.acquire(a, 2048, object)
+    seen = {}
+
+    def loader():
+        # a is already gone, and the pool can be used from another thread meanwhile
+        seen["resident"] = pool.resident_bytes()
+        t = threading.Thread(target=lambda: seen.update(stats=pool.stats()))
+        t.start()
+        t.join(timeout=1)
+        return object()
+
+    pool.acquire(b, 2048, loader)
+    assert seen["resident"] == 0 and seen["stats"]["evictions"] == 1
+
+
+def test_failed_load_leaves_a_consistent_pool(tmp_path):
+    a, b = _models(tmp_path, "a.gguf", "b.gguf")
+    pool = ModelPool(budget_bytes=150 * MB, estimator=lambda path, n_ctx: 100 * MB)
+    pool.acquire(a, 2048, object)
+
+    def bad_loader():
+        raise ValueError("bad model file")
+
+    with pytest.raises(ValueError, match="bad model file"):
+        pool.acquire(b, 2048, bad_loader)
+    assert pool.stats()["models"] == 0 and pool.key(b, 2048) not in pool
+    ma = pool.acquire(a, 2048, object)  # the evicted model loads again on demand
+    assert pool.acquire(a, 2048, object) is ma
+
+
+def test_concurrent_misses_load_once(tmp_path):
+    (a,) = _models(tmp_path, "a.gguf")
+    pool = ModelPool(budget_bytes=150 * MB, estimator=lambda path, n_ctx: 100 * MB)
+    loads: list[int] = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return object()
+
+    got: list[object] = []
+    threads = [
+        threading.Thread(target=lambda: got.append(pool.acquire(a, 2048, loader))) for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    assert len(loads) == 1 and len(got) == 4 and len({id(m) for m in got}) == 1
+
+
+@pytest.fixture
+def runner_module(monkeypatch):
+    created: list[dict] = []
+
+    class _Llama:
+        def __init__(self, **kw):
+            created.append(kw)
+
+    mod = types.ModuleType("llama_cpp")
+    mod.Llama = _Llama
+    monkeypatch.setitem(sys.modules, "llama_cpp", mod)
+    sys.modules.pop("core.llm_adapter", None)
+    m = importlib.import_module("core.llm_adapter")
+    m.created = created
+    yield m
+    sys.modules.pop("core.llm_adapter", None)
+
+
+def test_runner_switches_models_without_reload(tmp_path, runner_module):
+    small, large = _models(tmp_path, "small.gguf", "large.gguf")
+    r = runner_module.LlamaRunner(ModelPool(budget_bytes=10 * MB, estimator=lambda p, n: MB))
+    for path in (small, large, small, large):
+        r.load(path, n_ctx=512)
+        assert r.model_path == path
+    assert len(runner_module.created) == 2
+    assert r.pool.stats()["hits"] == 2
+
+
+def test_runner_default_pool_frees_on_unload(tmp_path, runner_module):
+    (path,) = _models(tmp_path, "m.gguf")
+    r = runner_module.LlamaRunner()
+    r.load(path, n_ctx=512)
+    r.unload()
+    assert r.pool.stats()["models"] == 0
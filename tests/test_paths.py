@@ -1,9 +1,23 @@
 import importlib
 import sys
 
+import pytest
+
 from config import ENV_ASSETS
 
 
+@pytest.fixture(autouse=True)
+def restore_sys():
+    # reload_paths fakes a frozen app; undo it so later tests (e.g. spawning a worker
+    # process) see the real interpreter
+    executable = sys.executable
+    yield
+    sys.executable = executable
+    for name in ("frozen", "_MEIPASS"):
+        if hasattr(sys, name):
+            delattr(sys, name)
+
+
 def reload_paths(tmp_assets=None, frozen=False, meipass=None, exe=None):
     # Build a fresh module namespace so globals recompute on import
     if "paths" in sys.modules:
@@ -0,0 +1,127 @@
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from bench.fake import FakeLatency, FakeRunner
+from core.conversation import Conversation
+from core.embeddings import normalize
+from core.rag import CONTEXT_HEADER, DocumentIndex, _read_ahead, chunk_text
+
+
+class HashingEmbedder:
+    """Bag of hashed words; texts sharing words get similar vectors."""
+
+    name = "hashing"
+    dim = 64
+
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        self.embedded += texts
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                out[i, zlib.crc32(word.encode()) % self.dim] += 1.0
+        return normalize(out)
+
+
+def _write_docs(folder, n=30):
+    for i in range(n):
+        sub = folder / f"d{i % 3}"
+        sub.mkdir(parents=True, exist_ok=True)
+        (sub / f"note{i}.md").write_text(f"Note {i}. " + "filler text " * 50, encoding="utf-8")
+    (folder / "d0" / "llamas.txt").write_text(
+        "Llamas are domesticated camelids from the Andes.", encoding="utf-8"
+    )
+    (folder / "image.png").write_bytes(b"\x89PNG")
+
+
+def test_chunk_text_prefers_boundaries_and_overlaps():
+    text = "\n\n".join(f"Paragraph {i}. " + "word " * 30 for i in range(10))
+    chunks = chunk_text(text, size=400, overlap=50)
+    assert all(len(c) <= 400 for c in chunks)
+    assert all(c.endswith("word") for c in chunks[:-1])  # cut at paragraph breaks
+    assert all(c.split()[0] in ("word", "Paragraph") for c in chunks)
+    assert chunks[1][:20] in chunks[0]
+    assert "Paragraph 9" in chunks[-1]
+    assert chunk_text("short", size=400) == ["short"]
+    assert chunk_text("   ") == []
+
+
+def test_refresh_only_embeds_changed_files(tmp_path):
+    folder = tmp_path / "docs"
+    _write_docs(folder)
+    embed = HashingEmbedder()
+    rag = DocumentIndex(folder, embed, root=tmp_path / "index", chunk_chars=200, batch_size=16)
+
+    stats = rag.refresh()
+    assert (stats.scanned, stats.added) == (31, 31)
+    assert stats.chunks == len(embed.embedded) > 31
+
+    embed.embedded.clear()
+    again = DocumentIndex(folder, embed, root=tmp_path / "index", chunk_chars=200)
+    assert again.refresh().chunks == 0 and embed.embedded == []
+
+    touched = folder / "d1" / "note1.md"
+    os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 10**9))
+    changed = folder / "d2" / "note2.md"
+    changed.write_text("Alpacas are smaller than llamas.", encoding="utf-8")
+    (folder / "d0" / "note0.md").unlink()
+    stats = again.refresh()
+    assert (stats.updated, stats.touched, stats.removed) == (1, 1, 1)
+    assert embed.embedded == ["Alpacas are smaller than llamas."]
+
+    hits = again.search("llamas from the Andes", k=2)
+    assert hits[0].path == "d0/llamas.txt" and hits[0].text.startswith("Llamas are")
+    assert {h.path for h in hits} == {"d0/llamas.txt", "d2/note2.md"}
+
+
+def test_retrieved_context_goes_into_the_user_turn(tmp_path):
+    folder = tmp_path / "docs"
+    _write_docs(folder, n=3)
+    rag = DocumentIndex(folder, HashingEmbedder(), root=tmp_path / "index")
+    rag.refresh()
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    runner = FakeRunner(latency=FakeLatency(0, 0, 0), rag=rag)
+    runner.rag_top_k = 1
+    runner.load(str(model))
+
+    runner.chat("", "Llamas from the Andes?", max_tokens=2)
+    prompt = bytes(t for t in runner._llm.evaluated).decode("utf-8", errors="replace")
+    assert f"{CONTEXT_HEADER}\n\n[1] d0/llamas.txt\nLlamas are" in prompt
+    assert prompt.index("camelids") < prompt.index("Llamas from the Andes?")
+
+    conv = Conversation()
+    _q, _cancel, th = runner.stream_conversation(conv, "Llamas from the Andes?", max_tokens=2)
+    th.join()
+    assert conv.messages[0].content == "Llamas from the Andes?"
+    assert "d0/llamas.txt" in conv.messages[0].context
+    assert b"Andes." in bytes(runner._message_tokens(conv.messages[0]))
+
+
+def test_nothing_injected_below_min_score(tmp_path):
+    folder = tmp_path / "docs"
+    _write_docs(folder, n=3)
+    rag = DocumentIndex(folder, HashingEmbedder(), root=tmp_path / "index", min_score=2.0)
+    rag.refresh()
+    assert rag.search("llamas") == []
+
+
+def test_read_ahead_producer_exits_when_abandoned():
+    def reader_threads():
+        return [t for t in threading.enumerate() if t.name == "localai-rag-read"]
+
+    items = _read_ahead(iter(range(2)), depth=1)
+    assert next(items) == 0
+    time.sleep(0.05)  # the producer has filled the queue and is waiting to put the end
+    items.close()
+    deadline = time.perf_counter() + 2
+    while reader_threads() and time.perf_counter() < deadline:
+        time.sleep(0.02)
+    assert not reader_threads()
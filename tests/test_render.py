@@ -0,0 +1,54 @@
+import asyncio
+
+from ui.render import CoalescingWriter
+
+
+class _Node:
+    def __init__(self, value: str = "") -> None:
+        self.value = value
+        self.updates = 0
+
+    def update(self) -> None:
+        self.updates += 1
+
+
+def test_fast_stream_is_flushed_per_frame():
+    async def run() -> _Node:
+        node = _Node("Assistant: ")
+        writer = CoalescingWriter(node, fps=20)
+        # 200 tokens in ~0.2 s (1000 tok/s) -> about 4 frames, not 200 updates
+        for i in range(200):
+            writer.write(f"t{i} ")
+            if i % 10 == 0:
+                await asyncio.sleep(0.01)
+        writer.close()
+        return node
+
+    node = asyncio.run(run())
+    assert node.value == "Assistant: " + "".join(f"t{i} " for i in range(200))
+    assert node.updates <= 8
+
+
+def test_trailing_deltas_flush_without_close():
+    async def run() -> _Node:
+        node = _Node()
+        writer = CoalescingWriter(node, fps=50)
+        writer.write("a")  # first delta draws immediately
+        writer.write("b")  # within the frame: deferred to the timer
+        assert node.value == "a"
+        await asyncio.sleep(0.05)
+        return node
+
+    assert asyncio.run(run()).value == "ab"
+
+
+def test_zero_fps_updates_every_delta():
+    async def run() -> _Node:
+        node = _Node()
+        writer = CoalescingWriter(node, fps=0)
+        for ch in "abc":
+            writer.write(ch)
+        return node
+
+    node = asyncio.run(run())
+    assert (node.value, node.updates) == ("abc", 3)
@@ -0,0 +1,108 @@
+import sys
+import threading
+
+import pytest
+from conftest import FakeLlama, fresh_runner_module
+
+from storage.response_cache import ResponseCache
+
+
+def test_memory_lru_and_disk_roundtrip(tmp_path):
+    cache = ResponseCache(tmp_path, max_entries=2)
+    for k in ("a", "b", "c"):
+        cache.put(k * 8, [k, "!"])
+    assert cache.stats()["entries"] == 2
+    assert cache.get("aaaaaaaa") == ["a", "!"]  # evicted from memory, read back from disk
+    assert cache.get("cccccccc") == ["c", "!"]
+    assert cache.get("zzzzzzzz") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"], stats["stores"]) == (2, 1, 1, 3)
+
+    # a new instance (next app start) sees everything on disk
+    again = ResponseCache(tmp_path)
+    assert again.get("bbbbbbbb") == ["b", "!"]
+
+
+def test_disk_budget_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, max_entries=0, budget_bytes=150)
+    cache.put("k1" * 4, ["x" * 40])
+    cache.put("k2" * 4, ["y" * 40])
+    cache.put("k3" * 4, ["z" * 40])
+    assert cache.stats()["disk_bytes"] <= 150
+    assert cache.get("k1" * 4) is None
+    assert cache.get("k3" * 4) == ["z" * 40]
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ResponseCache(tmp_path)
+    p = cache.path_for("deadbeef")
+    p.parent.mkdir(parents=True)
+    p.write_text("{not json", encoding="utf-8")
+    assert cache.get("deadbeef") is None
+
+
+class _CountingLlama(FakeLlama):
+    calls: list[dict] = []
+
+    def create_completion(self, **kw):
+        _CountingLlama.calls.append(kw)
+        for t in ["Hel", "lo", "!"]:
+            yield {"choices": [{"text": t}]}
+
+
+@pytest.fixture
+def runner(fake_llama_monkeypatch, tmp_path):
+    fake_llama_monkeypatch.Llama = _CountingLlama
+    m = fresh_runner_module()
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    r = m.LlamaRunner(cache=ResponseCache(tmp_path / "cache"))
+    r.load(str(model))
+    _CountingLlama.calls = []
+    yield r
+    sys.modules.pop("core.llm_adapter", None)
+
+
+def _drain(q):
+    out = []
+    while (item := q.get()) is not None:
+        out.append(item)
+    return out
+
+
+def test_runner_replays_hits_through_stream(runner):
+    first = _drain(runner.stream_chat("sys", "Hi", temperature=0.0)[0])
+    second = _drain(runner.stream_chat("sys", "Hi", temperature=0.0)[0])
+    assert first == second == ["Hel", "lo", "!"]
+    assert len(_CountingLlama.calls) == 1
+    assert runner.cache.stats()["hits"] == 1
+
+    # any change to prompt or sampling params is a different entry
+    runner.chat("sys", "Hi", temperature=0.0, max_tokens=7)
+    runner.chat("other", "Hi", temperature=0.0)
+    assert len(_CountingLlama.calls) == 3
+
+
+def test_runner_only_caches_reproducible_replies(runner):
+    runner.chat("", "Hi", temperature=0.9)
+    runner.chat("", "Hi", temperature=0.9)
+    assert len(_CountingLlama.calls) == 2  # sampled reply, no seed: never cached
+
+    runner.chat("", "Hi", temperature=0.9, seed=42)
+    runner.chat("", "Hi", temperature=0.9, seed=42)
+    assert len(_CountingLlama.calls) == 3
+    assert _CountingLlama.calls[-1]["seed"] == 42
+    assert "seed" not in _CountingLlama.calls[0]
+
+
+def test_cancelled_reply_is_not_cached(runner):
+    cancel = threading.Event()
+    got = []
+
+    def emit(delta):
+        got.append(delta)
+        cancel.set()  # the user hits Stop after the first chunk
+
+    runner._chat_reply("", "Hi", cancel, 0.0, 16, emit)
+    assert got == ["Hel"]
+    assert runner.cache.stats()["stores"] == 0
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from core.scheduler import GenerationScheduler, QueueFullError
+
+
+def _job(log: list[str], name: str, delay: float = 0.01):
+    async def run() -> str:
+        log.append(f"start {name}")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(f"cancel {name}")
+            raise
+        log.append(f"end {name}")
+        return name
+
+    return run
+
+
+def test_fifo_queue_runs_one_at_a_time():
+    async def run() -> tuple[list[str], list[str]]:
+        log: list[str] = []
+        s = GenerationScheduler(maxsize=4)
+        futs = [s.submit(_job(log, n)) for n in "abc"]
+        return log, await asyncio.gather(*futs)
+
+    log, results = asyncio.run(run())
+    assert results == ["a", "b", "c"]
+    assert log == ["start a", "end a", "start b", "end b", "start c", "end c"]
+
+
+def test_priority_ordering():
+    async def run() -> list[str]:
+        log: list[str] = []
+        s = GenerationScheduler(ordering="priority")
+        s.submit(_job(log, "first"), priority=5)
+        await asyncio.sleep(0)  # "first" is running before the others arrive
+        futs = [
+            s.submit(_job(log, "low"), priority=9),
+            s.submit(_job(log, "high"), priority=1),
+            s.submit(_job(log, "mid"), priority=5),
+        ]
+        await asyncio.gather(*futs)
+        return [e.split()[1] for e in log if e.startswith("start")]
+
+    assert asyncio.run(run()) == ["first", "high", "mid", "low"]
+
+
+def test_bounded_queue_rejects():
+    async def run() -> None:
+        s = GenerationScheduler(maxsize=2)
+        s.submit(_job([], "a"))
+        s.submit(_job([], "b"))
+        with pytest.raises(QueueFullError):
+            s.submit(_job([], "c"))
+        s.cancel_all()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+
+def test_cancel_policy_replaces_running_and_queued():
+    async def run() -> tuple[list[str], list]:
+        log: list[str] = []
+        s = GenerationScheduler(policy="cancel")
+        a = s.submit(_job(log, "a", delay=1))
+        await asyncio.sleep(0.01)
+        b = s.submit(_job(log, "b", delay=1))
+        c = s.submit(_job(log, "c"))
+        results = await asyncio.gather(a, b, c, return_exceptions=True)
+        return log, results
+
+    log, results = asyncio.run(run())
+    assert log == ["start a", "cancel a", "start c", "end c"]
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert results[2] == "c"
+
+
+def test_cancel_current_does_not_block_and_queue_continues():
+    async def run() -> list[str]:
+        log: list[str] = []
+        s = GenerationScheduler()
+        s.submit(_job(log, "a", delay=5))
+        b = s.submit(_job(log, "b"))
+        await asyncio.sleep(0.01)
+        s.cancel_current()
+        await b
+        return log
+
+    assert asyncio.run(run()) == ["start a", "cancel a", "start b", "end b"]
+
+
+def test_fair_ordering_round_robins_clients():
+    async def run() -> list[str]:
+        log: list[str] = []
+        s = GenerationScheduler(maxsize=0, ordering="fair")
+        futs = [s.submit(_job(log, f"a{i}"), client="a") for i in range(3)]
+        futs += [s.submit(_job(log, f"b{i}"), client="b") for i in range(2)]
+        futs.append(s.submit(_job(log, "c0"), client="c"))
+        await asyncio.gather(*futs)
+        return [e.split()[1] for e in log if e.startswith("start")]
+
+    assert asyncio.run(run()) == ["a0", "b0", "c0", "a1", "b1", "a2"]
+
+
+def test_cancelling_future_cancels_running_job():
+    async def run() -> list[str]:
+        log: list[str] = []
+        s = GenerationScheduler()
+        fut = s.submit(_job(log, "a", delay=10))
+        await asyncio.sleep(0.01)
+        fut.cancel()
+        await s.submit(_job(log, "b"))
+        return log
+
+    assert asyncio.run(run()) == ["start a", "cancel a", "start b", "end b"]
+
+
+def test_concurrency_runs_jobs_side_by_side():
+    async def run() -> list[str]:
+        log: list[str] = []
+        s = GenerationScheduler(concurrency=2)
+        futs = [s.submit(_job(log, n)) for n in "abc"]
+        await asyncio.gather(*futs)
+        return log
+
+    log = asyncio.run(run())
+    assert log[:2] == ["start a", "start b"]
+    assert log.index("start c") > log.index("end a")
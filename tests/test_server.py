@@ -0,0 +1,274 @@
+import asyncio
+import importlib
+import json
+import sys
+import time
+
+import pytest
+from conftest import FakeBatchBackend, FakeLlama
+
+from core.batching import BatchEngine
+from core.scheduler import GenerationScheduler
+
+
+@pytest.fixture
+def server_module(fake_llama_monkeypatch, tmp_path):
+    for name in ("core.llm_adapter", "server"):
+        sys.modules.pop(name, None)
+    yield importlib.import_module("server")
+    for name in ("core.llm_adapter", "server"):
+        sys.modules.pop(name, None)
+
+
+def _runner(m, tmp_path):
+    model = tmp_path / "tiny.gguf"
+    model.write_bytes(b"x")
+    r = m.LlamaRunner()
+    r.load(str(model))
+    return r
+
+
+async def _request(port, method, path, payload=None, headers=()):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = [f"{method} {path} HTTP/1.1", "Host: x", "Connection: close", *headers]
+    head.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    raw = await reader.read()
+    writer.close()
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, head.decode(), body.decode()
+
+
+def _serve(m, runner, scenario, scheduler=None, engine=None):
+    async def run():
+        server = m.OpenAIServer(runner, scheduler, engine=engine)
+        await server.start("127.0.0.1", 0)
+        try:
+            return await scenario(server)
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def test_chat_completion_json(server_module, tmp_path):
+    runner = _runner(server_module, tmp_path)
+    msgs = [
+        {"role": "system", "content": "Be brief."},
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello"},
+        {"role": "user", "content": [{"type": "text", "text": "Again?"}]},
+    ]
+
+    async def scenario(server):
+        return await _request(server.port, "POST", "/v1/chat/completions", {"messages": msgs})
+
+    status, _, body = _serve(server_module, runner, scenario)
+    assert status == 200
+    data = json.loads(body)
+    assert data["object"] == "chat.completion"
+    assert data["model"] == "tiny"
+    assert data["choices"][0]["message"] == {"role": "assistant", "content": "Hello, world!\n"}
+    assert data["choices"][0]["finish_reason"] == "stop"
+
+
+def test_chat_completion_sse_stream(server_module, tmp_path):
+    runner = _runner(server_module, tmp_path)
+    payload = {"messages": [{"role": "user", "content": "Hi"}], "stream": True}
+
+    async def scenario(server):
+        return await _request(server.port, "POST", "/v1/chat/completions", payload)
+
+    status, head, body = _serve(server_module, runner, scenario)
+    assert status == 200 and "text/event-stream" in head
+    events = [line[len("data: ") :] for line in body.split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+    assert text == "Hello, world!\n"
+    assert chunks[0]["choices"][0]["delta"]["role"] == "assistant"
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    assert {c["object"] for c in chunks} == {"chat.completion.chunk"}
+
+
+def test_completions_and_models(server_module, tmp_path):
+    runner = _runner(server_module, tmp_path)
+
+    async def scenario(server):
+        done = await _request(
+            server.port, "POST", "/v1/completions", {"prompt": "Once", "max_tokens": 2}
+        )
+        models = await _request(server.port, "GET", "/v1/models")
+        metrics = await _request(server.port, "GET", "/metrics")
+        return done, models, metrics
+
+    (status, _, body), (m_status, _, m_body), metrics = _serve(server_module, runner, scenario)
+    assert status == 200
+    choice = json.loads(body)["choices"][0]
+    assert choice["text"].startswith("Hello")
+    assert m_status == 200 and json.loads(m_body)["data"][0]["id"] == "tiny"
+    assert metrics[0] == 200 and "text/plain" in metrics[1]
+    assert 'localai_requests_total{stop_reason="stop"} 1' in metrics[2]
+
+
+def test_errors(server_module, tmp_path):
+    runner = _runner(server_module, tmp_path)
+
+    async def scenario(server):
+        return [
+            await _request(server.port, "POST", "/v1/nope", {}),
+            await _request(server.port, "GET", "/v1/completions"),
+            await _request(server.port, "POST", "/v1/chat/completions", {"messages": []}),
+            await _request(server.port, "POST", "/v1/completions", {"max_tokens": 1}),
+        ]
+
+    statuses = [s for s, _, _ in _serve(server_module, runner, scenario)]
+    assert statuses == [404, 405, 400, 400]
+
+
+def test_full_queue_returns_429(server_module, tmp_path):
+    runner = _runner(server_module, tmp_path)
+
+    async def scenario(server):
+        release = asyncio.Event()
+        sched = server.scheduler
+        sched.submit(release.wait)  # occupies the model
+        await asyncio.sleep(0)
+        sched.submit(release.wait)  # fills the one queue slot
+        status, head, body = await _request(server.port, "POST", "/v1/completions", {"prompt": "x"})
+        release.set()
+        return status, head, body
+
+    status, head, body = _serve(
+        server_module, runner, scenario, GenerationScheduler(maxsize=1, ordering="fair")
+    )
+    assert status == 429
+    assert "Retry-After" in head
+    assert json.loads(body)["error"]["type"] == "rate_limit_exceeded"
+
+
+def test_keep_alive_serves_several_requests(server_module, tmp_path):
+    runner = _runner(server_module, tmp_path)
+
+    async def scenario(server):
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        statuses = []
+        for _ in range(2):
+            writer.write(b"GET /v1/models HTTP/1.1\r\nHost: x\r\n\r\n")
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await reader.readexactly(length)
+            statuses.append(int(head.split()[1]))
+        writer.close()
+        return statuses
+
+    assert _serve(server_module, runner, scenario) == [200, 200]
+
+
+def test_parallel_requests_share_the_batch_engine(server_module, tmp_path):
+    runner = _runner(server_module, tmp_path)
+    backend = FakeBatchBackend(n_seq_max=3, delay=0.002)
+    engine = BatchEngine(backend)
+    scheduler = GenerationScheduler(maxsize=8, ordering="fair", concurrency=3)
+    prompts = ["alpha", "bravo charlie", "delta"]
+
+    async def scenario(server):
+        return await asyncio.gather(
+            *(
+                _request(server.port, "POST", "/v1/completions", {"prompt": p, "max_tokens": 64})
+                for p in prompts
+            )
+        )
+
+    results = _serve(server_module, runner, scenario, scheduler, engine)
+    engine.close()
+    choices = [json.loads(body)["choices"][0] for _, _, body in results]
+    assert [c["text"] for c in choices] == [p.upper() for p in prompts]
+    assert {c["finish_reason"] for c in choices} == {"stop"}
+    assert any(len(call) > 1 for call in backend.calls)
+    # batched requests are measured like the others
+    assert runner.metrics.requests == {"stop": 3}
+    assert runner.metrics.tokens > 0 and runner.metrics.last.kind == "completion"
+
+
+def test_batched_requests_use_the_response_cache(server_module, tmp_path):
+    from storage.response_cache import ResponseCache
+
+    runner = _runner(server_module, tmp_path)
+    runner.cache = ResponseCache(tmp_path / "cache")
+    backend = FakeBatchBackend(n_seq_max=2)
+    engine = BatchEngine(backend)
+    body = {"prompt": "echo", "max_tokens": 16, "temperature": 0.0}
+
+    async def scenario(server):
+        first = await _request(server.port, "POST", "/v1/completions", body)
+        calls = len(backend.calls)
+        second = await _request(server.port, "POST", "/v1/completions", body)
+        return first, second, calls
+
+    first, second, calls = _serve(server_module, runner, scenario, engine=engine)
+    engine.close()
+    assert json.loads(first[2])["choices"][0]["text"] == "ECHO"
+    assert json.loads(second[2])["choices"][0]["text"] == "ECHO"
+    assert len(backend.calls) == calls  # the repeat never reached the engine
+    assert runner.metrics.requests == {"stop": 1, "cached": 1}
+
+
+class _LengthLlama(FakeLlama):
+    """Stops on its own token limit before the request's max_tokens, like n_ctx does."""
+
+    def create_completion(self, *, prompt, stream, **kw):
+        yield {"choices": [{"text": "Hello", "finish_reason": None}]}
+        yield {"choices": [{"text": "!", "finish_reason": "length"}]}
+
+
+def test_finish_reason_comes_from_the_model(server_module, tmp_path):
+    sys.modules["llama_cpp"].Llama = _LengthLlama
+    runner = _runner(server_module, tmp_path)
+    msgs = [{"role": "user", "content": "Hi"}]
+
+    async def scenario(server):
+        plain = await _request(server.port, "POST", "/v1/chat/completions", {"messages": msgs})
+        streamed = await _request(
+            server.port, "POST", "/v1/completions", {"prompt": "x", "stream": True}
+        )
+        return plain, streamed
+
+    (_, _, plain), (_, _, streamed) = _serve(server_module, runner, scenario)
+    # two tokens out of max_tokens=DEFAULT_MAX_TOKENS: counting deltas would say "stop"
+    assert json.loads(plain)["choices"][0]["finish_reason"] == "length"
+    events = [line[len("data: ") :] for line in streamed.split("\n\n") if line]
+    assert json.loads(events[-2])["choices"][0]["finish_reason"] == "length"
+
+
+class _SlowLlama(FakeLlama):
+    def create_completion(self, *, prompt, stream, max_tokens, **kw):
+        for _ in range(max_tokens):
+            time.sleep(0.01)
+            yield {"choices": [{"text": "x", "finish_reason": None}]}
+
+
+def test_non_streaming_request_stops_when_the_client_hangs_up(server_module, tmp_path):
+    sys.modules["llama_cpp"].Llama = _SlowLlama
+    runner = _runner(server_module, tmp_path)
+
+    async def scenario(server):
+        _reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        body = json.dumps({"prompt": "x", "max_tokens": 1000}).encode()
+        head = f"POST /v1/completions HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}"
+        writer.write(head.encode() + b"\r\n\r\n" + body)
+        await asyncio.sleep(0.2)
+        assert server.scheduler.busy
+        writer.close()
+        started = time.perf_counter()
+        while server.scheduler.busy and time.perf_counter() - started < 3:
+            await asyncio.sleep(0.02)
+        return time.perf_counter() - started
+
+    elapsed = _serve(server_module, runner, scenario)
+    assert elapsed < 1.5  # well before 1000 tokens at 10 ms each
+    runner._gen_lock.acquire(timeout=1)  # the worker let go of the model
+    assert runner.metrics.last.stop_reason == "cancelled"
+    assert runner.metrics.last.tokens < 200
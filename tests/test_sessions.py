@@ -0,0 +1,138 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+from storage.sessions import SessionStore, model_key
+
+
+def test_save_load_roundtrip(tmp_path):
+    store = SessionStore(tmp_path, budget_bytes=1 << 20)
+    state = bytes(range(256)) * 4
+    store.save("conv1", "k", [1, 2, 3], state, {"seed": 7})
+
+    snap = store.load("conv1", "k")
+    assert snap is not None
+    with snap:
+        assert snap.tokens == [1, 2, 3]
+        assert bytes(snap.state) == state
+        assert snap.meta == {"seed": 7}
+    assert store.latest("k") == "conv1"
+    assert store.load("conv1", "other") is None
+
+
+def test_model_key_changes_with_ctx_and_file(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    k = model_key(model, 2048)
+    assert k == model_key(model, 2048)
+    assert k != model_key(model, 4096)
+    assert k == model_key(model, 2048, "f16", "f16", False)
+    assert k != model_key(model, 2048, "q8_0", "q8_0", True)
+    assert model_key(model, 2048, "q8_0", "q4_0") != model_key(model, 2048, "q8_0", "q8_0")
+    assert k != model_key(model, 2048, flash_attn=True)
+    model.write_bytes(b"xy")
+    assert k != model_key(model, 2048)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = SessionStore(tmp_path, budget_bytes=2500)
+    for i, name in enumerate(["a", "b"]):
+        store.save(name, "k", [], b"\0" * 1000)
+        os.utime(store.path_for(name, "k"), (1000 + i, 1000 + i))
+    # touching "a" makes "b" the eviction candidate
+    store.load("a", "k").close()
+    store.save("c", "k", [], b"\0" * 1000)
+    assert store.path_for("a", "k").exists()
+    assert not store.path_for("b", "k").exists()
+    assert store.path_for("c", "k").exists()
+    assert store.total_bytes() <= 2500
+
+
+def test_corrupt_snapshot_is_dropped(tmp_path):
+    store = SessionStore(tmp_path)
+    path = store.path_for("conv", "k")
+    path.write_bytes(b"garbage")
+    assert store.load("conv", "k") is None
+    assert not path.exists()
+
+
+class _StateRunner:
+    def __init__(self, model_path: str) -> None:
+        self.model_path = model_path
+        self.n_ctx = 2048
+        self.restored = None
+
+    def is_loaded(self) -> bool:
+        return True
+
+    def save_state(self):
+        return [5, 6, 7], b"kv-cache", 3
+
+    def load_state(self, tokens, state, seed=0):
+        self.restored = (tokens, bytes(state), seed)
+
+
+def test_chat_view_saves_and_restores(tmp_path):
+    import ui.chat as chat
+
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    store = SessionStore(tmp_path / "sessions")
+    page = SimpleNamespace(update=lambda: None)
+
+    view = chat.ChatView(page, _StateRunner(str(model)), lambda _: None, sessions=store)
+    view.conversation.add("user", "hi")
+    view.conversation.add("assistant", "hello")
+    assert view.save_session()
+
+    runner = _StateRunner(str(model))
+    reopened = chat.ChatView(page, runner, lambda _: None, sessions=store)
+    assert reopened._restore_session()
+    assert runner.restored == ([5, 6, 7], b"kv-cache", 3)
+    assert reopened.conversation.id == view.conversation.id
+    assert [(m.role, m.content) for m in reopened.conversation.messages] == [
+        ("user", "hi"),
+        ("assistant", "hello"),
+    ]
+
+
+def test_idle_save_after_reply(tmp_path, monkeypatch):
+    import ui.chat as chat
+
+    monkeypatch.setattr(chat, "DEFAULT_SESSION_IDLE_SECS", 0)
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    store = SessionStore(tmp_path / "sessions")
+
+    async def run() -> None:
+        page = SimpleNamespace(
+            update=lambda: None, run_task=lambda coro, *a: asyncio.create_task(coro(*a))
+        )
+        view = chat.ChatView(page, _StateRunner(str(model)), lambda _: None, sessions=store)
+        view.conversation.add("user", "hi")
+        view._schedule_idle_save()
+        await view._idle_task
+
+    asyncio.run(run())
+    assert store.latest(model_key(model, 2048))
+
+
+def test_snapshot_is_not_restored_into_another_kv_layout(tmp_path):
+    import ui.chat as chat
+    from core.memory import MemoryPlan, MemorySettings
+
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    store = SessionStore(tmp_path / "sessions")
+    page = SimpleNamespace(update=lambda: None)
+    saver = _StateRunner(str(model))
+    saver.memory_plan = MemoryPlan(MemorySettings(), 2048)
+    view = chat.ChatView(page, saver, lambda _: None, sessions=store)
+    view.conversation.add("user", "hi")
+    assert view.save_session()
+
+    # the next load had to quantize the KV cache to fit RAM
+    runner = _StateRunner(str(model))
+    runner.memory_plan = MemoryPlan(MemorySettings(type_k="q8_0", type_v="q8_0"), 2048)
+    assert not chat.ChatView(page, runner, lambda _: None, sessions=store)._restore_session()
+    assert runner.restored is None
@@ -0,0 +1,176 @@
+import ctypes
+import sys
+import types
+
+import numpy as np
+import pytest
+from conftest import FakeLlama, fresh_runner_module
+
+from core.model_pool import ModelPool
+from core.speculative import CountingDraftModel, GGUFDraftModel, SpeculativeConfig
+
+
+class _ScriptedDraft:
+    def __init__(self, drafts):
+        self.drafts = list(drafts)
+        self.seen = []
+
+    def __call__(self, input_ids, /, **kwargs):
+        self.seen.append(list(input_ids))
+        return np.array(self.drafts.pop(0), dtype=np.intc)
+
+
+def test_counting_draft_model_estimates_acceptance():
+    d = CountingDraftModel(_ScriptedDraft([[5, 6, 7], [9, 9], [1], [2]]))
+    d(np.array([1, 2]))
+    d(np.array([1, 2, 5, 6, 8]))  # 5, 6 accepted, 7 rejected (8 was sampled instead)
+    d(np.array([1, 2, 5, 6, 8, 9, 4]))  # 9 accepted, second 9 rejected
+    d(np.array([3]))  # new prompt: the previous draft was never checked
+    assert d.stats() == {
+        "calls": 4,
+        "drafted": 7,
+        "accepted": 3,
+        "rejected": 2,
+        "acceptance_rate": 0.6,
+    }
+
+
+class _FakeDraftCtx:
+    def __init__(self, vocab):
+        self.last = np.zeros(vocab, dtype=np.float32)
+
+    def get_logits_ith(self, i):
+        assert i == -1
+        return self.last.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+
+
+class _FakeDraftLlama:
+    """
+    Tiny 'model' that always predicts (last token + 1) % vocab; eos = 0. Like a ``Llama``
+    built without ``logits_all``, ``scores`` has ``n_batch`` rows and is never written;
+    only the context's last logits are.
+    """
+
+    def __init__(self, n_ctx=64, vocab=16, n_batch=8):
+        self._n_ctx = n_ctx
+        self.vocab = vocab
+        self.n_batch = n_batch
+        self.n_tokens = 0
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.scores = np.full((n_batch, vocab), np.nan, dtype=np.float32)
+        self._ctx = _FakeDraftCtx(vocab)
+        self.evaluated = []
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def n_vocab(self):
+        return self.vocab
+
+    def token_eos(self):
+        return 0
+
+    def eval(self, tokens):
+        self.evaluated.append(list(tokens))
+        for i in range(0, len(tokens), self.n_batch):
+            batch = tokens[i : i + self.n_batch]
+            self.input_ids[self.n_tokens : self.n_tokens + len(batch)] = batch
+            self.n_tokens += len(batch)
+            self._ctx.last[:] = 0
+            self._ctx.last[(batch[-1] + 1) % self.vocab] = 1
+
+
+def test_gguf_draft_model_reuses_prefix():
+    llm = _FakeDraftLlama()
+    d = GGUFDraftModel(llm, num_pred_tokens=3)
+    assert d(np.array([1, 2, 3])).tolist() == [4, 5, 6]
+    # continuing the same sequence only evaluates the new tokens
+    assert d(np.array([1, 2, 3, 4, 9])).tolist() == [10, 11, 12]
+    assert llm.evaluated[3] == [9]
+    # stops at eos
+    assert d(np.array([14])).tolist() == [15]
+    # no room left in the draft context
+    assert d(np.arange(1, 63)).tolist() == []
+
+
+def test_gguf_draft_model_drafts_after_prompts_longer_than_n_batch():
+    llm = _FakeDraftLlama(n_ctx=256, n_batch=8)
+    d = GGUFDraftModel(llm, num_pred_tokens=2)
+    prompt = np.arange(100) % 15 + 1
+    assert d(prompt).tolist() == [prompt[-1] + 1, prompt[-1] + 2]
+    assert d(np.concatenate([prompt, [3]])).tolist() == [4, 5]
+
+
+def test_gguf_draft_model_checks_vocab():
+    d = GGUFDraftModel(_FakeDraftLlama(vocab=16), 2)
+    d.check_vocab(_FakeDraftLlama(vocab=16))
+    with pytest.raises(RuntimeError):
+        d.check_vocab(_FakeDraftLlama(vocab=32))
+
+
+def test_config_validation(tmp_path):
+    assert not SpeculativeConfig("off").enabled
+    assert SpeculativeConfig("off").variant() == ""
+    with pytest.raises(ValueError):
+        SpeculativeConfig("medusa")
+    with pytest.raises(ValueError):
+        SpeculativeConfig("draft")
+    a = SpeculativeConfig("draft", str(tmp_path / "a.gguf"))
+    b = SpeculativeConfig("draft", str(tmp_path / "b.gguf"))
+    assert a.variant() != b.variant() != SpeculativeConfig("lookup").variant()
+
+
+@pytest.fixture
+def fake_llama_cpp(fake_llama_monkeypatch, monkeypatch):
+    mod = types.ModuleType("llama_cpp.llama_speculative")
+
+    class LlamaPromptLookupDecoding:
+        def __init__(self, max_ngram_size=2, num_pred_tokens=10):
+            self.num_pred_tokens = num_pred_tokens
+
+        def __call__(self, input_ids, /, **kwargs):
+            return np.array([], dtype=np.intc)
+
+    mod.LlamaPromptLookupDecoding = LlamaPromptLookupDecoding
+    monkeypatch.setitem(sys.modules, "llama_cpp.llama_speculative", mod)
+    yield fake_llama_monkeypatch
+    sys.modules.pop("core.llm_adapter", None)
+
+
+def test_runner_passes_draft_model_and_pools_per_variant(tmp_path, fake_llama_cpp):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner(pool=ModelPool(budget_bytes=10, estimator=lambda path, n_ctx: 1))
+
+    r.load(str(model), n_ctx=512)
+    plain = r._llm
+    assert "draft_model" not in plain.kwargs and "logits_all" not in plain.kwargs
+    assert r.speculative_stats() is None
+
+    r.load(str(model), n_ctx=512, speculative=SpeculativeConfig("lookup", draft_tokens=4))
+    assert r._llm is not plain
+    draft = r._llm.kwargs["draft_model"]
+    assert isinstance(draft, CountingDraftModel)
+    assert r._llm.kwargs["logits_all"] is True
+    assert draft.inner.num_pred_tokens == 4
+    assert r.speculative_stats()["calls"] == 0
+
+    r.load(str(model), n_ctx=512)
+    assert r._llm is plain
+
+
+def test_runner_rejects_mismatched_draft_vocab(tmp_path, fake_llama_cpp):
+    class _VocabFake(FakeLlama):
+        def n_vocab(self):
+            return 32 if "draft" in self.kwargs["model_path"] else 64
+
+    fake_llama_cpp.Llama = _VocabFake
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    draft = tmp_path / "draft.gguf"
+    draft.write_bytes(b"x")
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    with pytest.raises(RuntimeError, match="vocabulary"):
+        r.load(str(model), speculative=SpeculativeConfig("draft", str(draft)))
@@ -0,0 +1,59 @@
+import sys
+
+import pytest
+from conftest import fresh_runner_module
+
+from bench.imports import HEAVY_MODULES, cold_import_s, import_times, report
+
+# cold import of an entry point, interpreter startup excluded; generous for slow CI disks
+IMPORT_BUDGET_S = 0.5
+
+
+@pytest.fixture
+def tripwires(tmp_path, monkeypatch):
+    # heavy packages that fail loudly if anything imports them
+    for name in HEAVY_MODULES:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "__init__.py").write_text(f"raise ImportError('{name} imported')\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize("module", ["app", "batch", "server", "core.llm_adapter"])
+def test_entry_points_defer_heavy_imports(module, tripwires):
+    times = import_times(module)
+    assert not {t.module.split(".")[0] for t in times} & set(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize("module", ["app", "core.llm_adapter"])
+def test_cold_import_budget(module):
+    best = min(cold_import_s(import_times(module), module) for _ in range(3))
+    assert best < IMPORT_BUDGET_S, report(module)
+
+
+def test_is_available_does_not_import_llama(fake_llama_monkeypatch, tripwires, monkeypatch):
+    monkeypatch.syspath_prepend(str(tripwires))
+    m = fresh_runner_module()
+    monkeypatch.delitem(sys.modules, "llama_cpp")
+    assert m.LlamaRunner().is_available()
+    assert "llama_cpp" not in sys.modules
+
+
+def test_broken_native_library_fails_at_load(make_gguf, tmp_path, monkeypatch):
+    (tmp_path / "llama_cpp").mkdir()
+    (tmp_path / "llama_cpp" / "__init__.py").write_text("raise OSError('libllama.so: bad ELF')\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "llama_cpp", raising=False)
+    m = fresh_runner_module()
+    r = m.LlamaRunner()
+    assert r.is_available()
+    with pytest.raises(RuntimeError, match="llama-cpp-python unavailable: libllama.so"):
+        r.load(str(make_gguf()))
+    assert not r.is_loaded()
+
+
+def test_report_lists_slowest_modules():
+    text = report("core.llm_adapter", top=3)
+    assert text.startswith("import core.llm_adapter: ")
+    assert len(text.splitlines()) == 4
+    assert "failed" in report("no_such_module_xyz")
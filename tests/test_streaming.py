@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.streaming import TokenStream
+
+
+def _produce(stream: TokenStream, items, error=None, delay=0.0) -> threading.Thread:
+    def worker() -> None:
+        for it in items:
+            if stream.cancelled:
+                break
+            time.sleep(delay)
+            stream.put(it)
+        stream.close(error)
+
+    th = threading.Thread(target=worker)
+    th.start()
+    return th
+
+
+def test_stream_yields_until_end():
+    async def run() -> list[str]:
+        stream = TokenStream()
+        _produce(stream, ["a", "b", "c"], delay=0.01)
+        return [d async for d in stream]
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+
+
+def test_stream_propagates_errors_after_data():
+    async def run() -> list[str]:
+        stream = TokenStream()
+        _produce(stream, ["a"], error=ValueError("boom"))
+        got = []
+        with pytest.raises(ValueError, match="boom"):
+            async for d in stream:
+                got.append(d)
+        return got
+
+    assert asyncio.run(run()) == ["a"]
+
+
+def test_loop_sleeps_while_waiting():
+    # no polling: while the producer is silent the consumer is parked on one future
+    async def run() -> int:
+        stream = TokenStream()
+        wakeups = 0
+        real = stream._loop.create_future
+
+        def counting_future():
+            nonlocal wakeups
+            wakeups += 1
+            return real()
+
+        stream._loop.create_future = counting_future  # type: ignore[method-assign]
+        _produce(stream, ["a", "b"], delay=0.1)
+        async for _ in stream:
+            pass
+        return wakeups
+
+    assert asyncio.run(run()) <= 3
+
+
+def test_cancel_stops_producer_without_blocking():
+    async def run() -> TokenStream:
+        stream = TokenStream()
+        th = _produce(stream, ["x"] * 100, delay=0.01)
+        async for _ in stream:
+            stream.cancel()
+        th.join(timeout=1)
+        assert not th.is_alive()
+        return stream
+
+    assert asyncio.run(run()).done
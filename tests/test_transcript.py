@@ -0,0 +1,90 @@
+from ui.transcript import VirtualTranscript
+
+
+def _transcript(window=10, page_size=4) -> VirtualTranscript:
+    t = VirtualTranscript(lambda role, text: f"{role}: {text}", window=window, page_size=page_size)
+    scrolled: list[str] = []
+    t.view.update = lambda: None
+    t.view.scroll_to = lambda key=None, duration=None: scrolled.append(key)
+    t.scrolled = scrolled
+    return t
+
+
+def _live_texts(t: VirtualTranscript) -> list[str]:
+    return [c.value for c in t.controls]
+
+
+def test_append_keeps_a_bounded_window():
+    t = _transcript(window=10)
+    for i in range(1000):
+        t.append("user", f"m{i}")
+    assert len(t) == 1000
+    assert len(t.controls) == 10
+    assert (t.start, t.end) == (990, 1000)
+    assert _live_texts(t)[-1] == "user: m999"
+
+
+def test_scroll_up_rehydrates_older_and_trims_bottom():
+    t = _transcript(window=10, page_size=4)
+    for i in range(30):
+        t.append("user", f"m{i}")
+
+    t._on_scroll(type("E", (), {"pixels": 0, "min_scroll_extent": 0, "max_scroll_extent": 900}))
+    assert (t.start, t.end) == (16, 26)
+    assert _live_texts(t)[0] == "user: m16"
+    assert t.scrolled == ["20"]
+    assert not t.following and t.view.auto_scroll is False
+
+    # new messages while scrolled back only go to the backing store
+    sink = t.append("assistant", "late")
+    assert len(t.controls) == 10 and sink.index == 30
+
+    while t.load_newer():
+        pass
+    assert t.following
+    assert _live_texts(t)[-1] == "assistant: late"
+
+
+def test_streaming_sink_follows_window():
+    t = _transcript(window=4, page_size=2)
+    t.append("user", "hi")
+    sink = t.append("assistant", "")
+    sink.value += "Hel"
+    sink.value += "lo"
+    assert _live_texts(t)[-1] == "assistant: Hello"
+    for i in range(6):
+        t.append("user", f"m{i}")
+    # scrolled out of the window: text still lands in the backing store
+    sink.value += "!"
+    sink.update()
+    assert t.messages[1] == ("assistant", "Hello!")
+
+
+def test_prepend_restored_messages():
+    t = _transcript(window=5)
+    t.append("user", "new")
+    t.prepend([("user", f"old{i}") for i in range(8)])
+    assert len(t) == 9
+    assert _live_texts(t) == ["user: old4", "user: old5", "user: old6", "user: old7", "user: new"]
+    assert [c.key for c in t.controls] == ["4", "5", "6", "7", "8"]
+
+
+def test_fetch_older_pages_from_storage_and_keeps_sinks():
+    t = _transcript(window=5, page_size=3)
+    stored = [("user", f"old{i}") for i in range(7)]
+
+    def fetch(n):
+        page = stored[-n:]
+        del stored[-n:]
+        return page
+
+    t.fetch_older = fetch
+    sink = t.append("assistant", "")
+    t._on_scroll(type("E", (), {"pixels": 0, "min_scroll_extent": 0, "max_scroll_extent": 900}))
+    assert t.messages == [("user", "old4"), ("user", "old5"), ("user", "old6"), ("assistant", "")]
+    sink.value = "streamed"
+    assert t.messages[sink.index] == ("assistant", "streamed")
+    while t.load_older():
+        pass
+    assert len(t) == 8 and t.fetch_older is None
+    assert t.messages[0] == ("user", "old0") and t.messages[7] == ("assistant", "streamed")
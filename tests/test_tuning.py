@@ -0,0 +1,106 @@
+from conftest import fresh_runner_module
+
+from core.tuning import (
+    CPUInfo,
+    TuningParams,
+    calibrate,
+    cgroup_cpu_limit,
+    model_fingerprint,
+    physical_cores,
+    thread_candidates,
+)
+from storage.tuning import TuningStore
+
+
+def _topology(root, cpus):
+    # cpu id -> (package, core)
+    for cpu, (package, core) in cpus.items():
+        topo = root / f"cpu{cpu}" / "topology"
+        topo.mkdir(parents=True)
+        (topo / "physical_package_id").write_text(f"{package}\n")
+        (topo / "core_id").write_text(f"{core}\n")
+
+
+def test_physical_cores_counts_smt_siblings_once(tmp_path):
+    # 2 cores x 2 threads; cpus 0/2 and 1/3 are siblings
+    _topology(tmp_path, {0: (0, 0), 1: (0, 1), 2: (0, 0), 3: (0, 1)})
+    assert physical_cores([0, 1, 2, 3], tmp_path) == 2
+    assert physical_cores([0, 2], tmp_path) == 1  # affinity pinned to one core
+    assert physical_cores([0, 1], tmp_path / "missing") == 2
+
+
+def test_cgroup_cpu_limit(tmp_path):
+    assert cgroup_cpu_limit(tmp_path, group="") is None
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cgroup_cpu_limit(tmp_path, group="") is None
+    (tmp_path / "cpu.max").write_text("250000 100000\n")
+    assert cgroup_cpu_limit(tmp_path, group="") == 2.5
+    group = tmp_path / "app.slice"
+    group.mkdir()
+    (group / "cpu.max").write_text("100000 100000\n")
+    assert cgroup_cpu_limit(tmp_path, group="app.slice") == 1.0
+
+    v1 = tmp_path / "v1"
+    (v1 / "cpu").mkdir(parents=True)
+    (v1 / "cpu" / "cpu.cfs_quota_us").write_text("300000\n")
+    (v1 / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert cgroup_cpu_limit(v1, group="") == 3.0
+
+
+def test_usable_cpus_and_defaults():
+    cpu = CPUInfo(logical=16, allowed=16, physical=8, quota=4.5, model="x")
+    assert cpu.usable == 4
+    assert TuningParams.defaults(cpu) == TuningParams(4, 4, 512)
+    smt = CPUInfo(logical=16, allowed=16, physical=8, quota=None, model="x")
+    assert TuningParams.defaults(smt) == TuningParams(8, 16, 512)
+    assert cpu.signature() != smt.signature()
+    assert thread_candidates(smt) == [1, 2, 4, 8, 16]
+
+
+def test_calibrate_picks_fastest_with_few_trials():
+    cpu = CPUInfo(logical=8, allowed=8, physical=4, quota=None, model="x")
+
+    def measure(p: TuningParams) -> tuple[float, float]:
+        # decode peaks at the physical core count; prefill likes all threads and n_batch 256
+        decode = 100 - abs(p.n_threads - 4) * 10
+        prefill = p.n_threads_batch * 10 - abs(p.n_batch - 256) / 10
+        return prefill, decode
+
+    result = calibrate(measure, cpu, batch_sizes=(128, 256, 512))
+    assert result.params == TuningParams(4, 8, 256)
+    assert result.decode_tps == 100
+    assert len(result.trials) <= 2 * len(thread_candidates(cpu)) + 3
+
+
+def test_store_round_trip_and_runner_uses_it(fake_llama_monkeypatch, tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x" * 100)
+    store = TuningStore(tmp_path / "tuning.json")
+    cpu = CPUInfo.detect()
+    fp = model_fingerprint(model)
+
+    def measure(p):
+        return float(p.n_batch), float(p.n_threads)
+
+    store.put(fp, cpu.signature(), calibrate(measure, cpu, batch_sizes=(32, 64)))
+    reloaded = TuningStore(tmp_path / "tuning.json")
+    tuned = reloaded.get(fp, cpu.signature())
+    assert tuned is not None and tuned.n_batch == 64
+    assert reloaded.get(fp, "another-cpu") is None
+
+    m = fresh_runner_module()
+    r = m.LlamaRunner(tuning=reloaded)
+    r.load(str(model))
+    assert r._llm.kwargs["n_batch"] == 64
+    assert r._llm.kwargs["n_threads"] == tuned.n_threads
+    assert r.tuning_params == tuned
+
+
+def test_fingerprint_follows_content(tmp_path):
+    a = tmp_path / "a.gguf"
+    a.write_bytes(b"a" * 10)
+    b = tmp_path / "b.gguf"
+    b.write_bytes(b"a" * 10)
+    assert model_fingerprint(a) == model_fingerprint(b)
+    b.write_bytes(b"b" * 10)
+    assert model_fingerprint(a) != model_fingerprint(b)
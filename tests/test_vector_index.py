@@ -0,0 +1,112 @@
+import threading
+import time
+
+import numpy as np
+
+from storage.vector_index import MIN_CAPACITY, FileEntry, VectorIndex
+
+DIM = 16
+
+
+def _unit(rng, n):
+    v = rng.standard_normal((n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _entry(mtime=1, size=10):
+    return FileEntry(mtime, size, "digest", 0, 0)
+
+
+def test_put_search_and_reopen(tmp_path):
+    rng = np.random.default_rng(0)
+    index = VectorIndex(tmp_path, DIM, "emb")
+    a, b = _unit(rng, 3), _unit(rng, 2)
+    index.put("a.md", _entry(), a, ["a0", "a1", "a2"])
+    index.put("b.md", _entry(), b, ["b0", "b1 ünïcode"])
+
+    rows, scores = index.search(np.stack([a[1], b[1]]), k=2)
+    assert rows[:, 0].tolist() == [1, 4]
+    assert np.allclose(scores[:, 0], 1.0) and (scores[:, 0] >= scores[:, 1]).all()
+    assert index.texts(rows[:, 0]) == ["a1", "b1 ünïcode"]
+    assert index.paths([0, 4]) == ["a.md", "b.md"]
+    index.save()
+
+    reopened = VectorIndex(tmp_path, DIM, "emb")
+    assert reopened.files == index.files
+    assert reopened.search(b[1], k=1)[0].tolist() == [[4]]
+    # another embedding model's vectors are not comparable: start over
+    assert VectorIndex(tmp_path, DIM, "other").count == 0
+
+
+def test_replaced_rows_are_skipped_then_compacted(tmp_path):
+    rng = np.random.default_rng(1)
+    index = VectorIndex(tmp_path, DIM)
+    old = _unit(rng, 4)
+    index.put("a.md", _entry(), old, [f"old{i}" for i in range(4)])
+    index.put("b.md", _entry(), _unit(rng, 1), ["b"])
+    new = _unit(rng, 2)
+    index.put("a.md", _entry(mtime=2), new, ["new0", "new1"])
+    assert index.count == 7 and index.dead == 4
+
+    rows, _ = index.search(old, k=3)
+    assert set(index.texts(rows.ravel())) <= {"new0", "new1", "b"}
+    index.remove("b.md")
+    index.save()  # over half the rows are dead
+    assert index.count == 2 and index.dead == 0
+    assert VectorIndex(tmp_path, DIM).texts([0, 1]) == ["new0", "new1"]
+
+
+def test_grows_past_initial_capacity(tmp_path):
+    rng = np.random.default_rng(2)
+    index = VectorIndex(tmp_path, DIM)
+    vectors = _unit(rng, MIN_CAPACITY + 500)
+    for i in range(0, len(vectors), 100):
+        chunk = vectors[i : i + 100]
+        index.put(f"f{i}.md", _entry(), chunk, [str(i + j) for j in range(len(chunk))])
+    assert index.capacity >= len(vectors)
+    rows, _ = index.search(vectors[-1], k=1)
+    assert index.texts(rows[0]) == [str(len(vectors) - 1)]
+
+
+def test_top_k_is_vectorized(tmp_path):
+    rng = np.random.default_rng(3)
+    index = VectorIndex(tmp_path, 384)
+    vectors = rng.standard_normal((50_000, 384)).astype(np.float32)
+    index.put("big.txt", _entry(), vectors, [""] * len(vectors))
+    queries = vectors[[7, 42_000]]
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        rows, _ = index.search(queries, k=5)
+        best = min(best, time.perf_counter() - t0)
+    assert rows.shape == (2, 5)
+    assert best < 0.25, f"top-5 over 50k chunks took {best * 1000:.0f} ms"
+
+
+def test_nearest_stays_consistent_while_compacting(tmp_path):
+    rng = np.random.default_rng(4)
+    index = VectorIndex(tmp_path, DIM)
+    names = [f"f{i}.md" for i in range(8)]
+    for name in names:
+        index.put(name, _entry(), _unit(rng, 20), [f"{name}:{j}" for j in range(20)])
+    stop = threading.Event()
+
+    def rewrite() -> None:
+        r = np.random.default_rng(5)
+        while not stop.is_set():
+            for name in names:
+                index.put(name, _entry(), _unit(r, 20), [f"{name}:{j}" for j in range(20)])
+            index.compact()  # renumbers every row
+
+    writer = threading.Thread(target=rewrite)
+    writer.start()
+    try:
+        deadline = time.perf_counter() + 0.3
+        while time.perf_counter() < deadline:
+            for path, text, _score in index.nearest(_unit(rng, 2), k=5)[0]:
+                assert text.startswith(f"{path}:")
+    finally:
+        stop.set()
+        writer.join()
+    hits = index.nearest(_unit(rng, 1), k=3, min_score=2.0)
+    assert hits == [[]]
@@ -0,0 +1,193 @@
+import functools
+import os
+import threading
+import time
+
+import pytest
+
+from core.llm_adapter import LlamaRunner
+from core.worker import RemoteLlama, WorkerCrashedError, WorkerError
+
+
+class _ProcessFake:
+    """Picklable stand-in for ``Llama``: built in the worker, so it must be importable."""
+
+    def __init__(self, model_path: str, n_ctx: int, load_s: float = 0.0, fail: bool = False):
+        time.sleep(load_s)
+        if fail:
+            raise ValueError("bad model file")
+        self.model_path = model_path
+        self.pid = os.getpid()
+
+    def tokenize(self, text, add_bos=True, special=False):
+        return ([-1] if add_bos else []) + list(text)
+
+    def n_vocab(self) -> int:
+        return 256
+
+    def create_completion(self, *, prompt, stream, max_tokens, temperature, top_p, stop, **kw):
+        text = prompt if isinstance(prompt, str) else ""
+        if "crash" in text:
+            os._exit(3)  # like a segfault in native code
+        words = [f"{self.pid}", " tok"] + [" tok"] * (max_tokens - 2)
+        if not stream:
+            return {"choices": [{"text": "".join(words), "finish_reason": "length"}]}
+        return self._stream(words, 0.02 if "slow" in text else 0.0)
+
+    @staticmethod
+    def _stream(words, delay):
+        for i, w in enumerate(words):
+            time.sleep(delay)
+            reason = "length" if i == len(words) - 1 else None
+            yield {"choices": [{"text": w, "finish_reason": reason}]}
+
+
+class _Draft:
+    def stats(self) -> dict:
+        return {"drafted": 3, "accepted": 2}
+
+
+class _SpeculativeProcessFake(_ProcessFake):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.draft_model = _Draft()
+
+
+class _ProcessRunner(LlamaRunner):
+    def __init__(self, load_s: float = 0.0, **kw) -> None:
+        super().__init__(inference="process", **kw)
+        self.load_s = load_s
+
+    def is_available(self) -> bool:
+        return True
+
+    def _llama_factory(self, p, n_ctx, spec, params, memory):
+        return functools.partial(_ProcessFake, str(p), n_ctx, self.load_s)
+
+
+def _complete(llm, prompt: str, max_tokens: int = 4) -> list[str]:
+    chunks = llm.create_completion(
+        prompt=prompt, stream=True, max_tokens=max_tokens, temperature=0.0, top_p=1.0, stop=[]
+    )
+    return [c["choices"][0]["text"] for c in chunks]
+
+
+def test_remote_llama_streams_and_cancels():
+    llm = RemoteLlama(functools.partial(_ProcessFake, "m.gguf", 512))
+    try:
+        assert llm.pid != os.getpid()
+        assert llm.tokenize(b"ab") == [-1, 97, 98]
+        assert _complete(llm, "hi") == [str(llm.pid), " tok", " tok", " tok"]
+        # stop reading early: the worker is told to cancel and the pipe drained
+        for _ in llm.create_completion(
+            prompt="slow", stream=True, max_tokens=500, temperature=0, top_p=1, stop=[]
+        ):
+            break
+        assert llm.n_vocab() == 256
+        whole = llm.create_completion(
+            prompt="x", stream=False, max_tokens=3, temperature=0, top_p=1, stop=[]
+        )
+        assert whole["choices"][0]["finish_reason"] == "length"
+    finally:
+        llm.close()
+    assert not llm.is_alive()
+
+
+def test_worker_restarts_after_crash():
+    llm = RemoteLlama(functools.partial(_ProcessFake, "m.gguf", 512))
+    try:
+        first = llm.pid
+        with pytest.raises(WorkerCrashedError):
+            _complete(llm, "crash")
+        # the next request starts a fresh worker
+        assert _complete(llm, "hi")[0] != str(first)
+        assert llm.restarts == 1
+    finally:
+        llm.close()
+
+
+def test_load_error_is_reported():
+    with pytest.raises(WorkerError, match="bad model file"):
+        RemoteLlama(functools.partial(_ProcessFake, "m.gguf", 512, 0.0, True))
+
+
+def test_runner_in_process_mode(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    r = _ProcessRunner()
+    r.load(str(model))
+    try:
+        reply = r.chat("", "Hi?", max_tokens=3)
+        assert reply.startswith(str(r._llm.pid)) and reply.endswith(" tok tok")
+        assert r.metrics.last.stop_reason == "length"
+        with pytest.raises(RuntimeError, match="thread"):
+            r.batch_engine(2)
+    finally:
+        r._llm.close()
+
+
+def test_abort_load(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    r = _ProcessRunner(load_s=30)
+    assert not r.abort_load()
+    errors = []
+
+    def load():
+        try:
+            r.load(str(model))
+        except WorkerError as e:
+            errors.append(e)
+
+    th = threading.Thread(target=load)
+    th.start()
+    deadline = time.monotonic() + 10
+    while not r.abort_load() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    th.join(timeout=10)
+    assert errors and not r.is_loaded()
+
+
+def test_kill_before_start_aborts_only_that_start():
+    llm = RemoteLlama(functools.partial(_ProcessFake, "m.gguf", 512), start=False)
+    llm.kill()
+    with pytest.raises(WorkerError, match="exited while loading"):
+        llm.start()
+    llm.start()  # the kill was used up; this one loads
+    try:
+        assert llm.n_vocab() == 256
+    finally:
+        llm.close()
+
+
+def test_speculative_stats_come_from_the_worker(tmp_path):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"x")
+    r = _ProcessRunner()
+    r.load(str(model))
+    try:
+        assert r.speculative_stats() is None
+    finally:
+        r._llm.close()
+    llm = RemoteLlama(functools.partial(_SpeculativeProcessFake, "m.gguf", 512))
+    try:
+        assert llm.speculative_stats() == {"drafted": 3, "accepted": 2}
+    finally:
+        llm.close()
+
+
+def test_abort_while_reading_the_model_file(tmp_path):
+    model = tmp_path / "m.gguf"
+    with open(model, "wb") as f:
+        f.truncate(40 << 20)  # a few prefetch chunks
+    r = _ProcessRunner()
+    fractions = []
+
+    def progress(frac):
+        fractions.append(frac)
+        assert r.abort_load()
+
+    with pytest.raises(WorkerError, match="aborted"):
+        r.load(str(model), progress=progress)
+    assert len(fractions) == 1 and not r.is_loaded()
+    assert not r.abort_load()  # nothing left to abort